@@ -0,0 +1,107 @@
+import time
+
+from flask import request, jsonify, Response, stream_with_context
+
+from db.export import (
+    iterMeasurementBatches,
+    iterPayloadBatches,
+    MEASUREMENT_COLUMNS,
+    MEASUREMENT_TYPED_COLUMNS,
+    PAYLOAD_COLUMNS,
+)
+from utilities.export import exportRows, EXPORT_MIMETYPES
+
+from gui import login_required
+
+
+def _timeArg(name):
+    value = request.args.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        return int(float(value))
+    except ValueError:
+        raise ValueError(f"{name} must be seconds since epoch")
+
+def _download(pieces, export_format, name):
+    filename = f"{name}_{time.strftime('%Y%m%d_%H%M%S')}.{export_format}"
+    return Response(
+        stream_with_context(pieces),
+        mimetype=EXPORT_MIMETYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+def register(app):
+    """
+    API Endpoints:
+        GET /api/get/export/measurements
+        GET /api/get/export/payloads
+
+    Description:
+        Streams stored data as a file download, read in chunks from a read-only
+        connection so large exports need constant memory and never block the writers.
+        Measurements come partition by partition (oldest first), inside a partition by
+        device/key and time. Payloads come by topic and time.
+        scripts/export.py writes the same files from the command line.
+
+    Query Parameters:
+        device_id=<string>      repeatable, optional, default all devices
+        key=<string>            measurements, repeatable, optional, default all keys
+        topic=<string>          payloads, repeatable, optional, default all topics
+        from=<seconds>          optional, inclusive
+        to=<seconds>            optional, inclusive
+        format=csv|ndjson|parquet   optional, default csv, parquet needs pyarrow
+
+    Successful Response (HTTP 200):
+        The file, measurements with the columns
+            device_id, key, ts_sec, ts_nsec, value, report_id
+        (parquet: value is a float column, text values go to an extra value_text column),
+        payloads with the columns
+            device_id, topic_name, ts_sec, ts_nsec, payload, valid_until_sec, valid_until_nsec
+        a payload row stands for the same payload received from ts until valid_until
+
+    Error Cases:
+        - 400: unknown format, parquet without pyarrow or an invalid time
+    """
+
+    @app.route("/api/get/export/measurements", methods=["GET"])
+    @login_required
+    def export_measurements():
+        export_format = request.args.get("format", "csv")
+        try:
+            ts_from = _timeArg("from")
+            ts_to = _timeArg("to")
+            typed = export_format == "parquet"
+            pieces = exportRows(
+                MEASUREMENT_TYPED_COLUMNS if typed else MEASUREMENT_COLUMNS,
+                iterMeasurementBatches(
+                    request.args.getlist("device_id"),
+                    request.args.getlist("key"),
+                    ts_from,
+                    ts_to,
+                    typed=typed,
+                ),
+                export_format,
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return _download(pieces, export_format, "measurements")
+
+    @app.route("/api/get/export/payloads", methods=["GET"])
+    @login_required
+    def export_payloads():
+        export_format = request.args.get("format", "csv")
+        try:
+            pieces = exportRows(
+                PAYLOAD_COLUMNS,
+                iterPayloadBatches(
+                    request.args.getlist("device_id"),
+                    request.args.getlist("topic"),
+                    _timeArg("from"),
+                    _timeArg("to"),
+                ),
+                export_format,
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return _download(pieces, export_format, "payloads")
@@ -3,7 +3,7 @@ import json
 
 from utilities.cache import hasMqttBrokerRunning
 from mqtt.client import publishSet
-from db.mqtt import addTopicPayload
+from db.mqtt import addTopicPayload, getLatestStates
 
 from gui import login_required
 
@@ -41,3 +41,36 @@ def register(app):
 
         except Exception as e:
             return jsonify({"error": str(e)}), 500
+
+    @app.route("/api/get/mqtt/latest", methods=["GET"])
+    @login_required
+    def latest_mqtt_states():
+        """
+        API Endpoint:
+            GET /api/get/mqtt/latest
+
+        Description:
+            Returns every MQTT topic of every device (or of the given devices) with
+            its latest state payload in one call, served from the in-memory
+            latest-payload cache (see LatestPayloads in db/mqtt.py).
+
+        Query Parameters:
+            device_id=<string>      repeatable, optional, default all devices
+
+        Successful Response (HTTP 200):
+            {
+                "<device_id>": {
+                    "<topic_name>": {
+                        "topic_id": <int>,
+                        "has_set": <bool>,
+                        "has_state": <bool>,
+                        "time_seconds": <int> or null,
+                        "time_nanoseconds": <int> or null,
+                        "payload": <decoded JSON> or null
+                    },
+                    ...
+                },
+                ...
+            }
+        """
+        return jsonify(getLatestStates(request.args.getlist("device_id"))), 200
@@ -3,14 +3,22 @@ from db.devices import deviceExists, updateLastSeen
 from utilities.time import Timestamp, getTimeStamp
 from db.device_data import insertMeasurements
 
+# Upper limit of samples accepted by one /api/reportValues/batch call.
+MAX_BATCH_SAMPLES = 10000
+
 def handleReportValues(
     *,
     device_id: str,
     key_values: dict,
     ts_sec: int | None = None,
     ts_nsec: int | None = None,
-    report_id: str = ""
+    report_id: str = "",
+    wait: bool = True
 ):
+    """
+    wait=True returns after the values are committed to the database.
+    wait=False returns as soon as they are queued for the writer.
+    """
     if not device_id or not deviceExists(device_id):
         raise ValueError("invalid device_id")
 
@@ -19,6 +27,9 @@ def handleReportValues(
 
     updateLastSeen(device_id)
 
+    insertMeasurements(buildRows(device_id, key_values, ts_sec, ts_nsec, report_id), wait=wait)
+
+def buildRows(device_id, key_values, ts_sec, ts_nsec, report_id):
     if ts_sec is None:
         ts = getTimeStamp()
         ts_sec = ts.seconds
@@ -26,12 +37,65 @@ def handleReportValues(
     else:
         ts_nsec = ts_nsec or 0
 
-    rows = [
+    return [
         (device_id, ts_sec, ts_nsec, key, value, report_id)
         for key, value in key_values.items()
     ]
 
-    insertMeasurements(rows)
+def handleReportValuesBatch(
+    *,
+    device_id: str | None = None,
+    samples: list | None = None,
+    devices: list | None = None,
+    wait: bool = True
+):
+    """
+    Stores many samples of one device (device_id + samples) or of several
+    devices (devices = [{"device_id": ..., "samples": [...]}, ...]).
+    Every device is validated once and all rows are written in one transaction.
+    Nothing is stored if any device or sample is invalid.
+    Returns the number of stored samples.
+    """
+    if devices is None:
+        devices = [{"device_id": device_id, "samples": samples}]
+    elif samples is not None:
+        raise ValueError("use either samples or devices")
+
+    if not isinstance(devices, list) or not devices:
+        raise ValueError("no devices")
+
+    rows = []
+    sample_count = 0
+    device_ids = set()
+    for entry in devices:
+        if not isinstance(entry, dict):
+            raise ValueError("invalid devices entry")
+        entry_device_id = entry.get("device_id")
+        if entry_device_id not in device_ids:
+            if not entry_device_id or not deviceExists(entry_device_id):
+                raise ValueError(f"invalid device_id {entry_device_id}")
+            device_ids.add(entry_device_id)
+
+        entry_samples = entry.get("samples")
+        if not isinstance(entry_samples, list) or not entry_samples:
+            raise ValueError(f"no samples for device {entry_device_id}")
+
+        for sample in entry_samples:
+            if not isinstance(sample, dict):
+                raise ValueError("invalid sample")
+            key_values = sample.get("keyValues")
+            if not isinstance(key_values, dict) or not key_values:
+                raise ValueError("no keyValues")
+            rows.extend(buildRows(entry_device_id, key_values, sample.get("s"), sample.get("ns"), sample.get("report_id")))
+        sample_count += len(entry_samples)
+        if sample_count > MAX_BATCH_SAMPLES:
+            raise ValueError(f"too many samples, at most {MAX_BATCH_SAMPLES} per request")
+
+    for entry_device_id in device_ids:
+        updateLastSeen(entry_device_id)
+
+    insertMeasurements(rows, wait=wait)
+    return sample_count
 
 def register(app):
 
@@ -49,7 +113,8 @@ def register(app):
             "keyValues": {"key1": value1, ...},
             "s": <int>,         # optional, seconds since epoch
             "ns": <int>,        # optional, nanoseconds
-            "report_id": "<string>"  # optional
+            "report_id": "<string>", # optional
+            "wait": <bool>      # optional, default true. false answers before the values are written to disk
         }
 
     Example Input:
@@ -73,10 +138,16 @@ def register(app):
             "error": "no keyValues"
         }
 
+    Error Response (HTTP 503):
+        {
+            "error": "database writer queue is full, try again later"
+        }
+
     Error Cases:
         - Missing "device_id" in the request JSON.
         - "device_id" does not exist in the system.
         - Missing or invalid "keyValues" in the request JSON.
+        - The server is overloaded and can not queue more values.
     """
 
     @app.route("/api/reportValues", methods=["POST"])
@@ -89,12 +160,104 @@ def register(app):
                 key_values=data.get("keyValues"),
                 ts_sec=data.get("s"),
                 ts_nsec=data.get("ns"),
-                report_id=data.get("report_id")
+                report_id=data.get("report_id"),
+                wait=data.get("wait", True) is not False
             )
         except ValueError as e:
             msg = str(e)
             status = 403 if "device_id" in msg else 400
             return jsonify({"error": msg}), status
+        except RuntimeError as e:
+            return jsonify({"error": str(e)}), 503
 
         return jsonify({"status": "ok"}), 200
 
+    """
+    API Endpoint:
+        POST /api/reportValues/batch
+
+    Description:
+        Stores many samples in one request, e.g. readings a device buffered while offline or a gateway
+        reporting for several devices. Each sample has the same fields as a /api/reportValues call.
+        All devices are validated before anything is stored and all samples are written in one transaction.
+        Either "device_id" + "samples" or "devices" has to be given.
+
+    Request JSON:
+        {
+            "device_id": "<string>",
+            "samples": [
+                {
+                    "keyValues": {"key1": value1, ...},
+                    "s": <int>,         # optional, seconds since epoch
+                    "ns": <int>,        # optional, nanoseconds
+                    "report_id": "<string>"  # optional
+                },
+                ...
+            ],
+            "wait": <bool>      # optional, default true. false answers before the values are written to disk
+        }
+
+    Gateway Request JSON:
+        {
+            "devices": [
+                {"device_id": "<string>", "samples": [...]},
+                ...
+            ]
+        }
+
+    Example Input:
+        {
+            "device_id": "device123",
+            "samples": [
+                {"s": 1717689600, "ns": 0, "keyValues": {"temperature": 22.5}},
+                {"s": 1717689600, "ns": 100000000, "keyValues": {"temperature": 22.6}}
+            ]
+        }
+
+    Successful Response (HTTP 200):
+        {
+            "status": "ok",
+            "samples": <int>    # number of stored samples
+        }
+
+    Error Response (HTTP 403):
+        {
+            "error": "invalid device_id <device_id>"
+        }
+
+    Error Response (HTTP 400):
+        {
+            "error": "no keyValues"
+        }
+
+    Error Response (HTTP 503):
+        {
+            "error": "database writer queue is full, try again later"
+        }
+
+    Error Cases:
+        - A "device_id" is missing or does not exist in the system.
+        - Missing samples or a sample without valid "keyValues".
+        - More than 10000 samples in one request.
+        - The server is overloaded and can not queue more values.
+    """
+
+    @app.route("/api/reportValues/batch", methods=["POST"])
+    def reportValuesBatch():
+        data = request.get_json(force=True)
+
+        try:
+            count = handleReportValuesBatch(
+                device_id=data.get("device_id"),
+                samples=data.get("samples"),
+                devices=data.get("devices"),
+                wait=data.get("wait", True) is not False
+            )
+        except ValueError as e:
+            msg = str(e)
+            status = 403 if "device_id" in msg else 400
+            return jsonify({"error": msg}), status
+        except RuntimeError as e:
+            return jsonify({"error": str(e)}), 503
+
+        return jsonify({"status": "ok", "samples": count}), 200
@@ -0,0 +1,104 @@
+from flask import request, jsonify
+
+import db.device_data as device_data_db
+import db.mqtt as mqtt_db
+from db.user import isCurrentUserInGroup
+
+from gui import login_required
+
+
+def handleRetentionPolicy(data: dict):
+    policy_type = data.get("type")
+    device_id = data.get("device_id", "*")
+    remove = bool(data.get("remove", False))
+
+    if policy_type == "measurements":
+        key = data.get("key", "*")
+        if remove:
+            device_data_db.removeRetentionPolicy(device_id, key)
+        else:
+            device_data_db.setRetentionPolicy(device_id, key, data.get("raw_days", 0))
+    elif policy_type == "payloads":
+        topic_name = data.get("topic_name", "*")
+        if remove:
+            mqtt_db.removePayloadRetention(device_id, topic_name)
+        else:
+            mqtt_db.setPayloadRetention(device_id, topic_name, data.get("max_rows", 0), data.get("max_days", 0))
+    else:
+        raise ValueError("type must be 'measurements' or 'payloads'")
+
+def register(app):
+    """
+    API Endpoints:
+        GET /api/get/retention
+        POST /api/post/retention
+
+    Description:
+        Retention policies decide how long data is kept. A background purger applies them
+        every hour in small chunks (see db/retention.py).
+        "*" as device_id, key or topic_name matches everything, the most specific policy wins:
+        (device, key), (device, "*"), ("*", key), ("*", "*"), then the defaults.
+        Measurements: raw rows older than raw_days days are deleted, the per-minute/hour/day
+        rollups stay so charts of old time ranges keep working. 0 keeps raw rows forever.
+        Payloads: at most max_rows MQTT payloads not older than max_days days are kept per topic.
+        0 disables the limit.
+
+    Successful GET Response (HTTP 200):
+        {
+            "measurements": [{"device_id": "<string>", "key": "<string>", "raw_days": <int>}, ...],
+            "payloads": [{"device_id": "<string>", "topic_name": "<string>", "max_rows": <int>, "max_days": <int>}, ...],
+            "defaults": {"raw_days": <int>, "rollup_days": {"<resolution>": <int>, ...}, "max_rows": <int>, "max_days": <int>}
+        }
+
+    Request JSON: /api/post/retention (admin only)
+        {
+            "type": "measurements" | "payloads",
+            "device_id": "<string>",        # optional, default "*"
+            "key": "<string>",              # measurements, optional, default "*"
+            "raw_days": <int>,              # measurements
+            "topic_name": "<string>",       # payloads, optional, default "*"
+            "max_rows": <int>,              # payloads
+            "max_days": <int>,              # payloads
+            "remove": <bool>                # optional, deletes the policy instead
+        }
+
+    Successful POST Response (HTTP 200):
+        {
+            "status": "ok"
+        }
+
+    Error Cases:
+        - 400: invalid type or a limit that is not an integer >= 0
+        - 403: user is not in the admin group
+    """
+
+    @app.route("/api/get/retention", methods=["GET"])
+    @login_required
+    def get_retention():
+        return jsonify({
+            "measurements": device_data_db.getRetentionPolicies(),
+            "payloads": mqtt_db.getPayloadRetention(),
+            "defaults": {
+                "raw_days": device_data_db.RAW_RETENTION_DAYS,
+                "rollup_days": device_data_db.ROLLUP_RETENTION_DAYS,
+                "max_rows": mqtt_db.PAYLOAD_MAX_ROWS,
+                "max_days": mqtt_db.PAYLOAD_MAX_DAYS,
+            },
+        })
+
+    @app.route("/api/post/retention", methods=["POST"])
+    @login_required
+    def post_retention():
+        if not isCurrentUserInGroup("admin"):
+            return jsonify({"error": "admin rights required"}), 403
+
+        data = request.get_json(force=True, silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"error": "Invalid JSON"}), 400
+
+        try:
+            handleRetentionPolicy(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        return jsonify({"status": "ok"}), 200
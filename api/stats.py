@@ -0,0 +1,54 @@
+from flask import jsonify
+
+from db.devices import getDeviceRegistryStats, getHeartbeatStats
+from db.pool import getPoolStats
+from db.retention import getRetentionStats
+from db.shared import getSharedStateStats
+from db.writer import getWriterStats
+from mqtt.client import getMqttStats
+from utilities.leader import getLeaderStats
+
+from gui import login_required
+
+
+def register(app):
+    """
+    API Endpoint:
+        GET /api/get/stats
+
+    Description:
+        Returns counters of the in-memory caches and database helpers of this server process,
+        e.g. to confirm that the device registry answers lookups without touching the database.
+        With several workers (gunicorn) the counters are those of the worker that answered,
+        "process" tells which one and whether it runs the MQTT client and the retention purger.
+
+    Successful Response (HTTP 200):
+        {
+            "process": {"pid": <int>, "leader": <bool>, "elected_at": <int> or null},
+            "shared_state": {"running": <bool>, "checks": <int>, "invalidations": <int>, "generations": {"<cache>": <int>, ...}},
+            "device_registry": {"devices": <int>, "hits": <int>, "misses": <int>, "loads": <int>},
+            "last_seen": {"pending": <int>, "recorded": <int>, "flushes": <int>, "written": <int>},
+            "db_pools": [{"db": "<file>", "opened": <int>, "reused": <int>, "idle": <int>}, ...],
+            "db_writers": [{"db": "<file>", "queued": <int>, "max_queue": <int>, "commits": <int>, "rows_written": <int>, "failed": <int>, "rejected": <int>}, ...],
+            "retention": {"running": <bool>, "runs": <int>, "errors": <int>, "last_run": <int> or null, "last_duration": <float> or null,
+                          "raw_deleted": <int>, "rollups_deleted": <int>, "partitions_dropped": <int>, "payloads_deleted": <int>},
+            "mqtt": {"connected": <bool>, "dispatcher": {"running": <bool>, "workers": <int>, "queued": [<int> per worker], "max_queue": <int>,
+                     "max_depth": <int>, "submitted": <int>, "handled": <int>, "dropped": <int>, "errors": <int>},
+                     "routes": {"topics": <int>, "unknown": <int>, "hits": <int>, "misses": <int>, "negative_hits": <int>, "loads": <int>},
+                     "latest_payloads": {"topics": <int>, "max_id": <int>, "loads": <int>, "updates": <int>, "catch_ups": <int>}}
+        }
+    """
+
+    @app.route("/api/get/stats", methods=["GET"])
+    @login_required
+    def stats():
+        return jsonify({
+            "process": getLeaderStats(),
+            "shared_state": getSharedStateStats(),
+            "device_registry": getDeviceRegistryStats(),
+            "last_seen": getHeartbeatStats(),
+            "db_pools": getPoolStats(),
+            "db_writers": getWriterStats(),
+            "retention": getRetentionStats(),
+            "mqtt": getMqttStats(),
+        })
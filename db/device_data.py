@@ -1,63 +1,1092 @@
+import calendar
+import itertools
+import operator
+import re
 import sqlite3
+import threading
+import time
 from pathlib import Path
-from typing import Any, Iterable, Optional, Tuple
+from typing import Any, Callable, Iterable, Optional, Tuple
 
 from utilities.time import Timestamp, getTimeStamp
+from utilities.align import alignSeries
 from db.helper import printDbInfo, enableWalMode
+from db.pool import ConnectionPool
+from db.shared import bumpGeneration, onGenerationChange
+from db.writer import BatchWriter
 
 
 DB_FILE = Path(__file__).parent / "device_data.db"
 SCHEMA_FILE = Path(__file__).parent / "schema_device_data.sql"
 
+# Seconds insertMeasurements(wait=True) waits for the commit.
+WRITE_TIMEOUT = 10.0
+# Flush policy of the measurement writer: commit after this many rows or after
+# the first queued report waited this many seconds.
+WRITE_BATCH_ROWS = 5000
+WRITE_BATCH_DELAY = 0.005
+# Reports that may wait for the writer before new ones are rejected.
+WRITE_QUEUE_SIZE = 1000
+# Calendar months (UTC) stored in one measurement partition table.
+# Only affects partitions created after a change.
+PARTITION_MONTHS = 1
+
+# Bucket widths in seconds of the rollup tables, finest first.
+ROLLUP_RESOLUTIONS = (60, 3600, 86400)
+
+# Days raw measurements are kept when no retention policy matches, 0 keeps them forever.
+RAW_RETENTION_DAYS = 0
+# Days the rollups of each resolution are kept, 0 keeps them forever.
+ROLLUP_RETENTION_DAYS = {60: 0, 3600: 0, 86400: 0}
+
+# Rows fetched from SQLite per step when results are iterated (iter* functions).
+STREAM_FETCH_ROWS = 1000
+
+# Rows per bulk import transaction (importMeasurements). Large enough to amortize
+# the commit, small enough that the writer of a running server never times out.
+IMPORT_BATCH_ROWS = 50000
+# PRAGMAs of the bulk import connection: a 256 MiB page cache and in-memory temp
+# tables, the rest of the database settings stay untouched.
+IMPORT_PRAGMAS = ("cache_size = -262144", "temp_store = MEMORY")
+
+# Catalog columns of the series table, added to older databases by migrateToSeriesCatalog().
+SERIES_CATALOG_COLUMNS = (
+    ("row_count", "INTEGER NOT NULL DEFAULT 0"),
+    ("first_sec", "INTEGER"),
+    ("first_nsec", "INTEGER"),
+    ("last_sec", "INTEGER"),
+    ("last_nsec", "INTEGER"),
+    ("value_type", "TEXT"),
+    ("min_value", "REAL"),
+    ("max_value", "REAL"),
+)
+
+# Cache generation (see db/shared.py) of the partitions, series ids and retention policies.
+MEASUREMENTS_GENERATION = "measurements"
+
+PARTITION_PREFIX = "measurements_"
+PARTITION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    series_id   INTEGER NOT NULL,
+    ts_sec      INTEGER NOT NULL,
+    ts_nsec     INTEGER NOT NULL,
+
+    value_num   REAL,
+    value_int   INTEGER,
+    value_text  TEXT,
+    value_bool  INTEGER,
+
+    report_id   TEXT,
+
+    PRIMARY KEY (series_id, ts_sec, ts_nsec)
+) WITHOUT ROWID;
+"""
+# Rows of one report without scanning the partition. Most rows have no report id,
+# so the index only holds the ones that do. Queries have to repeat the
+# report_id != '' condition for SQLite to use it.
+PARTITION_INDEX = """
+CREATE INDEX IF NOT EXISTS idx_{table}_report ON {table} (report_id, series_id, ts_sec, ts_nsec)
+WHERE report_id IS NOT NULL AND report_id != ''
+"""
+# A row's value as REAL for the numeric readers, which skip text rows with
+# "value_text IS NULL" since a text cast to REAL would read as 0.
+NUMERIC_VALUE = "CAST(COALESCE(value_num, value_int, value_bool) AS REAL)"
+
+_POOL = ConnectionPool(DB_FILE)
+
 def getDB():
-    return sqlite3.connect(DB_FILE)
+    return _POOL.connection()
 
 def initDB():
     with getDB() as con:
+        migrateToSeriesIds(con)
         con.executescript(SCHEMA_FILE.read_text())
-        printDbInfo(DB_FILE, con, SCHEMA_FILE)  
-        enableWalMode(con)      
+        migrateToPartitions(con)
+        printDbInfo(DB_FILE, con, SCHEMA_FILE, dynamic_table_prefixes=[PARTITION_PREFIX])
+        enableWalMode(con)
+    _loadPartitions()
+    with getDB() as con:
+        migrateToRollups(con)
+        migrateToSeriesCatalog(con)
+        migrateToReportCatalog(con)
+        migrateToSeriesAutoincrement(con)
+        createPartitionIndexes(con)
 
-def insertMeasurement(
-    device_id: str,
-    ts_sec: int,
-    ts_nsec: int,
-    key: str,
-    value: Any,
-    report_id: Optional[str] = None,
-):
-    value_num = value_int = value_text = value_bool = None
-
-    if isinstance(value, bool):
-        value_bool = int(value)
-    elif isinstance(value, int):
-        value_int = value
-    elif isinstance(value, float):
-        value_num = value
-    else:
-        value_text = str(value)
+def migrateToSeriesIds(con):
+    """
+    Databases created before the series table stored device_id and key in
+    every measurement row. Moves them to the series layout in one transaction.
+    """
+    columns = [row[1] for row in con.execute("PRAGMA table_info(measurements)")]
+    if "device_id" not in columns:
+        return
+    print("Migrating measurements to series ids, this may take a while...")
+    con.executescript(
+        "BEGIN;"
+        "ALTER TABLE measurements RENAME TO measurements_old;"
+        "DROP INDEX IF EXISTS idx_measurements_device_time;"
+        + SCHEMA_FILE.read_text()
+        + PARTITION_SCHEMA.format(table="measurements") +
+        """
+        INSERT INTO series (device_id, key)
+        SELECT DISTINCT device_id, key FROM measurements_old;
+
+        INSERT INTO measurements
+        (series_id, ts_sec, ts_nsec,
+         value_num, value_int, value_text, value_bool,
+         report_id)
+        SELECT s.id, m.ts_sec, m.ts_nsec,
+               m.value_num, m.value_int, m.value_text, m.value_bool,
+               m.report_id
+        FROM measurements_old m
+        JOIN series s ON s.device_id = m.device_id AND s.key = m.key;
+
+        DROP TABLE measurements_old;
+        COMMIT;
+        """
+    )
+    print("Migration to series ids done.")
+
+def migrateToPartitions(con):
+    """
+    Databases created before partitioning kept all rows in one measurements
+    table. Moves them into partition tables in one transaction.
+    """
+    exists = con.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'measurements'"
+    ).fetchone()
+    if not exists:
+        return
+    print("Migrating measurements to time partitions, this may take a while...")
+    months = con.execute(
+        "SELECT DISTINCT CAST(strftime('%s', ts_sec, 'unixepoch', 'start of month') AS INTEGER) FROM measurements ORDER BY 1"
+    ).fetchall()
+    con.execute("BEGIN")
+    try:
+        for (month_start,) in months:
+            if _findPartition(month_start):
+                continue
+            name, start, end = _partitionBounds(month_start)
+            _createPartition(con, name, start, end)
+            _PARTITIONS[name] = (start, end)
+            con.execute(
+                f"INSERT INTO {name} SELECT * FROM measurements WHERE ts_sec >= ? AND ts_sec < ?",
+                (start, end),
+            )
+        con.execute("DROP TABLE measurements")
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    print("Migration to time partitions done.")
+
+def migrateToRollups(con):
+    """Fills the rollup table from the raw data once (tracked via PRAGMA user_version)."""
+    if con.execute("PRAGMA user_version").fetchone()[0] >= 1:
+        return
+    print("Building rollups from existing measurements, this may take a while...")
+    con.execute("DELETE FROM rollups")
+    for name in _partitionsFor():
+        for series_id in [row[0] for row in con.execute("SELECT DISTINCT series_id FROM " + name)]:
+            _rebuildRollups(con, series_id, [name])
+    con.execute("PRAGMA user_version = 1")
+    print("Rollups done.")
+
+def migrateToSeriesCatalog(con):
+    """Adds the catalog columns to the series table and fills them once (PRAGMA user_version 2)."""
+    if con.execute("PRAGMA user_version").fetchone()[0] >= 2:
+        return
+    print("Building the series catalog, this may take a while...")
+    columns = [row[1] for row in con.execute("PRAGMA table_info(series)")]
+    for column, definition in SERIES_CATALOG_COLUMNS:
+        if column not in columns:
+            con.execute(f"ALTER TABLE series ADD COLUMN {column} {definition}")
+    for (series_id,) in con.execute("SELECT id FROM series").fetchall():
+        _rebuildSeriesCatalog(con, series_id)
+    con.execute("PRAGMA user_version = 2")
+    print("Series catalog done.")
+
+def migrateToReportCatalog(con):
+    """Indexes the report ids of existing partitions and fills the report catalog once (PRAGMA user_version 3)."""
+    if con.execute("PRAGMA user_version").fetchone()[0] >= 3:
+        return
+    print("Building the report catalog, this may take a while...")
+    con.execute("DELETE FROM report_series")
+    for name in _partitionsFor():
+        con.execute(PARTITION_INDEX.format(table=name))
+        con.executemany(
+            REPORT_SERIES_UPSERT,
+            [
+                (report_id, series_id, count, *divmod(first, NS), *divmod(last, NS))
+                for report_id, series_id, count, first, last in con.execute(
+                    f"""
+                    SELECT report_id, series_id, COUNT(*), MIN({TS_NS}), MAX({TS_NS})
+                    FROM {name}
+                    WHERE report_id IS NOT NULL AND report_id != ''
+                    GROUP BY report_id, series_id
+                    """
+                ).fetchall()
+            ],
+        )
+    con.execute("DELETE FROM reports")
+    con.execute(
+        f"""
+        INSERT INTO reports (report_id, row_count, first_sec, first_nsec, last_sec, last_nsec)
+        SELECT report_id, SUM(row_count),
+               MIN({FIRST_NS}) / {NS}, MIN({FIRST_NS}) % {NS},
+               MAX({LAST_NS}) / {NS}, MAX({LAST_NS}) % {NS}
+        FROM report_series
+        GROUP BY report_id
+        """
+    )
+    con.execute("PRAGMA user_version = 3")
+    print("Report catalog done.")
+
+def migrateToSeriesAutoincrement(con):
+    """
+    Rebuilds the series table with AUTOINCREMENT once (PRAGMA user_version 4), so
+    the id of a removed series is never given to a new one. The sequence starts
+    above every series id still found in the data.
+    """
+    if con.execute("PRAGMA user_version").fetchone()[0] >= 4:
+        return
+    con.commit()
+    con.execute("BEGIN")
+    try:
+        table_sql = con.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'series'").fetchone()[0]
+        if "AUTOINCREMENT" not in table_sql.upper():
+            create = re.search(r"CREATE TABLE IF NOT EXISTS series \(.*?\n\);", SCHEMA_FILE.read_text(), re.S).group(0)
+            columns = ", ".join(row[1] for row in con.execute("PRAGMA table_info(series)"))
+            con.execute(create.replace("EXISTS series (", "EXISTS series_new ("))
+            con.execute(f"INSERT INTO series_new ({columns}) SELECT {columns} FROM series")
+            con.execute("DROP TABLE series")
+            con.execute("ALTER TABLE series_new RENAME TO series")
+        highest = max(
+            con.execute(f"SELECT COALESCE(MAX({column}), 0) FROM {table}").fetchone()[0]
+            for table, column in [("series", "id"), ("rollups", "series_id"), ("report_series", "series_id")]
+            + [(name, "series_id") for name in _partitionsFor()]
+        )
+        con.execute("DELETE FROM sqlite_sequence WHERE name = 'series'")
+        con.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('series', ?)", (highest,))
+        con.execute("PRAGMA user_version = 4")
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+
+# ----------------------
+# Partitions
+# ----------------------
+
+# name -> (start_sec, end_sec), start inclusive, end exclusive
+_PARTITIONS = {}
+_PARTITION_LOCK = threading.Lock()
+
+def _partitionBounds(ts_sec):
+    """
+    Returns (table name, start_sec, end_sec) of the partition for ts_sec.
+    Partitions created with another PARTITION_MONTHS are never overlapped.
+    """
+    t = time.gmtime(ts_sec)
+    index = (t.tm_year * 12 + t.tm_mon - 1) // PARTITION_MONTHS * PARTITION_MONTHS
+    year, month = divmod(index, 12)
+    end_year, end_month = divmod(index + PARTITION_MONTHS, 12)
+    start = calendar.timegm((year, month + 1, 1, 0, 0, 0))
+    end = calendar.timegm((end_year, end_month + 1, 1, 0, 0, 0))
+    for other_start, other_end in list(_PARTITIONS.values()):
+        if other_end <= ts_sec:
+            start = max(start, other_end)
+        elif other_start > ts_sec:
+            end = min(end, other_start)
+    # all bounds are month starts, so the start month names a partition uniquely
+    return f"{PARTITION_PREFIX}{time.strftime('%Y%m', time.gmtime(start))}", start, end
+
+def _createPartition(con, name, start, end):
+    con.execute(PARTITION_SCHEMA.format(table=name))
+    con.execute(PARTITION_INDEX.format(table=name))
+    con.execute(
+        "INSERT OR IGNORE INTO partitions (name, start_sec, end_sec) VALUES (?, ?, ?)",
+        (name, start, end),
+    )
+
+def createPartitionIndexes(con, names=None):
+    """Creates the PARTITION_INDEX of the given (default all) partitions where it is missing, e.g. after a bulk import."""
+    for name in names if names is not None else _partitionsFor():
+        con.execute(PARTITION_INDEX.format(table=name))
+
+def dropPartitionIndexes(con, names):
+    """Drops PARTITION_INDEX, bulk imports rebuild it once instead of updating it per row."""
+    for name in names:
+        con.execute(f"DROP INDEX IF EXISTS idx_{name}_report")
+
+def _loadPartitions():
+    with getDB() as con:
+        rows = con.execute("SELECT name, start_sec, end_sec FROM partitions").fetchall()
+    with _PARTITION_LOCK:
+        _PARTITIONS.clear()
+        _PARTITIONS.update({name: (start, end) for name, start, end in rows})
+
+def _findPartition(ts_sec):
+    for name, (start, end) in list(_PARTITIONS.items()):
+        if start <= ts_sec < end:
+            return name
+    return None
+
+def _getOrCreatePartitions(ts_secs):
+    """Returns {ts_sec: partition name}, new partitions are committed right away."""
+    result = {}
+    missing = []
+    last = None  # rows of one call are usually in the same partition
+    for ts_sec in ts_secs:
+        if last and last[1] <= ts_sec < last[2]:
+            result[ts_sec] = last[0]
+            continue
+        name = _findPartition(ts_sec)
+        if name is None:
+            missing.append(ts_sec)
+        else:
+            result[ts_sec] = name
+            last = (name, *_PARTITIONS[name])
+    if missing:
+        created = False
+        with _PARTITION_LOCK:
+            with getDB() as con:
+                for ts_sec in missing:
+                    name = _findPartition(ts_sec)
+                    if name is None:
+                        name, start, end = _partitionBounds(ts_sec)
+                        _createPartition(con, name, start, end)
+                        _PARTITIONS[name] = (start, end)
+                        created = True
+                    result[ts_sec] = name
+        if created:
+            bumpGeneration(MEASUREMENTS_GENERATION)
+    return result
+
+def _partitionsFor(ts_from=None, ts_to=None):
+    """Names of the partitions overlapping [ts_from, ts_to] in time order."""
+    if not _PARTITIONS:
+        _loadPartitions()
+    return [
+        name for name, (start, end) in sorted(list(_PARTITIONS.items()), key=lambda item: item[1])
+        if (ts_from is None or end > ts_from) and (ts_to is None or start <= ts_to)
+    ]
+
+def _queryPartitions(con, sql, params=(), ts_from=None, ts_to=None):
+    """
+    Runs sql (with a {table} placeholder) on every partition overlapping the
+    time range, oldest first. Rows ordered by time inside a partition are
+    therefore ordered over the whole result.
+    """
+    for name in _partitionsFor(ts_from, ts_to):
+        yield from _iterCursor(con.execute(sql.format(table=name), params))
+
+def _queryPartitionBatches(con, sql, params=(), ts_from=None, ts_to=None):
+    """Like _queryPartitions but yields lists of up to STREAM_FETCH_ROWS rows."""
+    for name in _partitionsFor(ts_from, ts_to):
+        cursor = con.execute(sql.format(table=name), params)
+        while True:
+            rows = cursor.fetchmany(STREAM_FETCH_ROWS)
+            if not rows:
+                break
+            yield rows
 
+def _iterCursor(cursor):
+    """Yields the rows of cursor STREAM_FETCH_ROWS at a time, so results never have to fit into memory."""
+    while True:
+        rows = cursor.fetchmany(STREAM_FETCH_ROWS)
+        if not rows:
+            return
+        yield from rows
+
+def _unionPartitions(sql, params=(), ts_from=None, ts_to=None, union="UNION ALL"):
+    """Returns (sql, params) combining sql over the overlapping partitions, or (None, None)."""
+    names = _partitionsFor(ts_from, ts_to)
+    if not names:
+        return None, None
+    return f"\n{union}\n".join(sql.format(table=name) for name in names), list(params) * len(names)
+
+def _timeFilter(ts_from, ts_to, column="ts_sec"):
+    """SQL condition and params for an optional inclusive range in seconds."""
+    condition = ""
+    params = []
+    if ts_from is not None:
+        condition += f" AND {column} >= ?"
+        params.append(int(ts_from))
+    if ts_to is not None:
+        condition += f" AND {column} <= ?"
+        params.append(int(ts_to))
+    return condition, params
+
+def getPartitions():
+    """Returns [(name, start_sec, end_sec), ...] ordered by time."""
+    return [(name, *_PARTITIONS[name]) for name in _partitionsFor()]
+
+def dropPartitionsBefore(ts_sec):
+    """
+    Drops every partition that ends at or before ts_sec. Dropping a table is
+    far cheaper than deleting its rows one by one. Returns the dropped names.
+    """
+    flushMeasurements()
+    dropped = []
+    removed = {}
+    with _PARTITION_LOCK:
+        with getDB() as con:
+            for name in _partitionsFor():
+                if _PARTITIONS[name][1] > ts_sec:
+                    break
+                for series_id, rows in con.execute(f"SELECT series_id, COUNT(*) FROM {name} GROUP BY series_id"):
+                    removed[series_id] = removed.get(series_id, 0) + rows
+                con.execute(f"DROP TABLE IF EXISTS {name}")
+                con.execute("DELETE FROM partitions WHERE name = ?", (name,))
+                dropped.append(name)
+            for name in dropped:
+                _PARTITIONS.pop(name, None)
+    if dropped:
+        bumpGeneration(MEASUREMENTS_GENERATION)
+    con = getDB()
+    _removeFromSeriesCatalog(con, removed)
+    _removeFromReportCatalog(con, {series_id: ts_sec for series_id in removed})
+    return dropped
+
+# ----------------------
+# Series
+# ----------------------
+
+# (device_id, key) -> series id. Series are never renumbered, only removed
+# together with their device, so entries stay valid until then (other
+# server processes drop theirs through MEASUREMENTS_GENERATION).
+_SERIES_IDS = {}
+
+def _findSeriesId(con, device_id, key):
+    series_id = _SERIES_IDS.get((device_id, key))
+    if series_id is None:
+        row = con.execute(
+            "SELECT id FROM series WHERE device_id = ? AND key = ?",
+            (device_id, key),
+        ).fetchone()
+        if row is None:
+            return None
+        series_id = _SERIES_IDS[(device_id, key)] = row[0]
+    return series_id
+
+def _getOrCreateSeriesIds(pairs):
+    """Returns {(device_id, key): series_id}, new series are committed right away."""
+    result = {}
+    missing = []
+    for pair in pairs:
+        series_id = _SERIES_IDS.get(pair)
+        if series_id is None:
+            missing.append(pair)
+        else:
+            result[pair] = series_id
+    if missing:
+        with getDB() as con:
+            con.executemany("INSERT OR IGNORE INTO series (device_id, key) VALUES (?, ?)", missing)
+            for device_id, key in missing:
+                result[(device_id, key)] = _findSeriesId(con, device_id, key)
+    return result
+
+def _seriesIdsFor(con, pairs):
+    """{(device_id, key): series_id} of the pairs that have a series."""
+    result = {}
+    for pair in pairs:
+        series_id = _findSeriesId(con, *pair)
+        if series_id is not None:
+            result[pair] = series_id
+    return result
+
+def _forgetSeries(device_id):
+    for pair in [pair for pair in _SERIES_IDS if pair[0] == device_id]:
+        _SERIES_IDS.pop(pair, None)
+
+def _reloadCaches():
+    """Another server process created or dropped partitions, removed series or changed retention policies."""
+    _loadPartitions()
+    _SERIES_IDS.clear()
+    _forgetRetentionPolicies()
+
+onGenerationChange(MEASUREMENTS_GENERATION, _reloadCaches)
+
+# ----------------------
+# Rollups
+# ----------------------
+
+ROLLUP_UPSERT = """
+INSERT INTO rollups (series_id, resolution, bucket, count, sum, min, max)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (series_id, resolution, bucket) DO UPDATE SET
+    count = count + excluded.count,
+    sum = sum + excluded.sum,
+    min = MIN(min, excluded.min),
+    max = MAX(max, excluded.max)
+"""
+
+def _updateRollups(con, prepared):
+    """Adds the numeric values of freshly inserted rows to every rollup resolution."""
+    buckets = {}
+    for _, series_id, ts_sec, _, value_num, value_int, _, value_bool, _ in prepared:
+        value = value_num if value_num is not None else value_int if value_int is not None else value_bool
+        if value is None:
+            continue
+        for resolution in ROLLUP_RESOLUTIONS:
+            bucket_key = (series_id, resolution, ts_sec - ts_sec % resolution)
+            bucket = buckets.get(bucket_key)
+            if bucket is None:
+                buckets[bucket_key] = [1, value, value, value]
+            else:
+                bucket[0] += 1
+                bucket[1] += value
+                if value < bucket[2]:
+                    bucket[2] = value
+                if value > bucket[3]:
+                    bucket[3] = value
+    con.executemany(ROLLUP_UPSERT, [(*bucket_key, *bucket) for bucket_key, bucket in buckets.items()])
+
+def _rebuildRollups(con, series_id, partitions=None):
+    """Recomputes the rollups of one series from the raw rows of the given (default all) partitions."""
+    for name in partitions if partitions is not None else _partitionsFor():
+        for resolution in ROLLUP_RESOLUTIONS:
+            con.execute(
+                f"""
+                INSERT INTO rollups (series_id, resolution, bucket, count, sum, min, max)
+                SELECT series_id, ?, ts_sec - ts_sec % ?, COUNT(*), SUM(value), MIN(value), MAX(value)
+                FROM (
+                    SELECT series_id, ts_sec, COALESCE(value_num, value_int, value_bool) AS value
+                    FROM {name}
+                    WHERE series_id = ?
+                )
+                WHERE value IS NOT NULL
+                GROUP BY series_id, ts_sec - ts_sec % ?
+                ON CONFLICT (series_id, resolution, bucket) DO UPDATE SET
+                    count = count + excluded.count,
+                    sum = sum + excluded.sum,
+                    min = MIN(min, excluded.min),
+                    max = MAX(max, excluded.max)
+                """,
+                (resolution, resolution, series_id, resolution),
+            )
+
+# ----------------------
+# Series catalog
+# ----------------------
+
+SERIES_CATALOG_UPDATE = """
+UPDATE series SET
+    first_sec = CASE WHEN row_count = 0 OR (?1, ?2) < (first_sec, first_nsec) THEN ?1 ELSE first_sec END,
+    first_nsec = CASE WHEN row_count = 0 OR (?1, ?2) < (first_sec, first_nsec) THEN ?2 ELSE first_nsec END,
+    last_sec = CASE WHEN row_count = 0 OR (?3, ?4) > (last_sec, last_nsec) THEN ?3 ELSE last_sec END,
+    last_nsec = CASE WHEN row_count = 0 OR (?3, ?4) > (last_sec, last_nsec) THEN ?4 ELSE last_nsec END,
+    value_type = CASE WHEN row_count = 0 OR value_type IS NULL OR value_type = ?5 THEN ?5 ELSE 'mixed' END,
+    min_value = COALESCE(MIN(min_value, ?6), min_value, ?6),
+    max_value = COALESCE(MAX(max_value, ?7), max_value, ?7),
+    row_count = row_count + ?8
+WHERE id = ?9
+"""
+
+def _valueType(value_num, value_int, value_text, value_bool):
+    if value_num is not None:
+        return "float"
+    if value_int is not None:
+        return "int"
+    if value_bool is not None:
+        return "bool"
+    return "text"
+
+def _updateSeriesCatalog(con, prepared):
+    """Adds freshly inserted rows to the catalog columns of their series."""
+    stats = {}
+    for _, series_id, ts_sec, ts_nsec, value_num, value_int, value_text, value_bool, _ in prepared:
+        ts = (ts_sec, ts_nsec)
+        value_type = _valueType(value_num, value_int, value_text, value_bool)
+        value = value_num if value_num is not None else value_int if value_int is not None else value_bool
+        entry = stats.get(series_id)
+        if entry is None:
+            stats[series_id] = [ts, ts, value_type, value, value, 1]
+            continue
+        if ts < entry[0]:
+            entry[0] = ts
+        if ts > entry[1]:
+            entry[1] = ts
+        if value_type != entry[2]:
+            entry[2] = "mixed"
+        if value is not None:
+            if entry[3] is None or value < entry[3]:
+                entry[3] = value
+            if entry[4] is None or value > entry[4]:
+                entry[4] = value
+        entry[5] += 1
+    con.executemany(
+        SERIES_CATALOG_UPDATE,
+        [(*first, *last, value_type, low, high, count, series_id)
+         for series_id, (first, last, value_type, low, high, count) in stats.items()],
+    )
+
+def _firstAndLastRow(con, series_id):
+    """((ts_sec, ts_nsec) of the oldest, of the newest raw row) of a series, index lookups only."""
+    first = last = None
+    names = _partitionsFor()
+    for name in names:
+        first = con.execute(
+            f"SELECT ts_sec, ts_nsec FROM {name} WHERE series_id = ? ORDER BY ts_sec, ts_nsec LIMIT 1",
+            (series_id,),
+        ).fetchone()
+        if first is not None:
+            break
+    for name in reversed(names):
+        last = con.execute(
+            f"SELECT ts_sec, ts_nsec FROM {name} WHERE series_id = ? ORDER BY ts_sec DESC, ts_nsec DESC LIMIT 1",
+            (series_id,),
+        ).fetchone()
+        if last is not None:
+            break
+    return first, last
+
+def _catalogMinMax(con, series_id):
+    return con.execute(
+        "SELECT MIN(min), MAX(max) FROM rollups WHERE series_id = ? AND resolution = ?",
+        (series_id, ROLLUP_RESOLUTIONS[-1]),
+    ).fetchone()
+
+def _rebuildSeriesCatalog(con, series_id):
+    """Recomputes the catalog columns of one series from its raw rows and rollups."""
+    count = 0
+    types = set()
+    for name in _partitionsFor():
+        rows, *flags = con.execute(
+            f"""
+            SELECT COUNT(*), MAX(value_num IS NOT NULL), MAX(value_int IS NOT NULL),
+                   MAX(value_bool IS NOT NULL), MAX(value_text IS NOT NULL)
+            FROM {name} WHERE series_id = ?
+            """,
+            (series_id,),
+        ).fetchone()
+        count += rows
+        types.update(value_type for value_type, flag in zip(("float", "int", "bool", "text"), flags) if flag)
+    first, last = _firstAndLastRow(con, series_id)
+    value_type = None if not types else types.pop() if len(types) == 1 else "mixed"
+    con.execute(
+        """
+        UPDATE series SET row_count = ?, first_sec = ?, first_nsec = ?, last_sec = ?, last_nsec = ?,
+                          value_type = ?, min_value = ?, max_value = ?
+        WHERE id = ?
+        """,
+        (count, *(first or (None, None)), *(last or (None, None)), value_type,
+         *_catalogMinMax(con, series_id), series_id),
+    )
+
+def _removeFromSeriesCatalog(con, removed):
+    """
+    Updates the catalog after purging, removed is {series_id: deleted raw rows}.
+    Only the count and the oldest row change, the newest row only goes with the last one.
+    """
+    for series_id, rows in removed.items():
+        if not rows:
+            continue
+        with con:
+            first, last = _firstAndLastRow(con, series_id)
+            if first is None:
+                con.execute(
+                    """
+                    UPDATE series SET row_count = 0, first_sec = NULL, first_nsec = NULL,
+                                      last_sec = NULL, last_nsec = NULL
+                    WHERE id = ?
+                    """,
+                    (series_id,),
+                )
+            else:
+                con.execute(
+                    "UPDATE series SET row_count = MAX(row_count - ?, 0), first_sec = ?, first_nsec = ? WHERE id = ?",
+                    (rows, *first, series_id),
+                )
+
+def getSeriesCatalog(device_ids: Optional[list[str]] = None):
+    """
+    Returns one dict per series without touching the measurements:
+    device_id, key, count, first and last (seconds as float, None without rows),
+    value_type and min/max of the numeric values.
+    """
+    condition = ""
+    if device_ids:
+        condition = f"WHERE device_id IN ({','.join('?' * len(device_ids))})"
+    with getDB() as con:
+        rows = con.execute(
+            f"""
+            SELECT device_id, key, row_count, first_sec + first_nsec * 1e-9, last_sec + last_nsec * 1e-9,
+                   value_type, min_value, max_value
+            FROM series {condition}
+            ORDER BY device_id, key
+            """,
+            device_ids or [],
+        ).fetchall()
+    return [
+        {
+            "device_id": device_id, "key": key, "count": count, "first": first, "last": last,
+            "value_type": value_type, "min": low, "max": high,
+        }
+        for device_id, key, count, first, last, value_type, low, high in rows
+    ]
+
+# ----------------------
+# Report catalog
+# ----------------------
+
+# timestamps as one integer of nanoseconds, fits into SQLite's 64 bit integers
+NS = 1000000000
+TS_NS = f"ts_sec * {NS} + ts_nsec"
+FIRST_NS = f"first_sec * {NS} + first_nsec"
+LAST_NS = f"last_sec * {NS} + last_nsec"
+
+REPORT_CATALOG_UPSERT = """
+INSERT INTO {table} ({key_columns}, row_count, first_sec, first_nsec, last_sec, last_nsec)
+VALUES ({key_params}, ?, ?, ?, ?, ?)
+ON CONFLICT ({key_columns}) DO UPDATE SET
+    row_count = row_count + excluded.row_count,
+    first_sec = CASE WHEN (excluded.first_sec, excluded.first_nsec) < (first_sec, first_nsec) THEN excluded.first_sec ELSE first_sec END,
+    first_nsec = CASE WHEN (excluded.first_sec, excluded.first_nsec) < (first_sec, first_nsec) THEN excluded.first_nsec ELSE first_nsec END,
+    last_sec = CASE WHEN (excluded.last_sec, excluded.last_nsec) > (last_sec, last_nsec) THEN excluded.last_sec ELSE last_sec END,
+    last_nsec = CASE WHEN (excluded.last_sec, excluded.last_nsec) > (last_sec, last_nsec) THEN excluded.last_nsec ELSE last_nsec END
+"""
+REPORTS_UPSERT = REPORT_CATALOG_UPSERT.format(table="reports", key_columns="report_id", key_params="?")
+REPORT_SERIES_UPSERT = REPORT_CATALOG_UPSERT.format(table="report_series", key_columns="report_id, series_id", key_params="?, ?")
+
+def _updateReportCatalog(con, prepared):
+    """Adds freshly inserted rows with a report id to reports and report_series."""
+    stats = {}
+    for _, series_id, ts_sec, ts_nsec, _, _, _, _, report_id in prepared:
+        if not report_id:
+            continue
+        ts = (ts_sec, ts_nsec)
+        entry = stats.get((report_id, series_id))
+        if entry is None:
+            stats[(report_id, series_id)] = [1, ts, ts]
+            continue
+        entry[0] += 1
+        if ts < entry[1]:
+            entry[1] = ts
+        if ts > entry[2]:
+            entry[2] = ts
+    if not stats:
+        return
+    con.executemany(
+        REPORT_SERIES_UPSERT,
+        [(*report_series, count, *first, *last) for report_series, (count, first, last) in stats.items()],
+    )
+    reports = {}
+    for (report_id, _), (count, first, last) in stats.items():
+        entry = reports.get(report_id)
+        if entry is None:
+            reports[report_id] = [count, first, last]
+        else:
+            entry[0] += count
+            entry[1] = min(entry[1], first)
+            entry[2] = max(entry[2], last)
+    con.executemany(
+        REPORTS_UPSERT,
+        [(report_id, count, *first, *last) for report_id, (count, first, last) in reports.items()],
+    )
+
+def _rebuildReportSeries(con, report_id, series_id):
+    """Recounts one (report, series) entry via the report index of the partitions."""
+    count = 0
+    first = last = None
+    for name in _partitionsFor():
+        rows, low, high = con.execute(
+            f"""
+            SELECT COUNT(*), MIN({TS_NS}), MAX({TS_NS}) FROM {name}
+            WHERE report_id = ? AND report_id != '' AND series_id = ?
+            """,
+            (report_id, series_id),
+        ).fetchone()
+        if not rows:
+            continue
+        count += rows
+        first = low if first is None else min(first, low)
+        last = high if last is None else max(last, high)
+    con.execute("DELETE FROM report_series WHERE report_id = ? AND series_id = ?", (report_id, series_id))
+    if count:
+        con.execute(REPORT_SERIES_UPSERT, (report_id, series_id, count, *divmod(first, NS), *divmod(last, NS)))
+
+def _rebuildReports(con, report_ids):
+    """Recomputes the reports rows of report_ids from report_series."""
+    for report_id in report_ids:
+        count, first, last = con.execute(
+            f"SELECT SUM(row_count), MIN({FIRST_NS}), MAX({LAST_NS}) FROM report_series WHERE report_id = ?",
+            (report_id,),
+        ).fetchone()
+        con.execute("DELETE FROM reports WHERE report_id = ?", (report_id,))
+        if count:
+            con.execute(REPORTS_UPSERT, (report_id, count, *divmod(first, NS), *divmod(last, NS)))
+
+def _removeFromReportCatalog(con, cutoffs):
+    """Updates the catalog after purging, cutoffs is {series_id: ts_sec} with all older raw rows deleted."""
+    for series_id, cutoff in cutoffs.items():
+        with con:
+            report_ids = [
+                row[0] for row in con.execute(
+                    "SELECT report_id FROM report_series WHERE series_id = ? AND first_sec < ?",
+                    (series_id, cutoff),
+                ).fetchall()
+            ]
+            for report_id in report_ids:
+                _rebuildReportSeries(con, report_id, series_id)
+            _rebuildReports(con, report_ids)
+
+def getReportCatalog(device_ids: Optional[list[str]] = None):
+    """
+    Returns one dict per report id, newest first: report_id, count, first and last
+    (seconds as float) and the devices and keys it has rows for. With device_ids
+    only reports of these devices are listed, with their rows of these devices.
+    """
+    condition = ""
+    if device_ids:
+        condition = f"WHERE s.device_id IN ({','.join('?' * len(device_ids))})"
+    with getDB() as con:
+        rows = con.execute(
+            f"""
+            SELECT r.report_id, r.row_count, r.first_sec, r.first_nsec, r.last_sec, r.last_nsec, s.device_id, s.key
+            FROM report_series r
+            JOIN series s ON s.id = r.series_id
+            {condition}
+            ORDER BY r.report_id
+            """,
+            device_ids or [],
+        ).fetchall()
+    result = []
+    for report_id, entries in itertools.groupby(rows, key=operator.itemgetter(0)):
+        entries = list(entries)
+        result.append({
+            "report_id": report_id,
+            "count": sum(entry[1] for entry in entries),
+            "first": min(entry[2] + entry[3] * 1e-9 for entry in entries),
+            "last": max(entry[4] + entry[5] * 1e-9 for entry in entries),
+            "devices": sorted({entry[6] for entry in entries}),
+            "keys": sorted({entry[7] for entry in entries}),
+        })
+    result.sort(key=operator.itemgetter("last"), reverse=True)
+    return result
+
+# ----------------------
+# Retention
+# ----------------------
+
+# (device_id, key) -> raw_days, '*' matches every device or key. Loaded on first use.
+_RETENTION = None
+
+def _retentionPolicies():
+    global _RETENTION
+    policies = _RETENTION
+    if policies is None:
+        with getDB() as con:
+            rows = con.execute("SELECT device_id, key, raw_days FROM retention_policies").fetchall()
+        policies = _RETENTION = {(device_id, key): raw_days for device_id, key, raw_days in rows}
+    return policies
+
+def _forgetRetentionPolicies():
+    global _RETENTION
+    _RETENTION = None
+
+def _retentionCutoff(days, now):
+    """Oldest second that is kept, None if days is 0 (keep forever)."""
+    if not days:
+        return None
+    return int(now) - int(days) * 86400
+
+def rawRetentionDays(device_id: str, key: str):
+    """Days raw rows of one series are kept, 0 means forever. The most specific policy wins."""
+    policies = _retentionPolicies()
+    for candidate in ((device_id, key), (device_id, "*"), ("*", key), ("*", "*")):
+        days = policies.get(candidate)
+        if days is not None:
+            return days
+    return RAW_RETENTION_DAYS
+
+def getRetentionPolicies():
+    return [
+        {"device_id": device_id, "key": key, "raw_days": raw_days}
+        for (device_id, key), raw_days in sorted(_retentionPolicies().items())
+    ]
+
+def setRetentionPolicy(device_id: str = "*", key: str = "*", raw_days: int = 0):
+    """Keep raw rows of matching series for raw_days days (0 = forever), rollups stay."""
+    if not device_id or not key:
+        raise ValueError("device_id and key must not be empty, use '*' to match all")
+    if isinstance(raw_days, bool) or not isinstance(raw_days, int) or raw_days < 0:
+        raise ValueError("raw_days must be an integer >= 0")
     with getDB() as con:
         con.execute(
             """
-            INSERT INTO measurements
-            (device_id, ts_sec, ts_nsec, key,
+            INSERT INTO retention_policies (device_id, key, raw_days) VALUES (?, ?, ?)
+            ON CONFLICT (device_id, key) DO UPDATE SET raw_days = excluded.raw_days
+            """,
+            (device_id, key, raw_days),
+        )
+    _forgetRetentionPolicies()
+    bumpGeneration(MEASUREMENTS_GENERATION)
+
+def removeRetentionPolicy(device_id: str = "*", key: str = "*"):
+    with getDB() as con:
+        con.execute("DELETE FROM retention_policies WHERE device_id = ? AND key = ?", (device_id, key))
+    _forgetRetentionPolicies()
+    bumpGeneration(MEASUREMENTS_GENERATION)
+
+def _deleteChunked(con, table, condition, params, column, cutoff, chunk_rows, pause):
+    """
+    Deletes the rows matching condition with column < cutoff, oldest first, in
+    transactions of about chunk_rows rows. Sleeping pause seconds between two
+    chunks lets the measurement writer commit in between. Returns the deleted row count.
+    """
+    deleted = 0
+    while True:
+        with con:
+            # WITHOUT ROWID tables have no rowid to LIMIT a DELETE by, so look up
+            # the column value of the last row of this chunk instead
+            boundary = con.execute(
+                f"SELECT {column} FROM {table} WHERE {condition} AND {column} < ? ORDER BY {column} LIMIT 1 OFFSET ?",
+                (*params, cutoff, chunk_rows - 1),
+            ).fetchone()
+            limit = cutoff if boundary is None else boundary[0] + 1
+            deleted += con.execute(
+                f"DELETE FROM {table} WHERE {condition} AND {column} < ?",
+                (*params, limit),
+            ).rowcount
+        if boundary is None:
+            return deleted
+        time.sleep(pause)
+
+def purgeExpiredMeasurements(chunk_rows: int, pause: float, now: Optional[float] = None):
+    """
+    Applies the retention policies. Partitions that only hold expired rows are
+    dropped as a whole, remaining expired raw rows and rollups older than
+    ROLLUP_RETENTION_DAYS are deleted in chunks (see _deleteChunked).
+    Returns {"raw": <rows>, "rollups": <rows>, "partitions": [<dropped names>]}.
+    """
+    now = time.time() if now is None else now
+    result = {"raw": 0, "rollups": 0, "partitions": []}
+    with getDB() as con:
+        series = con.execute("SELECT id, device_id, key FROM series").fetchall()
+    cutoffs = {
+        series_id: _retentionCutoff(rawRetentionDays(device_id, key), now)
+        for series_id, device_id, key in series
+    }
+    if cutoffs and None not in cutoffs.values():
+        result["partitions"] = dropPartitionsBefore(min(cutoffs.values()))
+
+    con = getDB()
+    removed = {}
+    for series_id, cutoff in cutoffs.items():
+        if cutoff is None:
+            continue
+        for name in _partitionsFor(None, cutoff - 1):
+            rows = _deleteChunked(con, name, "series_id = ?", (series_id,), "ts_sec", cutoff, chunk_rows, pause)
+            removed[series_id] = removed.get(series_id, 0) + rows
+            result["raw"] += rows
+    _removeFromSeriesCatalog(con, removed)
+    _removeFromReportCatalog(con, {series_id: cutoffs[series_id] for series_id, rows in removed.items() if rows})
+    for resolution, days in ROLLUP_RETENTION_DAYS.items():
+        cutoff = _retentionCutoff(days, now)
+        if cutoff is None:
+            continue
+        for series_id in cutoffs:
+            rows = _deleteChunked(
+                con, "rollups", "series_id = ? AND resolution = ?", (series_id, resolution),
+                "bucket", cutoff, chunk_rows, pause,
+            )
+            result["rollups"] += rows
+            if rows and resolution == ROLLUP_RESOLUTIONS[-1]:
+                # the catalog min/max come from the daily rollups
+                with con:
+                    con.execute(
+                        "UPDATE series SET min_value = ?, max_value = ? WHERE id = ?",
+                        (*_catalogMinMax(con, series_id), series_id),
+                    )
+    return result
+
+# ----------------------
+# Writing
+# ----------------------
+
+def _writeMeasurements(con, prepared):
+    if not con.in_transaction:
+        # the series check below and the inserts must see the same series table
+        con.execute("BEGIN IMMEDIATE")
+    prepared = _dropRemovedSeries(con, prepared)
+    by_partition = {}
+    for row in prepared:
+        by_partition.setdefault(row[0], []).append(row[1:])
+    for name, rows in by_partition.items():
+        con.executemany(
+            f"""
+            INSERT INTO {name}
+            (series_id, ts_sec, ts_nsec,
              value_num, value_int, value_text, value_bool,
              report_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             """,
-            (
-                device_id, ts_sec, ts_nsec, key,
-                value_num, value_int, value_text, value_bool,
-                report_id,
-            ),
+            rows,
         )
+    _updateRollups(con, prepared)
+    _updateSeriesCatalog(con, prepared)
+    _updateReportCatalog(con, prepared)
+
+def _dropRemovedSeries(con, prepared):
+    """
+    Leaves out rows of series that no longer exist: removeDeviceData() of another
+    process only flushes its own writer, rows queued elsewhere arrive after the delete.
+    """
+    series_ids = list({row[1] for row in prepared})
+    existing = {
+        row[0] for row in con.execute(
+            f"SELECT id FROM series WHERE id IN ({','.join('?' * len(series_ids))})", series_ids
+        )
+    }
+    if len(existing) == len(series_ids):
+        return prepared
+    kept = [row for row in prepared if row[1] in existing]
+    print(f"Dropped {len(prepared) - len(kept)} measurements of removed series")
+    return kept
+
+# All measurement inserts go through one writer thread which groups the rows of
+# concurrent reports into a single transaction.
+_WRITER = BatchWriter(
+    DB_FILE,
+    _writeMeasurements,
+    max_batch_rows=WRITE_BATCH_ROWS,
+    max_delay=WRITE_BATCH_DELAY,
+    max_queue=WRITE_QUEUE_SIZE,
+)
+
+def insertMeasurement(
+    device_id: str,
+    ts_sec: int,
+    ts_nsec: int,
+    key: str,
+    value: Any,
+    report_id: Optional[str] = None,
+):
+    insertMeasurements([(device_id, ts_sec, ts_nsec, key, value, report_id)])
 
 def insertMeasurements(
     rows: Iterable[
         Tuple[str, int, int, str, Any, Optional[str]]
-    ]
+    ],
+    wait: bool = True,
 ):
+    """
+    Queue rows for the measurement writer.
+    wait=True blocks until the rows are committed and raises if the insert failed.
+    wait=False returns the WriteTicket right after queueing.
+    Raises RuntimeError if the writer queue stays full.
+    """
+    ticket = _WRITER.submit(_prepareRows(list(rows)))
+    if wait:
+        ticket.wait(WRITE_TIMEOUT)
+    return ticket
+
+def _prepareRows(rows):
+    """Rows as passed to insertMeasurements() -> rows for _writeMeasurements(), creating missing series and partitions."""
+    series_ids = _getOrCreateSeriesIds({(row[0], row[3]) for row in rows})
+    partitions = _getOrCreatePartitions({row[1] for row in rows})
     prepared = []
 
     for device_id, ts_sec, ts_nsec, key, value, report_id in rows:
@@ -74,23 +1103,113 @@ def insertMeasurements(
 
         prepared.append(
             (
-                device_id, ts_sec, ts_nsec, key,
+                partitions[ts_sec],
+                series_ids[(device_id, key)], ts_sec, ts_nsec,
                 value_num, value_int, value_text, value_bool,
                 report_id,
             )
         )
+    return prepared
 
-    with getDB() as con:
-        con.executemany(
-            """
-            INSERT INTO measurements
-            (device_id, ts_sec, ts_nsec, key,
-             value_num, value_int, value_text, value_bool,
-             report_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            prepared,
-        )
+def flushMeasurements():
+    _WRITER.flush(WRITE_TIMEOUT)
+
+# ----------------------
+# Bulk import
+# ----------------------
+
+def importMeasurements(
+    rows: Iterable[
+        Tuple[str, int, int, str, Any, Optional[str]]
+    ],
+    source: Optional[str] = None,
+    batch_rows: int = IMPORT_BATCH_ROWS,
+    restart: bool = False,
+    defer_indexes: bool = True,
+    progress: Optional[Callable[[dict], None]] = None,
+):
+    """
+    Loads rows like insertMeasurements() but for millions of them: on an own
+    connection instead of the writer queue, batch_rows rows per transaction,
+    each batch sorted into primary key order. Rollups and catalogs are
+    maintained as usual. With defer_indexes the report index of every partition
+    the import creates is dropped and rebuilt once at the end; partitions that
+    existed before keep theirs, the server may be reading them meanwhile.
+
+    With a source name the number of committed rows is stored in the imports
+    table with every batch, so calling again with the same source and rows skips
+    what is already loaded (restart=True starts over). A finished source is not loaded again.
+    progress is called after every batch with the dict that is finally returned:
+    {"rows": <imported>, "skipped": <already imported>, "seconds": <float>, "rows_per_second": <float>}.
+    Raises sqlite3.IntegrityError if a row repeats a stored (device, key, timestamp).
+    """
+    stats = {"rows": 0, "skipped": 0, "seconds": 0.0, "rows_per_second": 0.0}
+    con = sqlite3.connect(DB_FILE, timeout=WRITE_TIMEOUT)
+    for pragma in IMPORT_PRAGMAS:
+        con.execute(f"PRAGMA {pragma}")
+    _loadPartitions()
+    touched = set()
+    try:
+        if source is not None:
+            if restart:
+                with con:
+                    con.execute("DELETE FROM imports WHERE source = ?", (source,))
+            state = con.execute("SELECT rows_done, finished FROM imports WHERE source = ?", (source,)).fetchone()
+            if state is not None and state[1]:
+                stats["skipped"] = state[0]
+                return stats
+            stats["skipped"] = state[0] if state is not None else 0
+        rows = iter(rows)
+        if stats["skipped"]:
+            next(itertools.islice(rows, stats["skipped"], stats["skipped"]), None)
+        start = time.monotonic()
+        while True:
+            batch = list(itertools.islice(rows, batch_rows))
+            if not batch and source is None:
+                break
+            if defer_indexes:
+                # also partitions other processes created since the last batch
+                _loadPartitions()
+                known = set(_PARTITIONS)
+            prepared = _prepareRows(batch)
+            prepared.sort(key=operator.itemgetter(0, 1, 2, 3))
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                if defer_indexes:
+                    new = {row[0] for row in prepared} - known - touched
+                    dropPartitionIndexes(con, new)
+                    touched |= new
+                _writeMeasurements(con, prepared)
+                if source is not None:
+                    con.execute(
+                        """
+                        INSERT INTO imports (source, rows_done, finished, updated_sec) VALUES (?, ?, ?, ?)
+                        ON CONFLICT (source) DO UPDATE SET
+                            rows_done = excluded.rows_done, finished = excluded.finished, updated_sec = excluded.updated_sec
+                        """,
+                        (source, stats["skipped"] + stats["rows"] + len(batch), int(not batch), int(time.time())),
+                    )
+                con.commit()
+            except BaseException:
+                con.rollback()
+                raise
+            if not batch:
+                break
+            stats["rows"] += len(batch)
+            stats["seconds"] = time.monotonic() - start
+            stats["rows_per_second"] = stats["rows"] / stats["seconds"] if stats["seconds"] else 0.0
+            if progress is not None:
+                progress(stats)
+        return stats
+    finally:
+        if touched:
+            with con:
+                createPartitionIndexes(con, touched)
+        con.close()
+
+# ----------------------
+# Reading
+# ----------------------
 
 def getAllKeys(device_ids: Optional[list[str]] = None):
     with getDB() as con:
@@ -99,7 +1218,7 @@ def getAllKeys(device_ids: Optional[list[str]] = None):
             rows = con.execute(
                 f"""
                 SELECT DISTINCT key
-                FROM measurements
+                FROM series
                 WHERE device_id IN ({placeholders})
                 ORDER BY key
                 """,
@@ -107,121 +1226,458 @@ def getAllKeys(device_ids: Optional[list[str]] = None):
             )
         else:
             rows = con.execute(
-                "SELECT DISTINCT key FROM measurements ORDER BY key"
+                "SELECT DISTINCT key FROM series ORDER BY key"
             )
         return [r[0] for r in rows]
 
 def getAllReportIds(device_ids: Optional[list[str]] = None):
+    """Report ids (of the given devices) in order, read from the report catalog."""
     with getDB() as con:
         if device_ids:
             placeholders = ",".join("?" * len(device_ids))
             rows = con.execute(
                 f"""
-                SELECT DISTINCT report_id
-                FROM measurements
-                WHERE device_id IN ({placeholders})
-                  AND report_id IS NOT NULL
-                  AND report_id != ''
-                ORDER BY report_id
+                SELECT DISTINCT r.report_id
+                FROM report_series r
+                JOIN series s ON s.id = r.series_id
+                WHERE s.device_id IN ({placeholders})
+                ORDER BY 1
                 """,
                 device_ids,
             )
         else:
-            rows = con.execute(
-                """
-                SELECT DISTINCT report_id FROM measurements
-                WHERE report_id IS NOT NULL AND report_id != ''
-                ORDER BY report_id
-                """
-            )
+            rows = con.execute("SELECT report_id FROM reports ORDER BY report_id")
         return [r[0] for r in rows]
 
-def getTimeSeries(device_id: str, key: str):
+def iterTimeSeries(device_id: str, key: str, ts_from: Optional[int] = None, ts_to: Optional[int] = None):
+    """
+    Yields the rows (ts_sec, ts_nsec, value, report_id) of one series, optionally
+    limited to ts_from <= ts_sec <= ts_to. Only overlapping partitions are read.
+    """
+    con = getDB()
+    series_id = _findSeriesId(con, device_id, key)
+    if series_id is None:
+        return
+    condition, params = _timeFilter(ts_from, ts_to)
+    yield from _queryPartitions(
+        con,
+        f"""
+        SELECT ts_sec, ts_nsec,
+               COALESCE(value_num, value_int, value_text, value_bool) AS value,
+               report_id
+        FROM {{table}}
+        WHERE series_id = ?{condition}
+        ORDER BY ts_sec, ts_nsec
+        """,
+        [series_id, *params],
+        ts_from,
+        ts_to,
+    )
+
+def getTimeSeries(device_id: str, key: str, ts_from: Optional[int] = None, ts_to: Optional[int] = None):
+    return list(iterTimeSeries(device_id, key, ts_from, ts_to))
+
+def iterTimeSeriesBatches(device_id: str, key: str, ts_from: Optional[int] = None, ts_to: Optional[int] = None):
+    """
+    Yields lists of (t, value) float pairs of one series in time order, t in seconds
+    with the nanoseconds as fraction and value cast to REAL. Meant to fill numeric arrays,
+    text values are left out (see NUMERIC_VALUE).
+    """
+    con = getDB()
+    series_id = _findSeriesId(con, device_id, key)
+    if series_id is None:
+        return
+    condition, params = _timeFilter(ts_from, ts_to)
+    yield from _queryPartitionBatches(
+        con,
+        f"""
+        SELECT ts_sec + ts_nsec * 1e-9, {NUMERIC_VALUE}
+        FROM {{table}}
+        WHERE series_id = ? AND value_text IS NULL{condition}
+        ORDER BY ts_sec, ts_nsec
+        """,
+        [series_id, *params],
+        ts_from,
+        ts_to,
+    )
+
+def _bucketStart(ts_sec, resolution):
+    """Start of the rollup bucket holding ts_sec, None stays None."""
+    return None if ts_sec is None else int(ts_sec) - int(ts_sec) % resolution
+
+def getRollupSeries(device_id: str, key: str, resolution: int, ts_from: Optional[int] = None, ts_to: Optional[int] = None):
+    """Rollup rows (bucket, count, avg, min, max) of one series at one of ROLLUP_RESOLUTIONS."""
     with getDB() as con:
+        series_id = _findSeriesId(con, device_id, key)
+        if series_id is None:
+            return []
+        # the bucket holding ts_from starts before it
+        condition, params = _timeFilter(_bucketStart(ts_from, resolution), ts_to, column="bucket")
         return con.execute(
-            """
-            SELECT ts_sec, ts_nsec,
-                   COALESCE(value_num, value_int, value_text, value_bool) AS value,
-                   report_id
-            FROM measurements
-            WHERE device_id = ?
-              AND key = ?
-            ORDER BY ts_sec, ts_nsec
+            f"""
+            SELECT bucket, count, sum / count, min, max
+            FROM rollups
+            WHERE series_id = ? AND resolution = ?{condition}
+            ORDER BY bucket
             """,
-            (device_id, key),
+            [series_id, resolution, *params],
         ).fetchall()
 
-def getXYSeries(device_id: str, x_key: str, y_key: str):
+def chooseResolution(device_id: str, key: str, max_points: int, ts_from: Optional[int] = None, ts_to: Optional[int] = None):
+    """
+    Returns 0 if the raw rows in range fit into max_points and are not purged yet,
+    otherwise the finest of ROLLUP_RESOLUTIONS whose bucket count fits and whose
+    buckets are still kept (the coarsest if none does).
+    Uses the coarsest rollup to estimate row count and time span in one query.
+    """
+    return chooseResolutions([(device_id, key)], max_points, ts_from, ts_to)[(device_id, key)]
+
+def chooseResolutions(pairs: Iterable[Tuple[str, str]], max_points: int, ts_from: Optional[int] = None, ts_to: Optional[int] = None):
+    """chooseResolution() for several (device_id, key) pairs with one query. Returns {pair: resolution}."""
+    pairs = list(pairs)
+    coarsest = ROLLUP_RESOLUTIONS[-1]
     with getDB() as con:
-        return con.execute(
-            """
-            SELECT
-                x.ts_sec,
-                x.ts_nsec,
-                COALESCE(x.value_num, x.value_int, x.value_text, x.value_bool) AS x,
-                COALESCE(y.value_num, y.value_int, y.value_text, y.value_bool) AS y
-            FROM measurements x
-            JOIN measurements y
-            ON x.device_id = y.device_id
-            AND x.ts_sec = y.ts_sec
-            AND x.ts_nsec = y.ts_nsec
-            WHERE x.device_id = ?
-            AND x.key = ?
-            AND y.key = ?
-            ORDER BY x.ts_sec, x.ts_nsec
+        series_ids = _seriesIdsFor(con, pairs)
+        stats = {}
+        if series_ids:
+            condition, params = _timeFilter(_bucketStart(ts_from, coarsest), ts_to, column="bucket")
+            stats = {
+                series_id: (first, last, count)
+                for series_id, first, last, count in con.execute(
+                    f"""
+                    SELECT series_id, MIN(bucket), MAX(bucket), SUM(count)
+                    FROM rollups
+                    WHERE resolution = ? AND series_id IN ({",".join("?" * len(series_ids))}){condition}
+                    GROUP BY series_id
+                    """,
+                    [coarsest, *series_ids.values(), *params],
+                )
+            }
+    now = time.time()
+    result = {}
+    for device_id, key in pairs:
+        first, last, count = stats.get(series_ids.get((device_id, key)), (None, None, None))
+        result[(device_id, key)] = _pickResolution(device_id, key, first, last, count, max_points, ts_from, ts_to, now)
+    return result
+
+def _pickResolution(device_id, key, first, last, count, max_points, ts_from, ts_to, now):
+    if not count:
+        return 0  # nothing numeric to roll up
+    coarsest = ROLLUP_RESOLUTIONS[-1]
+    start = first if ts_from is None else max(first, ts_from)
+    end = last + coarsest if ts_to is None else min(last + coarsest, ts_to)
+    raw_cutoff = _retentionCutoff(rawRetentionDays(device_id, key), now)
+    if count <= max_points and (raw_cutoff is None or start >= raw_cutoff):
+        return 0
+    for resolution in ROLLUP_RESOLUTIONS:
+        rollup_cutoff = _retentionCutoff(ROLLUP_RETENTION_DAYS.get(resolution), now)
+        if rollup_cutoff is not None and start < rollup_cutoff:
+            continue  # the older buckets of this resolution are purged
+        if min((end - start) // resolution + 1, count) <= max_points:
+            return resolution
+    return coarsest
+
+def iterManyTimeSeries(
+    pairs: Iterable[Tuple[str, str]],
+    ts_from: Optional[int] = None,
+    ts_to: Optional[int] = None,
+    numeric: bool = False,
+):
+    """
+    Reads several (device_id, key) series with one query over all overlapping
+    partitions, ordered by series and time, and splits the result per series.
+    Yields ((device_id, key), rows) for every series with rows in range, in
+    series id order. rows yields the same tuples as iterTimeSeries(), or if numeric
+    (t, value, report_id) with t and value floats like iterTimeSeriesBatches() and
+    without the text values. Consume rows before the next series.
+    """
+    con = getDB()
+    series_ids = _seriesIdsFor(con, pairs)
+    if not series_ids:
+        return
+    pair_of = {series_id: pair for pair, series_id in series_ids.items()}
+    if numeric:
+        value = f"{NUMERIC_VALUE}, report_id"
+    else:
+        value = "COALESCE(value_num, value_int, value_text, value_bool), report_id"
+    condition, params = _timeFilter(ts_from, ts_to)
+    if numeric:
+        condition = " AND value_text IS NULL" + condition
+    sql, params = _unionPartitions(
+        f"""
+        SELECT series_id, ts_sec, ts_nsec, {value}
+        FROM {{table}}
+        WHERE series_id IN ({",".join("?" * len(series_ids))}){condition}
+        """,
+        [*series_ids.values(), *params],
+        ts_from,
+        ts_to,
+    )
+    if sql is None:
+        return
+    # every partition delivers its rows in primary key order, SQLite merges them without sorting
+    rows = _iterCursor(con.execute(sql + " ORDER BY 1, 2, 3", params))
+    for series_id, group in itertools.groupby(rows, key=operator.itemgetter(0)):
+        if numeric:
+            yield pair_of[series_id], ((r[1] + r[2] * 1e-9, r[3], r[4]) for r in group)
+        else:
+            yield pair_of[series_id], (r[1:] for r in group)
+
+def iterManyRollupSeries(resolutions: dict, ts_from: Optional[int] = None, ts_to: Optional[int] = None):
+    """
+    Rollups of several series, resolutions is {(device_id, key): resolution} as
+    returned by chooseResolutions(). One query per resolution.
+    Yields ((device_id, key), resolution, rows) with rows like getRollupSeries().
+    """
+    con = getDB()
+    series_ids = _seriesIdsFor(con, resolutions)
+    for resolution in ROLLUP_RESOLUTIONS:
+        ids = {series_id: pair for pair, series_id in series_ids.items() if resolutions[pair] == resolution}
+        if not ids:
+            continue
+        condition, params = _timeFilter(_bucketStart(ts_from, resolution), ts_to, column="bucket")
+        rows = _iterCursor(con.execute(
+            f"""
+            SELECT series_id, bucket, count, sum / count, min, max
+            FROM rollups
+            WHERE resolution = ? AND series_id IN ({",".join("?" * len(ids))}){condition}
+            ORDER BY series_id, bucket
             """,
-            (device_id, x_key, y_key),
-        ).fetchall()
+            [resolution, *ids, *params],
+        ))
+        for series_id, group in itertools.groupby(rows, key=operator.itemgetter(0)):
+            yield ids[series_id], resolution, (r[1:] for r in group)
 
-def getTimeSeriesViaReportId(report_id: str, device_id: str = None):  
-    with getDB() as con:
-        if device_id is None:
-            return con.execute(
-                """
-                SELECT ts_sec, ts_nsec, device_id, key,
-                       COALESCE(value_num, value_int, value_text, value_bool) AS value,
-                       report_id
-                FROM measurements
-                WHERE report_id = ?
-                ORDER BY ts_sec, ts_nsec
-                """,
-                (report_id,),
-            ).fetchall()
-        return con.execute(
+def _iterSeriesValues(con, series_id, ts_from=None, ts_to=None):
+    """Yields (t in nanoseconds, value) of one series in time order."""
+    condition, params = _timeFilter(ts_from, ts_to)
+    return _queryPartitions(
+        con,
+        f"""
+        SELECT ts_sec * 1000000000 + ts_nsec,
+               COALESCE(value_num, value_int, value_text, value_bool)
+        FROM {{table}}
+        WHERE series_id = ?{condition}
+        ORDER BY ts_sec, ts_nsec
+        """,
+        [series_id, *params],
+        ts_from,
+        ts_to,
+    )
+
+def iterXYSeries(
+    device_id: str,
+    x_key: str,
+    y_key: str,
+    y_device_id: Optional[str] = None,
+    align: str = "exact",
+    tolerance: int = 0,
+    ts_from: Optional[int] = None,
+    ts_to: Optional[int] = None,
+):
+    """
+    Yields (ts_sec, ts_nsec, x, y) pairing x_key of device_id with y_key of
+    y_device_id (default device_id). Both series are streamed in time order and
+    merged in one pass, see utilities.align.alignSeries for align and tolerance
+    (in nanoseconds).
+    """
+    con = getDB()
+    x_series_id = _findSeriesId(con, device_id, x_key)
+    y_series_id = _findSeriesId(con, y_device_id or device_id, y_key)
+    if x_series_id is None or y_series_id is None:
+        return
+    # the y partner of an x point may lie up to tolerance away, for asof without tolerance at any time before it
+    margin = -(-tolerance // 1_000_000_000)
+    y_from, y_to = ts_from, ts_to
+    if y_from is not None and align != "exact":
+        y_from = None if align == "asof" and not tolerance else y_from - margin
+    if y_to is not None and align == "nearest":
+        y_to += margin
+    # two cursors of one connection are read in step
+    for t, x, y in alignSeries(
+        _iterSeriesValues(con, x_series_id, ts_from, ts_to),
+        _iterSeriesValues(con, y_series_id, y_from, y_to),
+        align,
+        tolerance,
+    ):
+        yield t // 1_000_000_000, t % 1_000_000_000, x, y
+
+def getXYSeries(device_id: str, x_key: str, y_key: str, **kwargs):
+    return list(iterXYSeries(device_id, x_key, y_key, **kwargs))
+
+def iterManyReportSeries(report_ids: Iterable[str]):
+    """
+    Reads the rows of several reports with one query over the partitions within
+    their time span, through the report index, ordered by report, series and time.
+    Yields (report_id, device_id, key, rows) per series of every report, rows
+    yields (t, value) floats of the numeric rows, text values are left out.
+    Consume rows before the next series.
+    """
+    report_ids = list(dict.fromkeys(report_ids))
+    if not report_ids:
+        return
+    con = getDB()
+    placeholders = ",".join("?" * len(report_ids))
+    ts_from, ts_to = con.execute(
+        f"SELECT MIN(first_sec), MAX(last_sec) FROM reports WHERE report_id IN ({placeholders})",
+        report_ids,
+    ).fetchone()
+    if ts_from is None:
+        return
+    names = {
+        series_id: (device_id, key)
+        for series_id, device_id, key in con.execute(
+            f"""
+            SELECT id, device_id, key FROM series
+            WHERE id IN (SELECT series_id FROM report_series WHERE report_id IN ({placeholders}))
+            """,
+            report_ids,
+        )
+    }
+    sql, params = _unionPartitions(
+        f"""
+        SELECT report_id, series_id, ts_sec, ts_nsec, {NUMERIC_VALUE}
+        FROM {{table}}
+        WHERE report_id IN ({placeholders}) AND report_id != '' AND value_text IS NULL
+        """,
+        report_ids,
+        ts_from,
+        ts_to,
+    )
+    if sql is None:
+        return
+    # every partition delivers its rows in report index order, SQLite merges them without sorting
+    rows = _iterCursor(con.execute(sql + " ORDER BY 1, 2, 3, 4", params))
+    for (report_id, series_id), group in itertools.groupby(rows, key=operator.itemgetter(0, 1)):
+        if series_id not in names:  # written after the lookup above
+            names[series_id] = con.execute("SELECT device_id, key FROM series WHERE id = ?", (series_id,)).fetchone()
+        yield (report_id, *names[series_id], ((r[2] + r[3] * 1e-9, r[4]) for r in group))
+
+def iterTimeSeriesViaReportId(report_id: str, device_id: str = None):
+    """
+    Yields (ts_sec, ts_nsec, device_id, key, value, report_id) of one report in time order,
+    without device_id in the rows if device_id is given.
+    Only the partitions within the time span of the report are read, via their report index.
+    """
+    con = getDB()
+    span = con.execute("SELECT first_sec, last_sec FROM reports WHERE report_id = ?", (report_id,)).fetchone()
+    if span is None:
+        return
+    if device_id is None:
+        yield from _queryPartitions(
+            con,
             """
-            SELECT ts_sec, ts_nsec, key,
-                   COALESCE(value_num, value_int, value_text, value_bool) AS value,
-                   report_id
-            FROM measurements
-            WHERE report_id = ?
-              AND device_id = ?
-            ORDER BY ts_sec, ts_nsec
+            SELECT m.ts_sec, m.ts_nsec, s.device_id, s.key,
+                   COALESCE(m.value_num, m.value_int, m.value_text, m.value_bool) AS value,
+                   m.report_id
+            FROM {table} m
+            JOIN series s ON s.id = m.series_id
+            WHERE m.report_id = ? AND m.report_id != ''
+            ORDER BY m.ts_sec, m.ts_nsec
             """,
-            (report_id, device_id),
-        ).fetchall()
+            (report_id,),
+            *span,
+        )
+        return
+    yield from _queryPartitions(
+        con,
+        """
+        SELECT m.ts_sec, m.ts_nsec, s.key,
+               COALESCE(m.value_num, m.value_int, m.value_text, m.value_bool) AS value,
+               m.report_id
+        FROM {table} m
+        JOIN series s ON s.id = m.series_id
+        WHERE m.report_id = ? AND m.report_id != ''
+          AND s.device_id = ?
+        ORDER BY m.ts_sec, m.ts_nsec
+        """,
+        (report_id, device_id),
+        *span,
+    )
+
+def getTimeSeriesViaReportId(report_id: str, device_id: str = None):
+    return list(iterTimeSeriesViaReportId(report_id, device_id))
+
+def iterAllDataWithAReportId():
+    """Yields (ts_sec, ts_nsec, device_id, key, value, report_id) of every row with a report id in time order."""
+    yield from _queryPartitions(
+        getDB(),
+        """
+        SELECT m.ts_sec, m.ts_nsec, s.device_id, s.key,
+            COALESCE(m.value_num, m.value_int, m.value_text, m.value_bool) AS value,
+            m.report_id
+        FROM {table} m
+        JOIN series s ON s.id = m.series_id
+        WHERE m.report_id IS NOT NULL AND m.report_id != ''
+        ORDER BY m.ts_sec, m.ts_nsec
+        """
+    )
 
 def getAllDataWithAReportId():
-    with getDB() as con:
-        return con.execute(
-            """
-            SELECT ts_sec, ts_nsec, device_id, key,
-                COALESCE(value_num, value_int, value_text, value_bool) AS value,
-                report_id
-            FROM measurements
-            WHERE report_id IS NOT NULL AND report_id != ''
-            ORDER BY ts_sec, ts_nsec
-            """
-        ).fetchall()
+    return list(iterAllDataWithAReportId())
 
 def removeDeviceData(device_id):
+    flushMeasurements()
     with getDB() as con:
-        con.execute("DELETE FROM measurements WHERE device_id = ?", (device_id,))
+        for name in _partitionsFor():
+            con.execute(
+                f"DELETE FROM {name} WHERE series_id IN (SELECT id FROM series WHERE device_id = ?)",
+                (device_id,)
+            )
+        con.execute("DELETE FROM rollups WHERE series_id IN (SELECT id FROM series WHERE device_id = ?)", (device_id,))
+        report_ids = [
+            row[0] for row in con.execute(
+                "SELECT DISTINCT report_id FROM report_series WHERE series_id IN (SELECT id FROM series WHERE device_id = ?)",
+                (device_id,),
+            ).fetchall()
+        ]
+        con.execute("DELETE FROM report_series WHERE series_id IN (SELECT id FROM series WHERE device_id = ?)", (device_id,))
+        _rebuildReports(con, report_ids)
+        con.execute("DELETE FROM series WHERE device_id = ?", (device_id,))
+        con.execute("DELETE FROM retention_policies WHERE device_id = ?", (device_id,))
+    _forgetSeries(device_id)
+    _forgetRetentionPolicies()
+    bumpGeneration(MEASUREMENTS_GENERATION)
 
 def countDeviceData(device_id):
+    """Raw rows of the device, read from the series catalog."""
     with getDB() as con:
-        row = con.execute("SELECT COUNT(*) FROM measurements WHERE device_id = ?", (device_id,)).fetchone()
-        return row[0] if row else 0
+        return con.execute(
+            "SELECT COALESCE(SUM(row_count), 0) FROM series WHERE device_id = ?",
+            (device_id,),
+        ).fetchone()[0]
 
 def updateDeviceId(old_id, new_id):
+    """Moves all series of old_id to new_id. Keys both devices have are merged, on equal timestamps new_id wins."""
+    flushMeasurements()
     with getDB() as con:
-        con.execute("UPDATE measurements SET device_id = ? WHERE device_id = ?", (new_id, old_id))
+        old_series = con.execute("SELECT id, key FROM series WHERE device_id = ?", (old_id,)).fetchall()
+        for old_series_id, key in old_series:
+            row = con.execute("SELECT id FROM series WHERE device_id = ? AND key = ?", (new_id, key)).fetchone()
+            if row is None:
+                con.execute("UPDATE series SET device_id = ? WHERE id = ?", (new_id, old_series_id))
+                continue
+            for name in _partitionsFor():
+                con.execute(f"UPDATE OR IGNORE {name} SET series_id = ? WHERE series_id = ?", (row[0], old_series_id))
+                con.execute(f"DELETE FROM {name} WHERE series_id = ?", (old_series_id,))
+            con.execute("DELETE FROM series WHERE id = ?", (old_series_id,))
+            con.execute("DELETE FROM rollups WHERE series_id IN (?, ?)", (old_series_id, row[0]))
+            _rebuildRollups(con, row[0])
+            _rebuildSeriesCatalog(con, row[0])
+            report_ids = [
+                r[0] for r in con.execute(
+                    "SELECT DISTINCT report_id FROM report_series WHERE series_id IN (?, ?)",
+                    (old_series_id, row[0]),
+                ).fetchall()
+            ]
+            con.execute("DELETE FROM report_series WHERE series_id = ?", (old_series_id,))
+            for report_id in report_ids:
+                _rebuildReportSeries(con, report_id, row[0])
+            _rebuildReports(con, report_ids)
+        # policies of new_id win as well
+        con.execute("UPDATE OR IGNORE retention_policies SET device_id = ? WHERE device_id = ?", (new_id, old_id))
+        con.execute("DELETE FROM retention_policies WHERE device_id = ?", (old_id,))
+    _forgetSeries(old_id)
+    _forgetSeries(new_id)
+    _forgetRetentionPolicies()
+    bumpGeneration(MEASUREMENTS_GENERATION)
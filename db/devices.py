@@ -1,20 +1,215 @@
+import atexit
+import os
 import sqlite3
+import threading
 from pathlib import Path
 
 from utilities.time import Timestamp, getTimeStamp
 from db.helper import printDbInfo, enableWalMode
+from db.pool import ConnectionPool
+from db.shared import bumpGeneration, onGenerationChange
 
 DB_FILE = Path(__file__).parent / "devices.db"
 SCHEMA_FILE = Path(__file__).parent / "schema_devices.sql"
 
+# Seconds between two writes of the buffered last_seen heartbeats.
+LAST_SEEN_FLUSH_INTERVAL = 15.0
+# Cache generation (see db/shared.py) of the device registry.
+DEVICES_GENERATION = "devices"
+# Cache generation bumped by a heartbeat flush, the other processes then read last_seen again.
+LAST_SEEN_GENERATION = "last_seen"
+
+_POOL = ConnectionPool(DB_FILE)
+
 def getDB():
-    return sqlite3.connect(DB_FILE)
+    return _POOL.connection()
 
 def initDB():
     with getDB() as con:
         con.executescript(SCHEMA_FILE.read_text())
         printDbInfo(DB_FILE, con, SCHEMA_FILE)
         enableWalMode(con)
+    _REGISTRY.load()
+
+DEVICE_COLUMNS = ["id", "name", "info", "device", "last_seen"]
+
+class DeviceRegistry:
+    """
+    In-memory copy of the devices table so existence checks and name/metadata
+    lookups on the hot API paths are dictionary hits instead of queries.
+    Every function in this module that changes a device refreshes its entry.
+    """
+    def __init__(self):
+        self._devices = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    def load(self):
+        with getDB() as con:
+            rows = con.execute(f"SELECT {', '.join(DEVICE_COLUMNS)} FROM devices").fetchall()
+        devices = {row[0]: dict(zip(DEVICE_COLUMNS, row)) for row in rows}
+        # keep heartbeats that are not written to the table yet
+        for device_id, seconds in _HEARTBEATS.pending().items():
+            device = devices.get(device_id)
+            if device:
+                device["last_seen"] = max(device["last_seen"], seconds)
+        with self._lock:
+            self._devices = devices
+            self.loads += 1
+
+    def _entries(self):
+        devices = self._devices
+        if devices is None:
+            self.load()
+            devices = self._devices
+        return devices
+
+    def get(self, device_id):
+        device = self._entries().get(device_id)
+        if device is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return device
+
+    def refresh(self, device_id):
+        with getDB() as con:
+            row = con.execute(
+                f"SELECT {', '.join(DEVICE_COLUMNS)} FROM devices WHERE id = ?",
+                (device_id,)
+            ).fetchone()
+        devices = self._entries()
+        with self._lock:
+            if row:
+                device = dict(zip(DEVICE_COLUMNS, row))
+                cached = devices.get(device_id)
+                if cached:
+                    # keep heartbeats that are not written to the table yet
+                    device["last_seen"] = max(device["last_seen"], cached["last_seen"])
+                devices[device_id] = device
+            else:
+                devices.pop(device_id, None)
+
+    def reloadLastSeen(self):
+        """Takes the newer last_seen values other processes flushed to the table."""
+        if self._devices is None:
+            return
+        with getDB() as con:
+            rows = con.execute("SELECT id, last_seen FROM devices").fetchall()
+        devices = self._devices
+        with self._lock:
+            for device_id, last_seen in rows:
+                device = devices.get(device_id)
+                if device is not None and last_seen > device["last_seen"]:
+                    device["last_seen"] = last_seen
+
+    def setLastSeen(self, device_id, last_seen):
+        device = self._entries().get(device_id)
+        if device is not None:
+            device["last_seen"] = last_seen
+
+    def stats(self):
+        devices = self._devices
+        return {
+            "devices": len(devices) if devices is not None else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "loads": self.loads,
+        }
+
+_REGISTRY = DeviceRegistry()
+# devices changed by another server process
+onGenerationChange(DEVICES_GENERATION, _REGISTRY.load)
+# heartbeats flushed by another server process
+onGenerationChange(LAST_SEEN_GENERATION, _REGISTRY.reloadLastSeen)
+
+def _deviceChanged(device_id):
+    _REGISTRY.refresh(device_id)
+    bumpGeneration(DEVICES_GENERATION)
+
+def getDeviceRegistryStats():
+    return _REGISTRY.stats()
+
+class HeartbeatBuffer:
+    """
+    Collects last_seen heartbeats in memory and writes them to the devices
+    table every LAST_SEEN_FLUSH_INTERVAL seconds with one executemany.
+    Several heartbeats of one device between two flushes cost one UPDATE.
+    Every server process records the heartbeats of the requests it serves, the
+    others see them after its next flush through LAST_SEEN_GENERATION.
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.recorded = 0
+        self.flushes = 0
+        self.written = 0
+
+    def record(self, device_id, seconds):
+        with self._lock:
+            self._pending[device_id] = seconds
+            self.recorded += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="last-seen-flusher", daemon=True)
+                self._thread.start()
+
+    def pending(self):
+        with self._lock:
+            return dict(self._pending)
+
+    def discard(self, device_id):
+        with self._lock:
+            self._pending.pop(device_id, None)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        with getDB() as con:
+            changed = con.executemany(
+                "UPDATE devices SET last_seen = ? WHERE id = ? AND last_seen < ?",
+                [(seconds, device_id, seconds) for device_id, seconds in pending.items()]
+            ).rowcount
+        self.flushes += 1
+        self.written += len(pending)
+        if changed > 0:
+            bumpGeneration(LAST_SEEN_GENERATION)
+
+    def _run(self):
+        stop = threading.Event()
+        while not stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Failed to write last_seen heartbeats: {e}")
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {"pending": pending, "recorded": self.recorded, "flushes": self.flushes, "written": self.written}
+
+    def _resetAfterFork(self):
+        # heartbeats of the parent are flushed by the parent
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+_HEARTBEATS = HeartbeatBuffer(LAST_SEEN_FLUSH_INTERVAL)
+
+def flushLastSeen():
+    _HEARTBEATS.flush()
+
+def getHeartbeatStats():
+    return _HEARTBEATS.stats()
+
+atexit.register(flushLastSeen)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_HEARTBEATS._resetAfterFork)
 
 def addNewDevice(device_id, name, info, device):
     timestamp = getTimeStamp()
@@ -25,38 +220,40 @@ def addNewDevice(device_id, name, info, device):
             "INSERT INTO devices (id, name, info, device, last_seen) VALUES (?, ?, ?, ?, ?)",
             (device_id, name, info, device, timestamp.seconds)
         )
+    _deviceChanged(device_id)
 
 def updateLastSeen(device_id):
+    """Buffered, the devices table is updated by the next heartbeat flush."""
     timestamp = getTimeStamp()
-    with getDB() as con:
-        con.execute(
-            "UPDATE devices SET last_seen = ? WHERE id = ?",
-            (timestamp.seconds, device_id)
-        )
+    _HEARTBEATS.record(device_id, timestamp.seconds)
+    _REGISTRY.setLastSeen(device_id, timestamp.seconds)
 
 def getAllDevices():
     with getDB() as con:
-        return con.execute(
+        rows = con.execute(
             "SELECT id, name, last_seen FROM devices ORDER BY last_seen DESC"
         ).fetchall()
+    pending = _HEARTBEATS.pending()
+    if not pending:
+        return rows
+    # merge heartbeats of this process that are not written yet, those of the
+    # other processes are in the table after their next flush
+    rows = [
+        (device_id, name, max(last_seen, pending.get(device_id, last_seen)))
+        for device_id, name, last_seen in rows
+    ]
+    rows.sort(key=lambda row: row[2], reverse=True)
+    return rows
 
 def deviceExists(device_id):
-    with getDB() as con:
-        cur = con.execute(
-            "SELECT 1 FROM devices WHERE id = ?",
-            (device_id,)
-        )
-        return cur.fetchone() is not None
+    return _REGISTRY.get(device_id) is not None
 
 def getDevice(device_id):
-    with getDB() as con:
-        row = con.execute(
-            "SELECT id, name, info, device, last_seen FROM devices WHERE id = ?",
-            (device_id,)
-        ).fetchone()
-        if row:
-            return dict(zip(["id", "name", "info", "device", "last_seen"], row))
-        return None
+    """last_seen includes the heartbeats of other processes up to their last flush."""
+    device = _REGISTRY.get(device_id)
+    if device:
+        return dict(device)
+    return None
 
 def updateDeviceName(device_id, new_name):
     with getDB() as con:
@@ -64,6 +261,7 @@ def updateDeviceName(device_id, new_name):
             "UPDATE devices SET name = ? WHERE id = ?",
             (new_name, device_id)
         )
+    _deviceChanged(device_id)
 
 def updateDevice(device_id, name, info, device):
     with getDB() as con:
@@ -71,7 +269,10 @@ def updateDevice(device_id, name, info, device):
             "UPDATE devices SET name = ?, info = ?, device = ? WHERE id = ?",
             (name, info, device, device_id)
         )
+    _deviceChanged(device_id)
 
 def removeDevice(device_id):
+    _HEARTBEATS.discard(device_id)
     with getDB() as con:
         con.execute("DELETE FROM devices WHERE id = ?", (device_id,))
+    _deviceChanged(device_id)
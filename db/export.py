@@ -0,0 +1,142 @@
+import sqlite3
+from typing import Optional
+
+from db.pool import BUSY_TIMEOUT_MS
+import db.device_data as device_data_db
+import db.mqtt as mqtt_db
+
+# Rows fetched from SQLite per step, exports never hold more than this many rows.
+EXPORT_FETCH_ROWS = 5000
+
+# (column name, type) of the exported rows, see utilities/export.py for the types.
+MEASUREMENT_COLUMNS = (
+    ("device_id", "str"), ("key", "str"), ("ts_sec", "int"), ("ts_nsec", "int"),
+    ("value", "any"), ("report_id", "str"),
+)
+# Parquet needs one type per column, so numeric and text values get a column each.
+MEASUREMENT_TYPED_COLUMNS = (
+    ("device_id", "str"), ("key", "str"), ("ts_sec", "int"), ("ts_nsec", "int"),
+    ("value", "float"), ("value_text", "str"), ("report_id", "str"),
+)
+PAYLOAD_COLUMNS = (
+    ("device_id", "str"), ("topic_name", "str"), ("ts_sec", "int"), ("ts_nsec", "int"),
+    ("payload", "str"), ("valid_until_sec", "int"), ("valid_until_nsec", "int"),
+)
+
+def _connectReadOnly(db_file):
+    """
+    Own read-only connection per export. Every query reads its own WAL snapshot and
+    no transaction spans the whole export, so the writers and checkpoints never wait for it.
+    """
+    con = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True, check_same_thread=False)
+    con.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    return con
+
+def _fetchBatches(cursor):
+    while True:
+        rows = cursor.fetchmany(EXPORT_FETCH_ROWS)
+        if not rows:
+            return
+        yield rows
+
+def _inFilter(column, values, conditions, params):
+    if values:
+        conditions.append(f"{column} IN ({','.join('?' * len(values))})")
+        params.extend(values)
+
+def iterMeasurementBatches(
+    device_ids: Optional[list[str]] = None,
+    keys: Optional[list[str]] = None,
+    ts_from: Optional[int] = None,
+    ts_to: Optional[int] = None,
+    typed: bool = False,
+):
+    """
+    Yields lists of measurement rows laid out like MEASUREMENT_COLUMNS, or
+    MEASUREMENT_TYPED_COLUMNS if typed. Partitions are read oldest first, inside
+    a partition the rows are ordered by series and time (primary key order, no sorting).
+    """
+    if typed:
+        value = "CAST(COALESCE(m.value_num, m.value_int, m.value_bool) AS REAL), m.value_text"
+    else:
+        value = "COALESCE(m.value_num, m.value_int, m.value_text, m.value_bool)"
+    conditions = []
+    params = []
+    _inFilter("s.device_id", device_ids, conditions, params)
+    _inFilter("s.key", keys, conditions, params)
+    if ts_from is not None:
+        conditions.append("m.ts_sec >= ?")
+        params.append(int(ts_from))
+    if ts_to is not None:
+        conditions.append("m.ts_sec <= ?")
+        params.append(int(ts_to))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    con = _connectReadOnly(device_data_db.DB_FILE)
+    try:
+        names = [
+            row[0] for row in con.execute(
+                """
+                SELECT name FROM partitions
+                WHERE (?1 IS NULL OR end_sec > ?1) AND (?2 IS NULL OR start_sec <= ?2)
+                ORDER BY start_sec
+                """,
+                (None if ts_from is None else int(ts_from), None if ts_to is None else int(ts_to)),
+            ).fetchall()
+        ]
+        for name in names:
+            yield from _fetchBatches(con.execute(
+                f"""
+                SELECT s.device_id, s.key, m.ts_sec, m.ts_nsec, {value}, m.report_id
+                FROM {name} m
+                JOIN series s ON s.id = m.series_id
+                {where}
+                ORDER BY m.series_id, m.ts_sec, m.ts_nsec
+                """,
+                params,
+            ))
+    finally:
+        con.close()
+
+def iterPayloadBatches(
+    device_ids: Optional[list[str]] = None,
+    topic_names: Optional[list[str]] = None,
+    ts_from: Optional[int] = None,
+    ts_to: Optional[int] = None,
+):
+    """
+    Yields lists of MQTT payload rows laid out like PAYLOAD_COLUMNS, ordered by topic and time.
+    A row covers its time up to valid_until, rows that overlap [ts_from, ts_to] are exported.
+    """
+    conditions = []
+    params = []
+    _inFilter("t.device_id", device_ids, conditions, params)
+    _inFilter("t.topic_name", topic_names, conditions, params)
+    if ts_from is not None:
+        conditions.append("p.valid_until_seconds >= ?")
+        params.append(int(ts_from))
+    if ts_to is not None:
+        conditions.append("p.time_seconds <= ?")
+        params.append(int(ts_to))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    con = _connectReadOnly(mqtt_db.DB_FILE)
+    try:
+        batches = _fetchBatches(con.execute(
+            f"""
+            SELECT t.device_id, t.topic_name, p.time_seconds, p.time_nanoseconds, p.payload, p.encoding,
+                   p.valid_until_seconds, p.valid_until_nanoseconds
+            FROM topic_payloads p
+            JOIN topics t ON t.id = p.topic_id
+            {where}
+            ORDER BY p.topic_id, p.time_seconds, p.time_nanoseconds
+            """,
+            params,
+        ))
+        for rows in batches:
+            yield [
+                (device_id, topic_name, seconds, nanoseconds, mqtt_db.decodeStoredPayload(payload, encoding), until_seconds, until_nanoseconds)
+                for device_id, topic_name, seconds, nanoseconds, payload, encoding, until_seconds, until_nanoseconds in rows
+            ]
+    finally:
+        con.close()
@@ -12,7 +12,8 @@ def enableWalMode(connection) -> None:
     cur.execute("PRAGMA synchronous=NORMAL;")
     print("Synchronous set to NORMAL")
 
-def printDbInfo(DB_FILE, connection, SCHEMA_FILE) -> None:
+def printDbInfo(DB_FILE, connection, SCHEMA_FILE, dynamic_table_prefixes=()) -> None:
+    """dynamic_table_prefixes: tables created at runtime (e.g. partitions) which are not in the schema file."""
     if not current_app.debug:
         return
 
@@ -92,6 +93,7 @@ def printDbInfo(DB_FILE, connection, SCHEMA_FILE) -> None:
 
     missing_tables = expected_tables - actual_tables
     extra_tables = actual_tables - expected_tables - {"sqlite_sequence"}
+    extra_tables = {t for t in extra_tables if not t.startswith(tuple(dynamic_table_prefixes))}
 
     if missing_tables:
         error(f"Missing tables: {missing_tables}")
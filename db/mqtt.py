@@ -1,22 +1,99 @@
 import sqlite3
+import itertools
 import json
+import re
+import threading
+import time
+import zlib
 from pathlib import Path
 from utilities.time import Timestamp, getTimeStamp
 from db.helper import printDbInfo, enableWalMode
+from db.pool import ConnectionPool
+from db.shared import bumpGeneration
+
+try:
+    import zstandard
+except ImportError:  # optional, only needed for PAYLOAD_COMPRESSION = "zstd"
+    zstandard = None
 
 DB_FILE = Path(__file__).parent / "mqtt.db"
 SCHEMA_FILE = Path(__file__).parent / "schema_mqtt.sql"
 
+# Payload history kept per topic when no payload_retention row matches, 0 = no limit.
+# Nothing is deleted unless a limit is set here or with a retention policy.
+PAYLOAD_MAX_ROWS = 0
+PAYLOAD_MAX_DAYS = 0
+# Store a payload only when it differs from the last stored one of its topic, a
+# repeated payload moves the valid_until time of that row forward instead.
+# False stores every received payload as its own row.
+PAYLOAD_CHANGE_ONLY = False
+# Payloads with at least this many bytes of JSON are stored compressed, 0 = never.
+PAYLOAD_COMPRESS_MIN_BYTES = 0
+# "zlib" or "zstd". zstd needs the zstandard package, also to read rows stored with it later.
+PAYLOAD_COMPRESSION = "zlib"
+# Cache generation (see db/shared.py) bumped when topics change, the MQTT
+# client process then syncs its state subscriptions.
+MQTT_TOPICS_GENERATION = "mqtt_topics"
+
+_POOL = ConnectionPool(DB_FILE, pragmas=["foreign_keys = ON"])
+
 def getDB():
-    con = sqlite3.connect(DB_FILE)
-    con.execute("PRAGMA foreign_keys = ON")
-    return con
+    return _POOL.connection()
 
 def initDB():
     with getDB() as con:
         con.executescript(SCHEMA_FILE.read_text())
+        migrateTopicTables(con)
+        migrateToChangeOnlyPayloads(con)
         printDbInfo(DB_FILE, con, SCHEMA_FILE)
         enableWalMode(con)
+    _LATEST.load()
+
+def migrateTopicTables(con):
+    """
+    Rebuilds topics and topic_schema with their current definition in the schema
+    file once (PRAGMA user_version 1). topics had a foreign key to devices, a table
+    of devices.db, so every insert failed; topic_schema allowed one key per topic.
+    """
+    if con.execute("PRAGMA user_version").fetchone()[0] >= 1:
+        return
+    schema = SCHEMA_FILE.read_text()
+    con.commit()
+    con.execute("PRAGMA foreign_keys = OFF")  # dropping the old tables must not cascade
+    try:
+        with con:
+            for table in (TOPICS_TABLE, TOPICS_SCHEMA_TABLE):
+                create = re.search(rf"CREATE TABLE IF NOT EXISTS {table} \(.*?\n\);", schema, re.S).group(0)
+                con.execute(create.replace(f"EXISTS {table} (", f"EXISTS {table}_new ("))
+                # duplicate keys of one topic could not be stored before, so OR IGNORE never drops rows
+                con.execute(f"INSERT OR IGNORE INTO {table}_new SELECT * FROM {table}")
+                con.execute(f"DROP TABLE {table}")
+                con.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+        con.executescript(schema)  # indexes of the dropped tables
+        con.execute("PRAGMA user_version = 1")
+    finally:
+        con.execute("PRAGMA foreign_keys = ON")
+
+def migrateToChangeOnlyPayloads(con):
+    """Adds valid_until and encoding to topic_payloads once (PRAGMA user_version 2), old rows are valid for their instant."""
+    if con.execute("PRAGMA user_version").fetchone()[0] >= 2:
+        return
+    with con:
+        columns = [row[1] for row in con.execute(f"PRAGMA table_info({TOPICS_TABLE_PAYLOADS})")]
+        for column, definition in (
+            ("valid_until_seconds", "INTEGER"),
+            ("valid_until_nanoseconds", "INTEGER"),
+            ("encoding", "TEXT"),
+        ):
+            if column not in columns:
+                con.execute(f"ALTER TABLE {TOPICS_TABLE_PAYLOADS} ADD COLUMN {column} {definition}")
+        con.execute(
+            f"""
+            UPDATE {TOPICS_TABLE_PAYLOADS} SET valid_until_seconds = time_seconds, valid_until_nanoseconds = time_nanoseconds
+            WHERE valid_until_seconds IS NULL
+            """
+        )
+        con.execute("PRAGMA user_version = 2")
 
 # ----------------------
 TOPICS_TABLE = "topics"
@@ -30,6 +107,7 @@ def addTopic(device_id, topic_name, has_set, has_state):
             (device_id, topic_name, has_set, has_state)
         )
         topic_id = con.execute(f"SELECT last_insert_rowid()").fetchone()[0]
+    bumpGeneration(MQTT_TOPICS_GENERATION)
     return topic_id
 
 def getTopicsForDevice(device_id):
@@ -55,6 +133,13 @@ def updateDeviceIdForTopics(old_device_id, new_device_id):
             f"UPDATE {TOPICS_TABLE} SET device_id = ? WHERE device_id = ?",
             (new_device_id, old_device_id)
         )
+        # payload retention policies of new_device_id win
+        con.execute(
+            f"UPDATE OR IGNORE {PAYLOAD_RETENTION_TABLE} SET device_id = ? WHERE device_id = ?",
+            (new_device_id, old_device_id)
+        )
+        con.execute(f"DELETE FROM {PAYLOAD_RETENTION_TABLE} WHERE device_id = ?", (old_device_id,))
+    bumpGeneration(MQTT_TOPICS_GENERATION)
 
 def getAllTopics():
     with getDB() as con:
@@ -75,6 +160,7 @@ def getTopic(topic_id):
 def deleteTopic(topic_id):
     with getDB() as con:
         con.execute(f"DELETE FROM {TOPICS_TABLE} WHERE id = ?", (topic_id,))
+    bumpGeneration(MQTT_TOPICS_GENERATION)
 
 # ----------------------
 TOPICS_SCHEMA_TABLE = "topic_schema"
@@ -120,13 +206,7 @@ def getAllTopicsForDevice(device_id):
             print(f"Error: Topic with id {topic_id} fount in {TOPICS_SCHEMA_TABLE} but not in {TOPICS_TABLE}. This should not happen.")
             continue
 
-        # Normalize enum_values from JSON string → list
-        for k in keys:
-            if k["enum_values"]:
-                try:
-                    k["enum_values"] = json.loads(k["enum_values"])
-                except Exception:
-                    k["enum_values"] = []
+        _decodeEnumValues(keys)
 
         topics.append({
             "id": topic_id,
@@ -138,6 +218,59 @@ def getAllTopicsForDevice(device_id):
 
     return topics
 
+def _decodeEnumValues(keys):
+    # Normalize enum_values from JSON string → list
+    for k in keys:
+        if k["enum_values"]:
+            try:
+                k["enum_values"] = json.loads(k["enum_values"])
+            except Exception:
+                k["enum_values"] = []
+
+SCHEMA_KEY_COLUMNS = ["id", "key_name", "value_type", "min_value", "max_value", "enum_values"]
+
+def getTopicRoutes(device_id=None, topic_name=None):
+    """
+    All topics (or those of one device, or one topic) with their keys in one query:
+    [{"id", "device_id", "name", "has_set", "has_state", "keys": [like getTopicSchema()]}, ...]
+    """
+    conditions = []
+    params = []
+    if device_id is not None:
+        conditions.append("t.device_id = ?")
+        params.append(device_id)
+    if topic_name is not None:
+        conditions.append("t.topic_name = ?")
+        params.append(topic_name)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    with getDB() as con:
+        rows = con.execute(
+            f"""
+            SELECT t.id, t.device_id, t.topic_name, t.has_set, t.has_state,
+                   s.id, s.key_name, s.value_type, s.min_value, s.max_value, s.enum_values
+            FROM {TOPICS_TABLE} t
+            LEFT JOIN {TOPICS_SCHEMA_TABLE} s ON s.topic_id = t.id
+            {where}
+            ORDER BY t.id, s.id
+            """,
+            params,
+        ).fetchall()
+    routes = []
+    for topic_id, group in itertools.groupby(rows, key=lambda row: row[0]):
+        group = list(group)
+        keys = [dict(zip(SCHEMA_KEY_COLUMNS, row[5:])) for row in group if row[5] is not None]
+        _decodeEnumValues(keys)
+        _, device, name, has_set, has_state = group[0][:5]
+        routes.append({
+            "id": topic_id,
+            "device_id": device,
+            "name": name,
+            "keys": keys,
+            "has_set": has_set,
+            "has_state": has_state,
+        })
+    return routes
+
 def deleteTopicSchema(topic_id):
     with getDB() as con:
         con.execute("DELETE FROM topic_schema WHERE id = ?", (topic_id,))
@@ -150,33 +283,350 @@ def deleteTopicSchemaForTopic(topic_id):
 TOPICS_TABLE_PAYLOADS = "topic_payloads"
 # ----------------------
 
+PAYLOAD_COLUMNS = ["time_seconds", "time_nanoseconds", "payload"]
+PAYLOAD_HISTORY_COLUMNS = PAYLOAD_COLUMNS + ["valid_until_seconds", "valid_until_nanoseconds"]
+
+def encodeStoredPayload(text):
+    """(stored value, encoding) of a JSON text, the compressed bytes if that pays off (see PAYLOAD_COMPRESS_MIN_BYTES)."""
+    if not PAYLOAD_COMPRESS_MIN_BYTES or len(text) < PAYLOAD_COMPRESS_MIN_BYTES:
+        return text, None
+    data = text.encode()
+    if PAYLOAD_COMPRESSION == "zstd":
+        if zstandard is None:
+            raise RuntimeError("PAYLOAD_COMPRESSION is zstd, install the zstandard package")
+        packed = zstandard.ZstdCompressor().compress(data)
+    else:
+        packed = zlib.compress(data)
+    if len(packed) >= len(data):
+        return text, None
+    return packed, PAYLOAD_COMPRESSION
+
+def decodeStoredPayload(value, encoding):
+    """The JSON text of a stored payload."""
+    if encoding is None:
+        return value
+    if encoding == "zlib":
+        return zlib.decompress(value).decode()
+    if encoding == "zstd":
+        if zstandard is None:
+            raise RuntimeError("payload is compressed with zstd, install the zstandard package")
+        return zstandard.ZstdDecompressor().decompress(value).decode()
+    raise ValueError(f"unknown payload encoding {encoding}")
+
+class LatestPayloads:
+    """
+    Latest payload (decoded) of every topic, so pages and the bulk API need no
+    ORDER BY ... LIMIT 1 query and no json.loads per topic. Warmed with one
+    windowed query, then kept current by addTopicPayload() of this process.
+    Rows other server processes stored (the MQTT client runs in one of them) are
+    read on the next lookup with one query for ids above the highest one seen.
+    A latest payload stays cached when the payload retention deletes its row.
+    The time is when the payload was first received (see PAYLOAD_CHANGE_ONLY).
+    """
+    def __init__(self):
+        self._latest = None  # topic_id -> {"time_seconds", "time_nanoseconds", "payload"}
+        self._max_id = 0
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.updates = 0
+        self.catch_ups = 0
+
+    def load(self):
+        with getDB() as con:
+            rows = con.execute(
+                f"""
+                SELECT topic_id, time_seconds, time_nanoseconds, payload, encoding, max_id FROM (
+                    SELECT topic_id, time_seconds, time_nanoseconds, payload, encoding,
+                           ROW_NUMBER() OVER (PARTITION BY topic_id ORDER BY time_seconds DESC, time_nanoseconds DESC, id DESC) AS position,
+                           MAX(id) OVER () AS max_id
+                    FROM {TOPICS_TABLE_PAYLOADS}
+                )
+                WHERE position = 1
+                """
+            ).fetchall()
+        latest = {
+            topic_id: dict(zip(PAYLOAD_COLUMNS, (seconds, nanoseconds, json.loads(decodeStoredPayload(payload, encoding)))))
+            for topic_id, seconds, nanoseconds, payload, encoding, _ in rows
+        }
+        with self._lock:
+            self._latest = latest
+            self._max_id = rows[0][5] if rows else 0
+            self.loads += 1
+
+    def _catchUp(self):
+        if self._latest is None:
+            self.load()
+            return
+        with getDB() as con:
+            rows = con.execute(
+                f"SELECT id, topic_id, time_seconds, time_nanoseconds, payload, encoding FROM {TOPICS_TABLE_PAYLOADS} WHERE id > ? ORDER BY id",
+                (self._max_id,)
+            ).fetchall()
+        if not rows:
+            return
+        with self._lock:
+            for row_id, topic_id, seconds, nanoseconds, payload, encoding in rows:
+                self._set(topic_id, seconds, nanoseconds, json.loads(decodeStoredPayload(payload, encoding)))
+            self._max_id = max(self._max_id, rows[-1][0])
+            self.catch_ups += 1
+
+    def _set(self, topic_id, seconds, nanoseconds, payload):
+        current = self._latest.get(topic_id)
+        if current is None or (seconds, nanoseconds) >= (current["time_seconds"], current["time_nanoseconds"]):
+            self._latest[topic_id] = {"time_seconds": seconds, "time_nanoseconds": nanoseconds, "payload": payload}
+
+    def record(self, topic_id, seconds, nanoseconds, payload):
+        """Called for a row this process stored, its id is left to _catchUp() so no row of others is skipped."""
+        if self._latest is None:
+            return
+        with self._lock:
+            self._set(topic_id, seconds, nanoseconds, payload)
+            self.updates += 1
+
+    def forget(self, topic_id):
+        if self._latest is not None:
+            with self._lock:
+                self._latest.pop(topic_id, None)
+
+    def get(self, topic_ids=None):
+        """{topic_id: {"time_seconds", "time_nanoseconds", "payload"}} of the given (default all) topics that have a payload."""
+        self._catchUp()
+        latest = self._latest
+        if topic_ids is None:
+            return dict(latest)
+        return {topic_id: latest[topic_id] for topic_id in topic_ids if topic_id in latest}
+
+    def stats(self):
+        latest = self._latest
+        return {
+            "topics": len(latest) if latest is not None else 0,
+            "max_id": self._max_id,
+            "loads": self.loads,
+            "updates": self.updates,
+            "catch_ups": self.catch_ups,
+        }
+
+_LATEST = LatestPayloads()
+
+def loadLatestPayloads():
+    _LATEST.load()
+
+def getLatestPayloadsStats():
+    return _LATEST.stats()
+
 def addTopicPayload(topic_id, payload):
+    """
+    Stores a received payload. With PAYLOAD_CHANGE_ONLY a payload equal to the last
+    stored one of the topic only moves the valid_until time of that row.
+    Returns True if a new row was stored.
+    """
     timestamp = getTimeStamp()
+    text = json.dumps(payload)
+    value, encoding = encodeStoredPayload(text)
     with getDB() as con:
+        if PAYLOAD_CHANGE_ONLY:
+            last = con.execute(
+                f"SELECT id, payload, encoding FROM {TOPICS_TABLE_PAYLOADS} WHERE topic_id = ? ORDER BY time_seconds DESC, time_nanoseconds DESC LIMIT 1",
+                (topic_id,)
+            ).fetchone()
+            # a row stored with other compression settings has to be decoded to compare
+            if last is not None and (last[1] == value if last[2] == encoding else decodeStoredPayload(last[1], last[2]) == text):
+                con.execute(
+                    f"UPDATE {TOPICS_TABLE_PAYLOADS} SET valid_until_seconds = ?, valid_until_nanoseconds = ? WHERE id = ?",
+                    (timestamp.seconds, timestamp.nanoseconds, last[0])
+                )
+                return False
         con.execute(
-            f"INSERT INTO {TOPICS_TABLE_PAYLOADS} (topic_id, time_seconds, time_nanoseconds, payload) VALUES (?, ?, ?, ?)",
-            (topic_id, timestamp.seconds, timestamp.nanoseconds, json.dumps(payload))
+            f"""
+            INSERT INTO {TOPICS_TABLE_PAYLOADS} (topic_id, time_seconds, time_nanoseconds, payload, valid_until_seconds, valid_until_nanoseconds, encoding)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (topic_id, timestamp.seconds, timestamp.nanoseconds, value, timestamp.seconds, timestamp.nanoseconds, encoding)
         )
+    _LATEST.record(topic_id, timestamp.seconds, timestamp.nanoseconds, payload)
+    return True
+
+def getLatestPayloads(topic_ids=None):
+    """{topic_id: {"time_seconds", "time_nanoseconds", "payload"}}, the payload decoded. See LatestPayloads."""
+    return _LATEST.get(topic_ids)
+
+def getLatestValidUntil(topic_ids):
+    """
+    {topic_id: (valid_until_seconds, valid_until_nanoseconds)} of the latest payload row,
+    the last time that payload was received. Read from the table, the valid_until
+    updates of PAYLOAD_CHANGE_ONLY do not reach the LatestPayloads cache of other processes.
+    """
+    topic_ids = list(dict.fromkeys(topic_ids))
+    if not topic_ids:
+        return {}
+    with getDB() as con:
+        # one query, the latest row of every topic is one index seek
+        rows = con.execute(
+            f"""
+            SELECT t.id, p.valid_until_seconds, p.valid_until_nanoseconds
+            FROM {TOPICS_TABLE} t
+            JOIN {TOPICS_TABLE_PAYLOADS} p ON p.id = (
+                SELECT id FROM {TOPICS_TABLE_PAYLOADS} WHERE topic_id = t.id
+                ORDER BY time_seconds DESC, time_nanoseconds DESC LIMIT 1
+            )
+            WHERE t.id IN ({",".join("?" * len(topic_ids))})
+            """,
+            topic_ids
+        ).fetchall()
+    return {topic_id: (seconds, nanoseconds) for topic_id, seconds, nanoseconds in rows}
+
+def getLatestStates(device_ids=None):
+    """
+    Every topic of the given (default all) devices with its latest payload:
+    {device_id: {topic_name: {"topic_id", "has_set", "has_state", "time_seconds", "time_nanoseconds", "payload"}}},
+    time and payload are None for topics without a payload.
+    """
+    if device_ids:
+        routes = [route for device_id in dict.fromkeys(device_ids) for route in getTopicRoutes(device_id)]
+    else:
+        routes = getTopicRoutes()
+    latest = _LATEST.get()
+    empty = dict.fromkeys(PAYLOAD_COLUMNS)
+    states = {}
+    for route in routes:
+        states.setdefault(route["device_id"], {})[route["name"]] = {
+            "topic_id": route["id"],
+            "has_set": bool(route["has_set"]),
+            "has_state": bool(route["has_state"]),
+            **latest.get(route["id"], empty),
+        }
+    return states
+
+def _historyRow(row):
+    seconds, nanoseconds, payload, encoding, until_seconds, until_nanoseconds = row
+    return dict(zip(PAYLOAD_HISTORY_COLUMNS, (seconds, nanoseconds, decodeStoredPayload(payload, encoding), until_seconds, until_nanoseconds)))
 
 def getLatestPayload(topic_id):
     with getDB() as con:
         row = con.execute(
-            f"SELECT time_seconds, time_nanoseconds, payload FROM {TOPICS_TABLE_PAYLOADS} WHERE topic_id = ? ORDER BY time_seconds DESC, time_nanoseconds DESC LIMIT 1",
+            f"""
+            SELECT time_seconds, time_nanoseconds, payload, encoding, valid_until_seconds, valid_until_nanoseconds
+            FROM {TOPICS_TABLE_PAYLOADS} WHERE topic_id = ? ORDER BY time_seconds DESC, time_nanoseconds DESC LIMIT 1
+            """,
             (topic_id,)
         ).fetchone()
         if row:
-            return dict(zip(["time_seconds", "time_nanoseconds", "payload"], row))
+            return _historyRow(row)
         return None
 
 def getPayloadHistory(topic_id, limit=100):
+    """Newest first, every row is valid from its time to its valid_until time."""
     with getDB() as con:
         rows = con.execute(
-            f"SELECT time_seconds, time_nanoseconds, payload FROM {TOPICS_TABLE_PAYLOADS} WHERE topic_id = ? ORDER BY time_seconds DESC, time_nanoseconds DESC LIMIT ?",
+            f"""
+            SELECT time_seconds, time_nanoseconds, payload, encoding, valid_until_seconds, valid_until_nanoseconds
+            FROM {TOPICS_TABLE_PAYLOADS} WHERE topic_id = ? ORDER BY time_seconds DESC, time_nanoseconds DESC LIMIT ?
+            """,
             (topic_id, limit)
         ).fetchall()
-        return [dict(zip(["time_seconds", "time_nanoseconds", "payload"], r)) for r in rows]
+        return [_historyRow(r) for r in rows]
 
 def deletePayloads(topic_id):
     with getDB() as con:
         con.execute(f"DELETE FROM {TOPICS_TABLE_PAYLOADS} WHERE topic_id = ?", (topic_id,))
+    _LATEST.forget(topic_id)
 
+# ----------------------
+PAYLOAD_RETENTION_TABLE = "payload_retention"
+# ----------------------
+
+def _payloadRetention(policies, device_id, topic_name):
+    """(max_rows, max_days) of one topic, the most specific policy wins."""
+    for candidate in ((device_id, topic_name), (device_id, "*"), ("*", topic_name), ("*", "*")):
+        policy = policies.get(candidate)
+        if policy is not None:
+            return policy
+    return PAYLOAD_MAX_ROWS, PAYLOAD_MAX_DAYS
+
+def getPayloadRetention():
+    with getDB() as con:
+        rows = con.execute(
+            f"SELECT device_id, topic_name, max_rows, max_days FROM {PAYLOAD_RETENTION_TABLE} ORDER BY device_id, topic_name"
+        ).fetchall()
+        return [dict(zip(["device_id", "topic_name", "max_rows", "max_days"], r)) for r in rows]
+
+def setPayloadRetention(device_id="*", topic_name="*", max_rows=0, max_days=0):
+    """Keep at most max_rows payloads not older than max_days days per matching topic, 0 = no limit."""
+    if not device_id or not topic_name:
+        raise ValueError("device_id and topic_name must not be empty, use '*' to match all")
+    for name, value in (("max_rows", max_rows), ("max_days", max_days)):
+        if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+            raise ValueError(f"{name} must be an integer >= 0")
+    with getDB() as con:
+        con.execute(
+            f"""
+            INSERT INTO {PAYLOAD_RETENTION_TABLE} (device_id, topic_name, max_rows, max_days) VALUES (?, ?, ?, ?)
+            ON CONFLICT (device_id, topic_name) DO UPDATE SET max_rows = excluded.max_rows, max_days = excluded.max_days
+            """,
+            (device_id, topic_name, max_rows, max_days)
+        )
+
+def removePayloadRetention(device_id="*", topic_name="*"):
+    with getDB() as con:
+        con.execute(
+            f"DELETE FROM {PAYLOAD_RETENTION_TABLE} WHERE device_id = ? AND topic_name = ?",
+            (device_id, topic_name)
+        )
+
+def removePayloadRetentionForDevice(device_id):
+    with getDB() as con:
+        con.execute(f"DELETE FROM {PAYLOAD_RETENTION_TABLE} WHERE device_id = ?", (device_id,))
+
+def purgeExpiredPayloads(chunk_rows, pause, now=None):
+    """
+    Deletes payloads beyond the row and age limits of their topic, oldest first,
+    in transactions of at most chunk_rows rows with a pause in between.
+    Returns the number of deleted rows.
+    """
+    now = time.time() if now is None else now
+    con = getDB()
+    with con:
+        policies = {
+            (device_id, topic_name): (max_rows, max_days)
+            for device_id, topic_name, max_rows, max_days in con.execute(
+                f"SELECT device_id, topic_name, max_rows, max_days FROM {PAYLOAD_RETENTION_TABLE}"
+            )
+        }
+        topics = con.execute(f"SELECT id, device_id, topic_name FROM {TOPICS_TABLE}").fetchall()
+
+    deleted = 0
+    for topic_id, device_id, topic_name in topics:
+        max_rows, max_days = _payloadRetention(policies, device_id, topic_name)
+        # everything older than (seconds, nanoseconds) is deleted, a row
+        # still valid after the cutoff (PAYLOAD_CHANGE_ONLY) is kept
+        cutoff = (int(now) - max_days * 86400, 0) if max_days else None
+        if max_rows:
+            with con:
+                oldest_kept = con.execute(
+                    f"""
+                    SELECT time_seconds, time_nanoseconds FROM {TOPICS_TABLE_PAYLOADS}
+                    WHERE topic_id = ? ORDER BY time_seconds DESC, time_nanoseconds DESC LIMIT 1 OFFSET ?
+                    """,
+                    (topic_id, max_rows - 1)
+                ).fetchone()
+            if oldest_kept is not None and (cutoff is None or tuple(oldest_kept) > cutoff):
+                cutoff = tuple(oldest_kept)
+        if cutoff is None:
+            continue
+        while True:
+            with con:
+                count = con.execute(
+                    f"""
+                    DELETE FROM {TOPICS_TABLE_PAYLOADS} WHERE id IN (
+                        SELECT id FROM {TOPICS_TABLE_PAYLOADS}
+                        WHERE topic_id = ? AND (valid_until_seconds, valid_until_nanoseconds) < (?, ?)
+                        ORDER BY time_seconds, time_nanoseconds LIMIT ?
+                    )
+                    """,
+                    (topic_id, *cutoff, chunk_rows)
+                ).rowcount
+            deleted += count
+            if count < chunk_rows:
+                break
+            time.sleep(pause)
+    return deleted
@@ -0,0 +1,119 @@
+import os
+import sqlite3
+import threading
+import weakref
+
+# Number of prepared statements sqlite3 keeps per connection.
+STATEMENT_CACHE_SIZE = 256
+# Idle connections kept per database once their thread has finished.
+MAX_IDLE_CONNECTIONS = 8
+# Milliseconds a connection waits for a lock held by another connection.
+BUSY_TIMEOUT_MS = 5000
+
+_POOLS = weakref.WeakSet()
+
+class _ThreadConnection:
+    """Holds the connection bound to one thread. When the thread ends,
+    threading.local drops this holder and the connection goes back to the pool."""
+    def __init__(self, con):
+        self.con = con
+
+class ConnectionPool:
+    """
+    Long-lived SQLite connections for one database file.
+
+    Every thread gets its own connection on first use and keeps it for its
+    lifetime, so a request that calls several DAL functions reuses one
+    connection and its statement cache. Connections of finished threads are
+    parked and handed to the next new thread instead of being reopened.
+    PRAGMAs and the row factory are applied once when a connection is opened.
+    """
+    def __init__(self, db_file, pragmas=(), row_factory=None):
+        self.db_file = db_file
+        self.pragmas = tuple(pragmas)
+        self.row_factory = row_factory
+        self._lock = threading.Lock()
+        self._idle = []
+        self._local = threading.local()
+        self._generation = 0
+        self.opened = 0
+        self.reused = 0
+        _POOLS.add(self)
+
+    def _open(self):
+        con = sqlite3.connect(
+            self.db_file,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            check_same_thread=False,  # a parked connection moves to the next thread
+        )
+        con.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        con.execute("PRAGMA synchronous = NORMAL")
+        for pragma in self.pragmas:
+            con.execute(f"PRAGMA {pragma}")
+        if self.row_factory is not None:
+            con.row_factory = self.row_factory
+        self.opened += 1
+        return con
+
+    def _checkout(self):
+        with self._lock:
+            if self._idle:
+                self.reused += 1
+                return self._idle.pop()
+        return self._open()
+
+    def _checkin(self, con, generation):
+        if generation != self._generation:
+            return  # opened before a fork, belongs to the parent process
+        try:
+            if con.in_transaction:
+                con.rollback()
+        except sqlite3.Error:
+            con.close()
+            return
+        with self._lock:
+            if len(self._idle) < MAX_IDLE_CONNECTIONS:
+                self._idle.append(con)
+                return
+        con.close()
+
+    def connection(self):
+        holder = getattr(self._local, "holder", None)
+        if holder is None:
+            con = self._checkout()
+            holder = _ThreadConnection(con)
+            weakref.finalize(holder, self._checkin, con, self._generation)
+            self._local.holder = holder
+        return holder.con
+
+    def close(self):
+        """Close all parked connections and forget the calling thread's one."""
+        holder = getattr(self._local, "holder", None)
+        if holder is not None:
+            del self._local.holder
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for con in idle:
+            con.close()
+
+    def _resetAfterFork(self):
+        # connections must never be shared between processes
+        self._generation += 1
+        self._lock = threading.Lock()
+        self._idle = []
+        self._local = threading.local()
+
+    def stats(self):
+        with self._lock:
+            idle = len(self._idle)
+        return {"db": os.path.basename(self.db_file), "opened": self.opened, "reused": self.reused, "idle": idle}
+
+def getPoolStats():
+    return [pool.stats() for pool in list(_POOLS)]
+
+def _resetPoolsAfterFork():
+    for pool in list(_POOLS):
+        pool._resetAfterFork()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_resetPoolsAfterFork)
@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+
+from db.device_data import purgeExpiredMeasurements
+from db.mqtt import purgeExpiredPayloads
+
+# Seconds between two purge runs.
+PURGE_INTERVAL = 3600.0
+# Rows deleted per transaction and seconds to sleep between two of them,
+# so the writers never wait long for the database lock.
+PURGE_CHUNK_ROWS = 1000
+PURGE_PAUSE = 0.05
+
+class RetentionPurger:
+    """
+    Background thread that applies the retention policies of the measurement
+    and the MQTT payload databases every PURGE_INTERVAL seconds.
+    See purgeExpiredMeasurements() and purgeExpiredPayloads().
+    """
+    def __init__(self, interval, chunk_rows, pause):
+        self.interval = interval
+        self.chunk_rows = chunk_rows
+        self.pause = pause
+        self._thread = None
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.errors = 0
+        self.last_run = None
+        self.last_duration = None
+        self.raw_deleted = 0
+        self.rollups_deleted = 0
+        self.partitions_dropped = 0
+        self.payloads_deleted = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="retention-purger", daemon=True)
+                self._thread.start()
+
+    def runOnce(self):
+        started = time.monotonic()
+        measurements = purgeExpiredMeasurements(self.chunk_rows, self.pause)
+        self.raw_deleted += measurements["raw"]
+        self.rollups_deleted += measurements["rollups"]
+        self.partitions_dropped += len(measurements["partitions"])
+        self.payloads_deleted += purgeExpiredPayloads(self.chunk_rows, self.pause)
+        self.runs += 1
+        self.last_run = int(time.time())
+        self.last_duration = time.monotonic() - started
+
+    def _run(self):
+        while True:
+            try:
+                self.runOnce()
+            except Exception as e:
+                self.errors += 1
+                print(f"Failed to purge expired data: {e}")
+            time.sleep(self.interval)
+
+    def stats(self):
+        return {
+            "running": self._thread is not None,
+            "runs": self.runs,
+            "errors": self.errors,
+            "last_run": self.last_run,
+            "last_duration": self.last_duration,
+            "raw_deleted": self.raw_deleted,
+            "rollups_deleted": self.rollups_deleted,
+            "partitions_dropped": self.partitions_dropped,
+            "payloads_deleted": self.payloads_deleted,
+        }
+
+    def _resetAfterFork(self):
+        # the parent keeps purging
+        self._thread = None
+        self._lock = threading.Lock()
+
+_PURGER = RetentionPurger(PURGE_INTERVAL, PURGE_CHUNK_ROWS, PURGE_PAUSE)
+
+def startRetentionPurger():
+    _PURGER.start()
+
+def purgeNow():
+    """Runs one purge in the calling thread."""
+    _PURGER.runOnce()
+
+def getRetentionStats():
+    return _PURGER.stats()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_PURGER._resetAfterFork)
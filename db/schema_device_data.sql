@@ -1,18 +1,83 @@
-CREATE TABLE IF NOT EXISTS measurements (
+-- One row per (device, key) so measurements only store a small integer id.
+-- AUTOINCREMENT: rows of a removed series still queued by another process must
+-- never end up in a new series. The remaining columns are a catalog of the raw
+-- rows, maintained on insert and purge.
+CREATE TABLE IF NOT EXISTS series (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
     device_id   TEXT    NOT NULL,
-    ts_sec      INTEGER NOT NULL,
-    ts_nsec     INTEGER NOT NULL,
     key         TEXT    NOT NULL,
+    row_count   INTEGER NOT NULL DEFAULT 0,
+    first_sec   INTEGER,            -- oldest raw row
+    first_nsec  INTEGER,
+    last_sec    INTEGER,            -- newest raw row
+    last_nsec   INTEGER,
+    value_type  TEXT,               -- 'float', 'int', 'bool', 'text' or 'mixed'
+    min_value   REAL,               -- numeric values only, taken from the daily
+    max_value   REAL,               -- rollups so they outlive purged raw rows
+    UNIQUE (device_id, key)
+);
 
-    value_num   REAL,
-    value_int   INTEGER,
-    value_text  TEXT,
-    value_bool  INTEGER,
+-- Measurements are stored in one table per time range, named measurements_YYYYMM
+-- after the first month they hold. See PARTITION_SCHEMA in device_data.py.
+CREATE TABLE IF NOT EXISTS partitions (
+    name        TEXT    PRIMARY KEY,
+    start_sec   INTEGER NOT NULL,   -- inclusive
+    end_sec     INTEGER NOT NULL    -- exclusive
+);
 
-    report_id   TEXT,
+-- Downsampled numeric values per series and resolution, maintained on insert.
+-- See ROLLUP_RESOLUTIONS in device_data.py
+CREATE TABLE IF NOT EXISTS rollups (
+    series_id   INTEGER NOT NULL,
+    resolution  INTEGER NOT NULL,   -- bucket width in seconds
+    bucket      INTEGER NOT NULL,   -- bucket start, seconds since epoch
+    count       INTEGER NOT NULL,
+    sum         REAL    NOT NULL,
+    min         REAL    NOT NULL,
+    max         REAL    NOT NULL,
+    PRIMARY KEY (series_id, resolution, bucket)
+) WITHOUT ROWID;
 
-    PRIMARY KEY (device_id, ts_sec, ts_nsec, key)
+-- How long raw measurements are kept, '*' matches every device or key.
+-- The most specific row wins: (device, key), (device, '*'), ('*', key), ('*', '*').
+-- Rollups are kept after the raw rows are purged. See RAW_RETENTION_DAYS in device_data.py
+CREATE TABLE IF NOT EXISTS retention_policies (
+    device_id   TEXT    NOT NULL,
+    key         TEXT    NOT NULL,
+    raw_days    INTEGER NOT NULL,   -- 0 keeps raw rows forever
+    PRIMARY KEY (device_id, key)
 );
 
-CREATE INDEX IF NOT EXISTS idx_measurements_device_time
-ON measurements(device_id, ts_sec, ts_nsec);
\ No newline at end of file
+-- Catalog of the report ids, maintained on insert and purge, so listing reports
+-- or finding their rows never scans the measurements.
+CREATE TABLE IF NOT EXISTS reports (
+    report_id   TEXT    PRIMARY KEY,
+    row_count   INTEGER NOT NULL,
+    first_sec   INTEGER NOT NULL,
+    first_nsec  INTEGER NOT NULL,
+    last_sec    INTEGER NOT NULL,
+    last_nsec   INTEGER NOT NULL
+) WITHOUT ROWID;
+
+-- The series (device, key) of every report with their own counts and time spans.
+CREATE TABLE IF NOT EXISTS report_series (
+    report_id   TEXT    NOT NULL,
+    series_id   INTEGER NOT NULL,
+    row_count   INTEGER NOT NULL,
+    first_sec   INTEGER NOT NULL,
+    first_nsec  INTEGER NOT NULL,
+    last_sec    INTEGER NOT NULL,
+    last_nsec   INTEGER NOT NULL,
+    PRIMARY KEY (report_id, series_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_report_series_series ON report_series (series_id, report_id);
+
+-- Progress of bulk imports (importMeasurements() in device_data.py), committed with every batch
+-- so an interrupted import continues after the last committed row.
+CREATE TABLE IF NOT EXISTS imports (
+    source      TEXT    PRIMARY KEY,
+    rows_done   INTEGER NOT NULL,
+    finished    INTEGER NOT NULL DEFAULT 0,
+    updated_sec INTEGER NOT NULL
+);
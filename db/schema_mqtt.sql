@@ -5,8 +5,8 @@ CREATE TABLE IF NOT EXISTS topics (
     topic_name TEXT NOT NULL,
     has_set BOOL NOT NULL,  -- Whether the device listens to device_id/topic_name/set
     has_state BOOL NOT NULL, -- Whether the device publishes to device_id/topic_name/state
-    UNIQUE(device_id, topic_name),
-    FOREIGN KEY(device_id) REFERENCES devices(id) ON DELETE CASCADE
+    UNIQUE(device_id, topic_name)
+    -- no foreign key, devices are in devices.db. removeMqttForDevice() deletes the topics of a device.
 );
 
 -- Define data schema per topic (key/value types, min/max, enums)
@@ -18,7 +18,7 @@ CREATE TABLE IF NOT EXISTS topic_schema (
     min_value REAL,
     max_value REAL,
     enum_values TEXT,               -- JSON array for dropdowns, optional
-    UNIQUE(topic_id),
+    UNIQUE(topic_id, key_name),
     FOREIGN KEY(topic_id) REFERENCES topics(id) ON DELETE CASCADE
 );
 
@@ -28,7 +28,10 @@ CREATE TABLE IF NOT EXISTS topic_payloads (
     topic_id INTEGER NOT NULL,
     time_seconds INTEGER NOT NULL,
     time_nanoseconds INTEGER NOT NULL,
-    payload TEXT NOT NULL,          -- JSON string
+    payload TEXT NOT NULL,          -- JSON string, compressed JSON (BLOB) if encoding is set
+    valid_until_seconds INTEGER,    -- last time the same payload was received (PAYLOAD_CHANGE_ONLY in mqtt.py)
+    valid_until_nanoseconds INTEGER,
+    encoding TEXT,                  -- NULL, 'zlib' or 'zstd'
     FOREIGN KEY(topic_id) REFERENCES topics(id) ON DELETE CASCADE
 );
 
@@ -39,4 +42,14 @@ CREATE INDEX IF NOT EXISTS idx_schema_topic
 ON topic_schema(topic_id);
 
 CREATE INDEX IF NOT EXISTS idx_payloads_topic_time
-ON topic_payloads(topic_id, time_seconds, time_nanoseconds);
\ No newline at end of file
+ON topic_payloads(topic_id, time_seconds, time_nanoseconds);
+
+-- How much payload history is kept per topic, '*' matches every device or topic.
+-- The most specific row wins. See PAYLOAD_MAX_ROWS in mqtt.py
+CREATE TABLE IF NOT EXISTS payload_retention (
+    device_id TEXT NOT NULL,
+    topic_name TEXT NOT NULL,
+    max_rows INTEGER NOT NULL,      -- 0 = no row limit
+    max_days INTEGER NOT NULL,      -- 0 = no age limit
+    PRIMARY KEY (device_id, topic_name)
+);
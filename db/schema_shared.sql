@@ -0,0 +1,12 @@
+-- Small state shared by all server processes (e.g. the gunicorn workers)
+CREATE TABLE IF NOT EXISTS shared_values (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,            -- JSON encoded
+    updated_sec INTEGER NOT NULL
+) WITHOUT ROWID;
+
+-- Counter per in-memory cache, bumped by every process that changes the cached tables
+CREATE TABLE IF NOT EXISTS generations (
+    name TEXT PRIMARY KEY,
+    generation INTEGER NOT NULL
+) WITHOUT ROWID;
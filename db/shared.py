@@ -0,0 +1,174 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from db.helper import printDbInfo, enableWalMode
+from db.pool import ConnectionPool, BUSY_TIMEOUT_MS
+
+DB_FILE = Path(__file__).parent / "shared.db"
+SCHEMA_FILE = Path(__file__).parent / "schema_shared.sql"
+
+# Seconds between two generation checks of the background watcher.
+SHARED_STATE_POLL_INTERVAL = 1.0
+
+_POOL = ConnectionPool(DB_FILE)
+
+def getDB():
+    return _POOL.connection()
+
+def initDB():
+    with getDB() as con:
+        con.executescript(SCHEMA_FILE.read_text())
+        printDbInfo(DB_FILE, con, SCHEMA_FILE)
+        enableWalMode(con)
+    # caches loaded from now on are up to date with these generations
+    _WATCHER.check()
+
+# ----------------------
+# Shared values
+# ----------------------
+
+def setSharedValue(key, value):
+    """Stores a JSON serializable value for all server processes."""
+    with getDB() as con:
+        con.execute(
+            """
+            INSERT INTO shared_values (key, value, updated_sec) VALUES (?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET value = excluded.value, updated_sec = excluded.updated_sec
+            """,
+            (key, json.dumps(value), int(time.time())),
+        )
+
+def getSharedValue(key, default=None):
+    with getDB() as con:
+        row = con.execute("SELECT value FROM shared_values WHERE key = ?", (key,)).fetchone()
+    return json.loads(row[0]) if row else default
+
+def removeSharedValue(key):
+    with getDB() as con:
+        con.execute("DELETE FROM shared_values WHERE key = ?", (key,))
+
+# ----------------------
+# Cache generations
+# ----------------------
+
+def bumpGeneration(name):
+    """
+    Tells every server process that the tables behind the cache name changed.
+    Their callbacks registered with onGenerationChange() run on their next checkGenerations().
+    """
+    try:
+        with getDB() as con:
+            con.execute(
+                """
+                INSERT INTO generations (name, generation) VALUES (?, 1)
+                ON CONFLICT (name) DO UPDATE SET generation = generation + 1
+                """,
+                (name,),
+            )
+    except sqlite3.OperationalError:
+        # no server has created the shared database yet (e.g. a script run before), nobody to tell
+        if _tableExists("generations"):
+            raise
+
+def _tableExists(table):
+    with getDB() as con:
+        return con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+class GenerationWatcher:
+    """
+    Keeps the in-memory caches of this process in line with changes made by
+    other processes. check() costs one PRAGMA data_version on its own connection,
+    which only changes when another connection committed to the shared database,
+    and reads the generations table only then.
+    """
+    def __init__(self):
+        self._callbacks = {}
+        self._seen = None
+        self._con = None
+        self._data_version = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self.checks = 0
+        self.invalidations = 0
+
+    def register(self, name, callback):
+        self._callbacks.setdefault(name, []).append(callback)
+
+    def _connection(self):
+        if self._con is None:
+            self._con = sqlite3.connect(DB_FILE, check_same_thread=False)
+            self._con.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        return self._con
+
+    def check(self):
+        with self._lock:
+            self.checks += 1
+            con = self._connection()
+            data_version = con.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self._data_version:
+                return
+            self._data_version = data_version
+            generations = dict(con.execute("SELECT name, generation FROM generations").fetchall())
+            seen, self._seen = self._seen, generations
+            if seen is None:
+                return
+            for name, generation in generations.items():
+                if seen.get(name) == generation:
+                    continue
+                self.invalidations += 1
+                for callback in self._callbacks.get(name, ()):
+                    try:
+                        callback()
+                    except Exception as e:
+                        print(f"Failed to reload the {name} cache: {e}")
+
+    def start(self, interval):
+        """Checks every interval seconds, so idle processes (e.g. the MQTT client's) see changes too."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, args=(interval,), name="shared-state-watcher", daemon=True)
+                self._thread.start()
+
+    def _run(self, interval):
+        stop = threading.Event()
+        while not stop.wait(interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Failed to check the shared state: {e}")
+
+    def stats(self):
+        return {
+            "running": self._thread is not None,
+            "checks": self.checks,
+            "invalidations": self.invalidations,
+            "generations": dict(self._seen or {}),
+        }
+
+    def _resetAfterFork(self):
+        # the generations seen are kept, they belong to the caches the child inherited
+        self._con = None
+        self._data_version = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+_WATCHER = GenerationWatcher()
+
+def onGenerationChange(name, callback):
+    _WATCHER.register(name, callback)
+
+def checkGenerations():
+    _WATCHER.check()
+
+def startSharedStateWatcher():
+    _WATCHER.start(SHARED_STATE_POLL_INTERVAL)
+
+def getSharedStateStats():
+    return _WATCHER.stats()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_WATCHER._resetAfterFork)
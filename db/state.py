@@ -2,14 +2,15 @@ import sqlite3
 import json
 from pathlib import Path
 from db.helper import printDbInfo, enableWalMode
+from db.pool import ConnectionPool
 
 DB_FILE = Path(__file__).parent / "state.db"
 SCHEMA_FILE = Path(__file__).parent / "schema_state.sql"
 
+_POOL = ConnectionPool(DB_FILE, row_factory=sqlite3.Row)
+
 def getDB():
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return _POOL.connection()
 
 def initDB():
     """Initialize the database schema."""
@@ -19,10 +20,8 @@ def initDB():
         enableWalMode(con)
 
 def getDeviceState(device_id):
-    conn = getDB()
-    cur = conn.execute('SELECT * FROM state WHERE device_id = ?', (device_id,))
-    row = cur.fetchone()
-    conn.close()
+    with getDB() as con:
+        row = con.execute('SELECT * FROM state WHERE device_id = ?', (device_id,)).fetchone()
     if row:
         result = dict(row)
         if result['possible_states']:
@@ -31,9 +30,9 @@ def getDeviceState(device_id):
     return None
 
 def setDeviceState(device_id, current_state, possible_states, requested_state, requested_state_start, requested_state_expire):
-    conn = getDB()
     possible_states_json = json.dumps(possible_states)
-    conn.execute('''INSERT INTO state (device_id, current_state, possible_states, requested_state, requested_state_start, requested_state_expire)
+    with getDB() as con:
+        con.execute('''INSERT INTO state (device_id, current_state, possible_states, requested_state, requested_state_start, requested_state_expire)
                     VALUES (?, ?, ?, ?, ?, ?)
                     ON CONFLICT(device_id) DO UPDATE SET
                         current_state=excluded.current_state,
@@ -41,16 +40,12 @@ def setDeviceState(device_id, current_state, possible_states, requested_state, r
                         requested_state=excluded.requested_state,
                         requested_state_start=excluded.requested_state_start,
                         requested_state_expire=excluded.requested_state_expire''',
-                 (device_id, current_state, possible_states_json, requested_state, requested_state_start, requested_state_expire))
-    conn.commit()
-    conn.close()
+                    (device_id, current_state, possible_states_json, requested_state, requested_state_start, requested_state_expire))
 
 def updateRequestedDeviceState(device_id, requested_state, requested_state_start=None, requested_state_expire=None):
-    conn = getDB()
-    conn.execute('''UPDATE state SET requested_state=?, requested_state_start=?, requested_state_expire=? WHERE device_id=?''',
-                 (requested_state, requested_state_start, requested_state_expire, device_id))
-    conn.commit()
-    conn.close()
+    with getDB() as con:
+        con.execute('''UPDATE state SET requested_state=?, requested_state_start=?, requested_state_expire=? WHERE device_id=?''',
+                    (requested_state, requested_state_start, requested_state_expire, device_id))
 
 def deleteDeviceState(device_id):
     with getDB() as con:
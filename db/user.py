@@ -3,14 +3,17 @@ import json
 from pathlib import Path
 from flask import session
 from db.helper import printDbInfo
+from db.pool import ConnectionPool
 
 from utilities.password import generateSalt, hashPassword, verifyPassword
 
 DB_FILE = Path(__file__).parent / "users.db"
 SCHEMA_FILE = Path(__file__).parent / "schema_user.sql"
 
+_POOL = ConnectionPool(DB_FILE)
+
 def getDB():
-    return sqlite3.connect(DB_FILE)
+    return _POOL.connection()
 
 def initDB():
     """Initialize the database schema."""
@@ -0,0 +1,188 @@
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+import weakref
+
+from db.pool import BUSY_TIMEOUT_MS
+
+_WRITERS = weakref.WeakSet()
+
+class WriteTicket:
+    """Returned by BatchWriter.submit(). wait() blocks until the rows are committed."""
+    def __init__(self, rows):
+        self.rows = rows
+        self.error = None
+        self._done = threading.Event()
+
+    def _finish(self, error=None):
+        self.error = error
+        self._done.set()
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise RuntimeError("timeout while waiting for the database writer")
+        if self.error is not None:
+            raise self.error
+
+class BatchWriter:
+    """
+    One writer thread per database that drains a bounded queue of row batches.
+
+    Submissions that arrive while a transaction is being prepared are grouped
+    into one commit. A batch is committed once it holds max_batch_rows rows or
+    the oldest submission waited max_delay seconds; with max_delay=0 the writer
+    commits whatever queued up while the previous commit was running.
+    If the queue is full, submit() blocks for at most submit_timeout seconds and
+    then raises RuntimeError so callers can push back on the client.
+
+    write_function(con, rows) performs the inserts inside the open transaction.
+    One submission is never split across transactions.
+    """
+    def __init__(
+        self,
+        db_file,
+        write_function,
+        *,
+        max_batch_rows=5000,
+        max_delay=0.0,
+        max_queue=1000,
+        submit_timeout=5.0,
+        pragmas=(),
+    ):
+        self.db_file = db_file
+        self.write_function = write_function
+        self.max_batch_rows = max_batch_rows
+        self.max_delay = max_delay
+        self.max_queue = max_queue
+        self.submit_timeout = submit_timeout
+        self.pragmas = tuple(pragmas)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.commits = 0
+        self.rows_written = 0
+        self.failed = 0
+        self.rejected = 0
+        _WRITERS.add(self)
+
+    def _connect(self):
+        con = sqlite3.connect(self.db_file)
+        con.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        con.execute("PRAGMA synchronous = NORMAL")
+        for pragma in self.pragmas:
+            con.execute(f"PRAGMA {pragma}")
+        return con
+
+    def _ensureStarted(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f"writer-{os.path.basename(self.db_file)}", daemon=True)
+                self._thread.start()
+
+    def submit(self, rows) -> WriteTicket:
+        ticket = WriteTicket(rows)
+        self._ensureStarted()
+        try:
+            self._queue.put(ticket, timeout=self.submit_timeout)
+        except queue.Full:
+            self.rejected += 1
+            raise RuntimeError("database writer queue is full, try again later")
+        return ticket
+
+    def flush(self, timeout=None):
+        """Block until everything submitted so far is committed."""
+        if self._thread is None:
+            return
+        self.submit([]).wait(timeout)
+
+    def _collect(self, first):
+        batch = [first]
+        rows = len(first.rows)
+        deadline = time.monotonic() + self.max_delay
+        while rows < self.max_batch_rows:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    ticket = self._queue.get(timeout=remaining)
+                else:
+                    # past the deadline only take what is already waiting
+                    ticket = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(ticket)
+            rows += len(ticket.rows)
+        return batch
+
+    def _write(self, con, tickets):
+        rows = [row for ticket in tickets for row in ticket.rows]
+        with con:
+            if rows:
+                self.write_function(con, rows)
+        self.commits += 1
+        self.rows_written += len(rows)
+
+    def _run(self):
+        con = self._connect()
+        while True:
+            batch = self._collect(self._queue.get())
+            try:
+                self._write(con, batch)
+                for ticket in batch:
+                    ticket._finish()
+                continue
+            except Exception as e:
+                if len(batch) == 1:
+                    self.failed += 1
+                    batch[0]._finish(e)
+                    continue
+            # retry one by one so a bad submission only fails itself
+            for ticket in batch:
+                try:
+                    self._write(con, [ticket])
+                    ticket._finish()
+                except Exception as e:
+                    self.failed += 1
+                    ticket._finish(e)
+
+    def stats(self):
+        return {
+            "db": os.path.basename(self.db_file),
+            "queued": self._queue.qsize(),
+            "max_queue": self.max_queue,
+            "commits": self.commits,
+            "rows_written": self.rows_written,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+    def _resetAfterFork(self):
+        # the writer thread does not survive a fork, start a new one on demand
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+def getWriterStats():
+    return [writer.stats() for writer in list(_WRITERS)]
+
+def _flushAllWriters():
+    for writer in list(_WRITERS):
+        try:
+            writer.flush(timeout=writer.submit_timeout)
+        except Exception as e:
+            print(f"Failed to flush database writer for {writer.db_file}: {e}")
+
+def _resetWritersAfterFork():
+    for writer in list(_WRITERS):
+        writer._resetAfterFork()
+
+atexit.register(_flushAllWriters)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_resetWritersAfterFork)
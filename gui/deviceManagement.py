@@ -10,7 +10,7 @@ from db.state import getDeviceState, deleteDeviceState
 from db.device_data import countDeviceData, removeDeviceData, updateDeviceId
 from utilities.cache import setResetDevice
 from utilities.time import seconds2FormatedTime
-from db.mqtt import getAllTopicsForDevice, getLatestPayload
+from db.mqtt import getTopicRoutes, getLatestPayloads, getLatestValidUntil, PAYLOAD_CHANGE_ONLY
 from utilities.cache import hasMqttBrokerRunning
 from utilities.db import deleteDevice, mergeDeviceId
 
@@ -59,14 +59,20 @@ def register(app):
 
         mqtt_topics = []
         if show_mqtt:
-            for topic_row in getAllTopicsForDevice(device_id):
+            topic_rows = getTopicRoutes(device_id)
+            topic_ids = [topic_row["id"] for topic_row in topic_rows]
+            latest_payloads = getLatestPayloads(topic_ids)
+            # the time of a change-only row is when its payload first arrived
+            valid_until = getLatestValidUntil(topic_ids) if PAYLOAD_CHANGE_ONLY else {}
+            for topic_row in sorted(topic_rows, key=lambda row: row["name"]):
                 last_values = {}
                 message = ""
                 if topic_row["has_state"]:
-                    latest = getLatestPayload(topic_row["id"])
+                    latest = latest_payloads.get(topic_row["id"])
                     if latest:
-                        last_values = json.loads(latest["payload"])
-                        message = f"Last update: {seconds2FormatedTime(latest['time_seconds'])}"
+                        last_values = latest["payload"]
+                        last_update = valid_until.get(topic_row["id"], (latest["time_seconds"],))[0]
+                        message = f"Last update: {seconds2FormatedTime(last_update)}"
                     else:
                         message = "No payload received yet."
                 else:
@@ -1,14 +1,204 @@
-from flask import render_template, request, jsonify
+import math
+
+from flask import render_template, request, jsonify, Response
 from gui import login_required
 from db.devices import getAllDevices
 from db.device_data import (
     getAllKeys,
+    getSeriesCatalog,
     getAllReportIds,
-    getTimeSeries,
-    getXYSeries,
-    getTimeSeriesViaReportId,
-    getAllDataWithAReportId
+    getReportCatalog,
+    iterManyTimeSeries,
+    iterManyRollupSeries,
+    chooseResolutions,
+    iterXYSeries,
+    iterManyReportSeries,
 )
+from utilities.downsample import downsample, DOWNSAMPLE_METHODS
+from utilities.align import ALIGN_MODES
+from utilities.stream import streamJson, streamNdjson, RawJson
+from utilities.columns import toColumns, batched, shift, take, encodeColumnJson, encodeBinary
+
+RESPONSE_FORMATS = ("json", "ndjson", "columnar", "binary")
+
+def parseNumber(data, name):
+    """Optional number of a request as float, None if not given, ValueError if it is not a finite number."""
+    value = data.get(name)
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"invalid {name}")
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f"invalid {name}")
+    if not math.isfinite(number):
+        raise ValueError(f"invalid {name}")
+    return number
+
+def parseSeconds(data, name):
+    """Optional time in whole seconds of a request, see parseNumber()."""
+    seconds = parseNumber(data, name)
+    return None if seconds is None else int(seconds)
+
+def parseMaxPoints(data):
+    """Optional point budget per series, None for none or 0, ValueError if not an integer >= 0."""
+    value = data.get("max_points")
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError("invalid max_points")
+    try:
+        max_points = int(value)
+    except ValueError:
+        raise ValueError("invalid max_points")
+    if max_points < 0:
+        raise ValueError("invalid max_points")
+    return max_points or None
+
+def parseStrings(data, name):
+    """Required list of strings of a request."""
+    value = data.get(name)
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise ValueError(f"invalid {name}")
+    return value
+
+def parseString(data, name):
+    value = data.get(name)
+    if not isinstance(value, str) or not value:
+        raise ValueError(f"invalid {name}")
+    return value
+
+def isNumeric(value):
+    """Stored ints, floats and bools (as ints) can be plotted, text values cannot."""
+    return isinstance(value, (int, float))
+
+def numericRows(rows):
+    """The raw rows (ts_sec, ts_nsec, value, report_id) with a numeric value, as float."""
+    for ts_sec, ts_nsec, value, report_id in rows:
+        if isNumeric(value):
+            yield ts_sec, ts_nsec, float(value), report_id
+
+def readSeries(device_ids, keys, ts_from=None, ts_to=None, max_points=None, method="auto", numeric=False):
+    """
+    Yields (device_id, key, resolution, rows) for every requested series. The raw
+    rows of all series come from one query, the rollups from one query per
+    resolution, so the series arrive in that order and requested series without
+    rows come last. rows must be consumed before the next series is requested.
+    """
+    pairs = list(dict.fromkeys((device_id, key) for device_id in device_ids for key in keys))
+    resolutions = {}
+    if max_points and method == "auto":
+        resolutions = {
+            pair: resolution
+            for pair, resolution in chooseResolutions(pairs, max_points, ts_from, ts_to).items()
+            if resolution
+        }
+    found = set()
+    raw_pairs = [pair for pair in pairs if pair not in resolutions]
+    for pair, rows in iterManyTimeSeries(raw_pairs, ts_from, ts_to, numeric=numeric):
+        found.add(pair)
+        yield (*pair, 0, rows)
+    for pair, resolution, rows in iterManyRollupSeries(resolutions, ts_from, ts_to):
+        found.add(pair)
+        yield (*pair, resolution, rows)
+    for pair in pairs:
+        if pair not in found:
+            yield (*pair, 0, ())
+
+def selectPoints(t, v, max_points=None, method="auto"):
+    """Indices of the points to send: all of them, or at most max_points chosen by downsample()."""
+    # the response size only depends on max_points, not on the history length
+    if max_points and len(t) > max_points:
+        return downsample(t, v, max_points, "lttb" if method == "auto" else method)
+    return range(len(t))
+
+def independentSeries(device_ids, keys, ts_from=None, ts_to=None, max_points=None, method="auto"):
+    """
+    Yields one series dict per device and key with a generator of point dicts.
+    Without max_points the rows are streamed from the cursor, otherwise at most
+    max_points points are selected (from the rollups if resolution is not 0).
+    Text values are left out, see numericRows().
+    """
+    for device_id, key, resolution, rows in readSeries(device_ids, keys, ts_from, ts_to, max_points, method):
+        if not max_points:
+            points = ({"t": r[0] + r[1] / 1e9, "v": r[2], "report_id": r[3]} for r in numericRows(rows))
+        elif resolution:
+            rows = list(rows)
+            t = [r[0] + resolution / 2 for r in rows]
+            v = [r[2] for r in rows]
+            points = (
+                {"t": t[i], "v": v[i], "min": rows[i][3], "max": rows[i][4], "count": rows[i][1]}
+                for i in selectPoints(t, v, max_points)
+            )
+        else:
+            rows = list(numericRows(rows))
+            t = [r[0] + r[1] / 1e9 for r in rows]
+            v = [r[2] for r in rows]
+            points = (
+                {"t": t[i], "v": v[i], "report_id": rows[i][3]}
+                for i in selectPoints(t, v, max_points, method)
+            )
+        yield {
+            "device_id": device_id,
+            "key": key,
+            "resolution": resolution,
+            "points": points
+        }
+
+def independentColumns(device_ids, keys, ts_from=None, ts_to=None, max_points=None, method="auto"):
+    """
+    Like independentSeries() but yields {"device_id", "key", "resolution", "columns"}
+    with float64 columns filled straight from the cursor: t and v, for rollups also min, max and count.
+    Raw series with report ids also get a "report" column, the index of the point's
+    report id in the series' "report_ids" list (-1 for none).
+    """
+    for device_id, key, resolution, rows in readSeries(device_ids, keys, ts_from, ts_to, max_points, method, numeric=True):
+        report_ids = {}
+        if resolution:
+            bucket, count, avg, low, high = toColumns([list(rows)], 5)
+            columns = {"t": shift(bucket, resolution / 2), "v": avg, "min": low, "max": high, "count": count}
+        else:
+            t, v, report = toColumns(batched(
+                (seconds, value, report_ids.setdefault(report_id, len(report_ids)) if report_id else -1)
+                for seconds, value, report_id in rows
+            ), 3)
+            columns = {"t": t, "v": v}
+            if report_ids:
+                columns["report"] = report
+        if max_points and len(columns["t"]) > max_points:
+            selected = selectPoints(columns["t"], columns["v"], max_points, method)
+            columns = {name: take(column, selected) for name, column in columns.items()}
+        item = {"device_id": device_id, "key": key, "resolution": resolution, "columns": columns}
+        if report_ids:
+            item["report_ids"] = list(report_ids)
+        yield item
+
+def reportColumns(report_ids):
+    """{"device_id", "key", "report_id", "columns": {"t", "v"}} per series of the reports, from one query."""
+    for report_id, device_id, key, rows in iterManyReportSeries(report_ids):
+        t, v = toColumns(batched(rows), 2)
+        yield {"device_id": device_id, "key": key, "report_id": report_id, "columns": {"t": t, "v": v}}
+
+def pointSeries(series):
+    """Turns the columns of every series back into the {"t", "v"} points of the json layout."""
+    for item in series:
+        columns = item.pop("columns")
+        names = list(columns)
+        yield {**item, "points": (dict(zip(names, values)) for values in zip(*(column.tolist() for column in columns.values())))}
+
+def columnarJson(series):
+    """Columnar JSON layout: {"device_id", "key", "resolution", "t": [...], "v": [...], ...} per series."""
+    for item in series:
+        columns = item.pop("columns")
+        yield {**item, **{name: RawJson(encodeColumnJson(column)) for name, column in columns.items()}}
+
+def seriesLines(series):
+    """NDJSON layout: a line without "t" starts a series, the point lines of that series follow."""
+    for item in series:
+        points = item.pop("points")
+        yield item
+        yield from points
 
 def register(app):
 
@@ -31,13 +221,39 @@ def register(app):
             traceback.print_exc()
             return jsonify({"error": str(e)}), 500
 
+    @app.route("/api/get/reportedValues/catalog", methods=["POST"])
+    @login_required
+    def api_catalog():
+        # per series: device_id, key, count, first, last, value_type, min, max (see getSeriesCatalog)
+        try:
+            data = request.get_json(force=True)
+            device_ids = data.get("device_ids", [])
+            return jsonify(getSeriesCatalog(device_ids))
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            return jsonify({"error": str(e)}), 500
+
+    @app.route("/api/get/reportedValues/report_catalog", methods=["POST"])
+    @login_required
+    def api_report_catalog():
+        # per report: report_id, count, first, last, devices, keys (see getReportCatalog)
+        try:
+            data = request.get_json(force=True)
+            device_ids = data.get("device_ids", [])
+            return jsonify(getReportCatalog(device_ids))
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            return jsonify({"error": str(e)}), 500
+
     @app.route("/api/get/reportedValues/report_ids", methods=["POST"])
     @login_required
     def api_report_ids():
         try:
             data = request.get_json(force=True)
             device_ids = data.get("device_ids", [])
-            report_ids = getAllReportIds()
+            report_ids = getAllReportIds(device_ids)
             return jsonify(report_ids)
         except Exception as e:
             import traceback
@@ -48,48 +264,82 @@ def register(app):
     @login_required
     def api_data_via_device_id():
         try:
-            data = request.get_json(force=True)
-            mode = data["mode"]
-            result = []
+            # every parameter is checked here, errors inside the streamed response
+            # could only cut it off after the 200 status has been sent
+            data = request.get_json(force=True, silent=True)
+            if not isinstance(data, dict):
+                return jsonify({"error": "Invalid JSON"}), 400
+            mode = data.get("mode")
+            # json: one array of series, ndjson: see seriesLines(), columnar: see columnarJson(),
+            # binary: see utilities.columns.encodeBinary(). xy mode only knows json and ndjson.
+            response_format = data.get("format", "json")
+            if response_format not in RESPONSE_FORMATS:
+                return jsonify({"error": "invalid format"}), 400
             if mode == "independent":
-                device_ids = data["device_ids"]
-                keys = data["keys"]
-                for device_id in device_ids:
-                    for key in keys:
-                        rows = getTimeSeries(device_id, key)
-                        result.append({
-                            "device_id": device_id,
-                            "key": key,
-                            "points": [
-                                {
-                                    "t": r[0] + r[1] / 1e9,
-                                    "v": float(r[2]),
-                                    "report_id": r[3]
-                                }
-                                for r in rows
-                            ]
-                        })
+                device_ids = parseStrings(data, "device_ids")
+                keys = parseStrings(data, "keys")
+                # optional time range in seconds, only the overlapping partitions are read
+                ts_from = parseSeconds(data, "from")
+                ts_to = parseSeconds(data, "to")
+                # optional point budget per series
+                max_points = parseMaxPoints(data)
+                # "auto": read large series from the rollups, "lttb"/"minmax": downsample the raw rows
+                method = data.get("downsample", "auto")
+                if method != "auto" and method not in DOWNSAMPLE_METHODS:
+                    return jsonify({"error": "invalid downsample"}), 400
+                if response_format == "binary":
+                    # the header needs every series' length, so all columns are read first
+                    series = list(independentColumns(device_ids, keys, ts_from, ts_to, max_points, method))
+                    return Response(encodeBinary(series), mimetype="application/octet-stream")
+                if response_format == "columnar":
+                    return streamJson(columnarJson(independentColumns(device_ids, keys, ts_from, ts_to, max_points, method)))
+                series = independentSeries(device_ids, keys, ts_from, ts_to, max_points, method)
+                if response_format == "ndjson":
+                    return streamNdjson(seriesLines(series))
+                return streamJson(series)
             elif mode == "xy":
-                id = data["device_id"]
+                id = parseString(data, "device_id")
+                # optional, the y series may belong to another device
+                y_device_id = parseString(data, "y_device_id") if data.get("y_device_id") else id
 
-                x_key = data["x_key"]
-                y_key = data["y_key"]
+                x_key = parseString(data, "x_key")
+                y_key = parseString(data, "y_key")
+                ts_from = parseSeconds(data, "from")
+                ts_to = parseSeconds(data, "to")
 
-                rows = getXYSeries(id, x_key, y_key)
-                result.append({
+                # exact: same timestamp, nearest: closest y within tolerance,
+                # asof: last y before x, at most tolerance old (0 = any age)
+                align = data.get("align", "exact")
+                if align not in ALIGN_MODES:
+                    return jsonify({"error": "invalid align"}), 400
+                tolerance = parseNumber(data, "tolerance") or 0.0  # seconds
+                if tolerance < 0:
+                    return jsonify({"error": "invalid tolerance"}), 400
+
+                rows = iterXYSeries(
+                    id, x_key, y_key,
+                    y_device_id=y_device_id,
+                    align=align,
+                    tolerance=int(tolerance * 1e9),
+                    ts_from=ts_from,
+                    ts_to=ts_to,
+                )
+                # pairs with a text value cannot be plotted
+                points = ({"x": float(r[2]), "y": float(r[3])} for r in rows if isNumeric(r[2]) and isNumeric(r[3]))
+                if response_format == "ndjson":
+                    return streamNdjson(points)
+                return streamJson([{
                     "x_key": x_key,
                     "y_key": y_key,
-                    "points": [
-                        {"x": float(r[0]), "y": float(r[1])}
-                        for r in rows
-                    ]
-                })
+                    "x_device_id": id,
+                    "y_device_id": y_device_id,
+                    "points": points
+                }])
             else:
                 return jsonify({"error": "invalid mode"}), 400
 
-            return jsonify(result)
-
-
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         except Exception as e:
             import traceback
             traceback.print_exc()
@@ -101,33 +351,28 @@ def register(app):
         try:
             data = request.get_json(force=True)
             ids = data["keys"]  # in this case keys are report_ids
-            result = []
-            uniqueKeys = set()
-
-            for id in ids:
-                rows = getTimeSeriesViaReportId(id)
-                grouped = {}
-                for r in rows:
-                    key = r[2] + ":" + r[3]  # device_id:key
-                    if key not in grouped:
-                        grouped[key] = []
-                    grouped[key].append(r)
-
-                for key, groupedRows in grouped.items():
-                    result.append({
-                        "device_id": groupedRows[0][2],
-                        "key": groupedRows[0][3],
-                        "report_id": id,
-                        "points": [
-                            {
-                                "t": r[0] + r[1] / 1e9,
-                                "v": float(r[4])
-                            }
-                            for r in groupedRows
-                        ]
-                    })
-                    uniqueKeys.add(groupedRows[0][3])
-            return jsonify({"data": result, "uniqueKeys": list(uniqueKeys)})
+            # json: {"data": [series with points], "uniqueKeys": [...]}, columnar: the same with
+            # "t"/"v" arrays instead of points, binary: see utilities.columns.encodeBinary(),
+            # ndjson: one line per value
+            response_format = data.get("format", "json")
+            if response_format not in RESPONSE_FORMATS:
+                return jsonify({"error": "invalid format"}), 400
+
+            if response_format == "ndjson":
+                # one line per value in report/series/time order, nothing is grouped in memory
+                return streamNdjson(
+                    {"report_id": report_id, "device_id": device_id, "key": key, "t": t, "v": v}
+                    for report_id, device_id, key, rows in iterManyReportSeries(ids)
+                    for t, v in rows
+                )
+
+            series = list(reportColumns(ids))
+            if response_format == "binary":
+                return Response(encodeBinary(series), mimetype="application/octet-stream")
+            uniqueKeys = sorted({item["key"] for item in series})
+            if response_format == "columnar":
+                return streamJson({"data": columnarJson(series), "uniqueKeys": uniqueKeys})
+            return streamJson({"data": pointSeries(series), "uniqueKeys": uniqueKeys})
 
         except Exception as e:
             import traceback
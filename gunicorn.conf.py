@@ -0,0 +1,40 @@
+# gunicorn.conf.py
+#
+# Production server on all cores:
+#   gunicorn -c gunicorn.conf.py server:app
+#
+# The app is loaded and the databases are initialized once in the master process,
+# then forked into WORKERS processes with THREADS threads each. State shared by
+# the workers lives in db/shared.db, the MQTT client and the retention purger run
+# in exactly one worker (see utilities/leader.py).
+import multiprocessing
+
+from config.config import HOST, PORT, SSL_CERT_FILE
+
+# Worker processes, each one serves requests with its own GIL.
+WORKERS = multiprocessing.cpu_count()
+# Threads per worker, requests mostly wait for SQLite or the network.
+THREADS = 4
+
+bind = f"{HOST}:{PORT}"
+certfile = SSL_CERT_FILE
+keyfile = SSL_CERT_FILE
+workers = WORKERS
+worker_class = "gthread"
+threads = THREADS
+preload_app = True
+# streamed exports can take long, gthread workers keep notifying the master meanwhile
+timeout = 60
+graceful_timeout = 30
+
+
+def on_starting(server):
+    # the app is preloaded at this point, the workers inherit the loaded caches
+    from server import app, initialize_databases
+    with app.app_context():
+        initialize_databases()
+
+
+def post_fork(server, worker):
+    from server import start_services
+    start_services()
@@ -1,57 +1,148 @@
 import json
+import os
 import threading
+from collections import namedtuple
 import paho.mqtt.client as mqtt
 
-from db.mqtt import addTopicPayload, getAllTopics, getTopicId
-from api.reportValues import handleReportValues
+from db.devices import updateLastSeen
+from db.mqtt import addTopicPayload, getAllTopics, getLatestPayloadsStats, MQTT_TOPICS_GENERATION
+from db.shared import onGenerationChange
+from api.reportValues import handleReportValues, handleReportValuesBatch
 from api.state import handleDeviceState
 from api.registerDevice import handleRegisterOrUpdateDevice
+from mqtt.dispatcher import MessageDispatcher
+from mqtt.routing import loadTopicRoutes, routeTopic, getRoutingStats
 
 MQTT_HOST = "localhost"
 MQTT_PORT = 1883
 MQTT_KEEPALIVE = 60
-
+# Threads handling incoming messages, paho's network thread only queues them.
+MQTT_WORKERS = 4
+# Messages queued per worker thread, further ones are dropped.
+MQTT_QUEUE_SIZE = 1000
+# Seconds the network thread waits for room in a full queue before it drops the message.
+MQTT_QUEUE_PUT_TIMEOUT = 0.1
+# Subscribe to every state topic with the one wildcard MQTT_STATE_WILDCARD_TOPIC and
+# drop the messages of unknown topics with the routing table (see mqtt/routing.py),
+# instead of one subscription per <device_id>/<topic_name>/state topic.
+MQTT_STATE_WILDCARD = False
+MQTT_STATE_WILDCARD_TOPIC = "+/+/state"
+# Topics of the MQTT API, see tryDefaultMessages().
+MQTT_API_TOPICS = [
+    "api/registerDevice",
+    "api/updateDeviceInfo",
+    "api/reportValues",
+    "api/reportValues/batch",
+    "api/post/state",
+]
+
+# The subscribing client, only in the one server process that runs MQTT (see startMqtt()).
 _client = None
+# Publish-only client of the other server processes, connected on first use.
+_publisher = None
+_publisher_lock = threading.Lock()
+# <device_id>/<topic_name>/state topics _client is subscribed to, without MQTT_STATE_WILDCARD
+_state_topics = set()
+_subscription_lock = threading.Lock()
+
+def _brokerCall(action, topics):
+    """
+    One subscribe or unsubscribe request for all topics. A client that is not connected
+    yet is skipped, onConnect() subscribes to everything once the connection is up.
+    There is no retry: it would block paho's network thread when called from onConnect(),
+    and a failed request means a lost connection, after which paho reconnects and
+    onConnect() subscribes to _state_topics again.
+    """
+    if not topics or not _client or not _client.is_connected():
+        return
+    call = _client.subscribe if action == "subscribe" else _client.unsubscribe
+    result, _ = call(topics)
+    if result != mqtt.MQTT_ERR_SUCCESS:
+        print(f"MQTT {action} failed for {len(topics)} topics (result={result})")
+
+def subscribe(topics, qos=0):
+    """Subscribes to a topic or a list of topics with one request."""
+    if isinstance(topics, str):
+        topics = [topics]
+    _brokerCall("subscribe", [(topic, qos) for topic in topics])
+
+def unsubscribe(topics):
+    """Unsubscribes from a topic or a list of topics with one request."""
+    if isinstance(topics, str):
+        topics = [topics]
+    _brokerCall("unsubscribe", list(topics))
+
+def unsubscribeStates(device_id, topic_names):
+    if MQTT_STATE_WILDCARD or not _client:
+        return
+    topics = [f"{device_id}/{topic_name}/state" for topic_name in topic_names]
+    with _subscription_lock:
+        _state_topics.difference_update(topics)
+    unsubscribe(topics)
 
-def subscribe(topic, qos=0):
-    if _client:
-        for attempt in range(3):
-            result, _ = _client.subscribe(topic, qos=qos)
-            if result == mqtt.MQTT_ERR_SUCCESS:
-                break
-            elif attempt < 2:
-                import time
-                time.sleep(0.5)
-            else:
-                print(f"MQTT subscribe failed for {topic} after 3 attempts (result={result})")
-
-
-def unsubscribe(topic):
-    if _client:
-        for attempt in range(3):
-            result, _ = _client.unsubscribe(topic)
-            if result == mqtt.MQTT_ERR_SUCCESS:
-                break
-            elif attempt < 2:
-                import time
-                time.sleep(0.5)
-            else:
-                print(f"MQTT unsubscribe failed for {topic} after 3 attempts (result={result})")
-
-def unsubscribeState(device_id, topic_name):
-    unsubscribe(f"{device_id}/{topic_name}/state")
+def subscribeStates(device_id, topic_names):
+    if MQTT_STATE_WILDCARD or not _client:
+        return
+    topics = [f"{device_id}/{topic_name}/state" for topic_name in topic_names]
+    with _subscription_lock:
+        _state_topics.update(topics)
+    subscribe(topics)
+
+def _wantedStateTopics():
+    return {
+        f"{device_id}/{topic_name}/state"
+        for device_id, topic_name, has_set, has_state in getAllTopics()
+        if has_state
+    }
+
+def syncStateSubscriptions():
+    """
+    Subscribes to the state topics of the topics table and unsubscribes from removed ones,
+    with one request each. Runs when another server process changed topics, its
+    (un)subscribe calls have no client. The wildcard subscription needs no update.
+    """
+    if MQTT_STATE_WILDCARD or not _client:
+        return
+    wanted = _wantedStateTopics()
+    with _subscription_lock:
+        removed = sorted(_state_topics - wanted)
+        added = sorted(wanted - _state_topics)
+        _state_topics.difference_update(removed)
+        _state_topics.update(added)
+    unsubscribe(removed)
+    subscribe(added)
 
-def subscribeState(device_id, topic_name):
-    subscribe(f"{device_id}/{topic_name}/state")
+onGenerationChange(MQTT_TOPICS_GENERATION, syncStateSubscriptions)
 
 
 def onConnect(client, userdata, flags, rc):
     print("MQTT connected:", rc)
+    # a new session has no subscriptions, also after a reconnect
+    if MQTT_STATE_WILDCARD:
+        # the broker may deliver a message once per matching subscription, api/post/state
+        # also matches the wildcard and must not be handled twice
+        api_topics = [topic for topic in MQTT_API_TOPICS if not mqtt.topic_matches_sub(MQTT_STATE_WILDCARD_TOPIC, topic)]
+        subscribe(api_topics + [MQTT_STATE_WILDCARD_TOPIC])
+        return
+    with _subscription_lock:
+        state_topics = sorted(_state_topics)
+    subscribe(MQTT_API_TOPICS + state_topics)
 
 
-def publish(topic, payload, retain=False):
+def _publishClient():
+    global _publisher
     if _client:
-        _client.publish(topic, payload, retain=retain)
+        return _client
+    with _publisher_lock:
+        if _publisher is None:
+            publisher = mqtt.Client()
+            publisher.connect(MQTT_HOST, MQTT_PORT, MQTT_KEEPALIVE)
+            publisher.loop_start()
+            _publisher = publisher
+    return _publisher
+
+def publish(topic, payload, retain=False):
+    _publishClient().publish(topic, payload, retain=retain)
 
 def publishApiResponse(device_id, topic, apiResponse):
     publish(f"{device_id}/api/{topic}", apiResponse)
@@ -60,32 +151,43 @@ def publishSet(device_id, topic_name, key_values):
     publish(f"{device_id}/{topic_name}/set", json.dumps(key_values))
 
 
-def updateTopicState(device_id, topic_name, payload):
-    topic_id = getTopicId(device_id, topic_name)
-    if topic_id:
-        addTopicPayload(topic_id, payload)
-        return
-
-    print(f"Received MQTT state update for unknown topic: {device_id}/{topic_name} with payload: {payload}")
+def updateTopicState(topic_id, payload):
+    addTopicPayload(topic_id, payload)
 
 
 def tryDefaultMessages(msg, payload) -> bool:
     device_id = payload.get("device_id")
+    topic = msg.topic.strip("/")
 
-    if msg.topic == "/api/reportValues":
+    if topic == "api/reportValues":
         try:
             handleReportValues(
                 device_id=device_id,
                 key_values=payload.get("keyValues"),
                 ts_sec=payload.get("s"),
                 ts_nsec=payload.get("ns"),
-                report_id=payload.get("report_id")
+                report_id=payload.get("report_id"),
+                wait=False # never block the MQTT workers on disk writes
             )
             publishApiResponse(device_id, "reportValues", {"status": "ok"})
-        except ValueError as e:
+        except (ValueError, RuntimeError) as e:
             publishApiResponse(device_id, "reportValues", {"error": str(e)})
         return True
 
+    if topic == "api/reportValues/batch":
+        # device_id is the sender, for gateway payloads the samples are listed under "devices"
+        try:
+            count = handleReportValuesBatch(
+                device_id=device_id,
+                samples=payload.get("samples"),
+                devices=payload.get("devices"),
+                wait=False # never block the MQTT workers on disk writes
+            )
+            publishApiResponse(device_id, "reportValues/batch", {"status": "ok", "samples": count})
+        except (ValueError, RuntimeError) as e:
+            publishApiResponse(device_id, "reportValues/batch", {"error": str(e)})
+        return True
+
     if topic == "api/registerDevice":
         temp_id = payload.get("temp_id")
         if not temp_id:
@@ -131,15 +233,32 @@ def tryDefaultMessages(msg, payload) -> bool:
     
     return False
 
+# An api/ message with its payload already decoded by onMessage().
+ApiMessage = namedtuple("ApiMessage", ["topic", "payload"])
+
+def _apiMessageKey(topic, payload):
+    """The sending device, so its api/ and state messages go to the same worker."""
+    if isinstance(payload, dict):
+        key = payload.get("device_id") or payload.get("temp_id")
+        if isinstance(key, str) and key:
+            return key
+    return topic
+
 def onMessage(client, userdata, msg):
-    try:
-        payload = json.loads(msg.payload.decode())
-    except Exception:
-        print("Failed to decode MQTT message payload as JSON:", msg.payload)
+    # runs on the network thread, everything else happens in handleMessage()
+    if msg.topic.startswith("api/"):
+        # the device is only known from the payload, api/ payloads are small
+        payload = decodePayload(msg)
+        if payload is None:
+            return
+        _DISPATCHER.submit(_apiMessageKey(msg.topic, payload), ApiMessage(msg.topic, payload))
         return
+    # <device_id>/<topic_name>/state messages are ordered per device
+    _DISPATCHER.submit(msg.topic.strip("/").split("/", 1)[0], msg)
 
-    if msg.topic.startswith("api/"):
-        if tryDefaultMessages(msg, payload):
+def handleMessage(msg):
+    if isinstance(msg, ApiMessage):
+        if tryDefaultMessages(msg, msg.payload):
             return
         else:
             print("Received message for unknown API endpoint:", msg.topic)
@@ -159,30 +278,58 @@ def onMessage(client, userdata, msg):
         print("Received MQTT message for unsupported endpoint:", endpoint)
         return
 
-    if not deviceExists(device_id):
-        print("Received MQTT message for unknown device_id:", device_id)
+    # unknown devices and topics are reported once per ROUTE_NEGATIVE_TTL by the router
+    route = routeTopic(device_id, topic_name)
+    if route is None or not route["has_state"]:
         return
-    
-    updateTopicState(device_id, topic_name, payload)
+
+    payload = decodePayload(msg)
+    if payload is None:
+        return
+
+    updateTopicState(route["id"], payload)
     updateLastSeen(device_id)
 
+def decodePayload(msg):
+    try:
+        return json.loads(msg.payload.decode())
+    except Exception:
+        print("Failed to decode MQTT message payload as JSON:", msg.payload)
+        return None
+
+_DISPATCHER = MessageDispatcher(
+    handleMessage,
+    workers=MQTT_WORKERS,
+    max_queue=MQTT_QUEUE_SIZE,
+    put_timeout=MQTT_QUEUE_PUT_TIMEOUT,
+)
+
+def getMqttStats():
+    return {
+        "connected": bool(_client and _client.is_connected()),
+        "state_subscriptions": MQTT_STATE_WILDCARD_TOPIC if MQTT_STATE_WILDCARD else len(_state_topics),
+        "dispatcher": _DISPATCHER.stats(),
+        "routes": getRoutingStats(),
+        "latest_payloads": getLatestPayloadsStats(),
+    }
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_DISPATCHER._resetAfterFork)
+
 def startMqtt():
     global _client
+    loadTopicRoutes()
+    _DISPATCHER.start()
+    if not MQTT_STATE_WILDCARD:
+        with _subscription_lock:
+            _state_topics.clear()
+            _state_topics.update(_wantedStateTopics())
     _client = mqtt.Client()
     _client.on_connect = onConnect
     _client.on_message = onMessage
 
     _client.connect(MQTT_HOST, MQTT_PORT, MQTT_KEEPALIVE)
 
+    # onConnect() subscribes to the API and state topics in one request
     _client.loop_start()
 
-    topics = getAllTopics()
-    for device_id, topic_name, has_set, has_state in topics:
-        if has_state:
-            subscribeState(device_id, topic_name)
-
-    subscribe(f"api/registerDevice")
-    subscribe(f"api/updateDeviceInfo")
-    subscribe(f"api/reportValues")
-    subscribe(f"api/post/state")
-
@@ -0,0 +1,87 @@
+import queue
+import threading
+import time
+import zlib
+
+class MessageDispatcher:
+    """
+    Takes MQTT messages off paho's network thread. submit() only puts the
+    message into the bounded queue of one of `workers` threads, which run
+    handler(message). Messages with the same key always go to the same worker,
+    so messages of one device are handled in the order they arrived.
+
+    If that queue is full, submit() waits at most put_timeout seconds (a short
+    push back on the broker connection) and then drops the message, so a burst
+    of messages can never stall the keepalives.
+    """
+    def __init__(self, handler, *, workers=4, max_queue=1000, put_timeout=0.1):
+        self.handler = handler
+        self.workers = workers
+        self.max_queue = max_queue
+        self.put_timeout = put_timeout
+        self._queues = [queue.Queue(maxsize=max_queue) for _ in range(workers)]
+        self._threads = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.handled = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_depth = 0
+        self._last_drop_report = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._threads is None:
+                self._threads = [
+                    threading.Thread(target=self._run, args=(q,), name=f"mqtt-worker-{index}", daemon=True)
+                    for index, q in enumerate(self._queues)
+                ]
+                for thread in self._threads:
+                    thread.start()
+
+    def submit(self, key, message) -> bool:
+        """Returns False if the message was dropped."""
+        q = self._queues[zlib.crc32(key.encode()) % self.workers]
+        try:
+            q.put(message, timeout=self.put_timeout)
+        except queue.Full:
+            self.dropped += 1
+            now = time.monotonic()
+            if now - self._last_drop_report >= 10.0:  # one line per burst instead of one per message
+                self._last_drop_report = now
+                print(f"MQTT worker queue full, {self.dropped} messages dropped so far")
+            return False
+        self.submitted += 1
+        depth = q.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return True
+
+    def _run(self, q):
+        while True:
+            message = q.get()
+            try:
+                self.handler(message)
+            except Exception as e:
+                self.errors += 1
+                print(f"Failed to handle MQTT message on {message.topic}: {e}")
+            self.handled += 1
+
+    def stats(self):
+        return {
+            "running": self._threads is not None,
+            "workers": self.workers,
+            "queued": [q.qsize() for q in self._queues],
+            "max_queue": self.max_queue,
+            "max_depth": self.max_depth,
+            "submitted": self.submitted,
+            "handled": self.handled,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
+
+    def _resetAfterFork(self):
+        # the worker threads do not survive a fork
+        self._queues = [queue.Queue(maxsize=self.max_queue) for _ in range(self.workers)]
+        self._threads = None
+        self._lock = threading.Lock()
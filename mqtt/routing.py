@@ -0,0 +1,117 @@
+import threading
+import time
+
+from db.mqtt import getTopicRoutes, MQTT_TOPICS_GENERATION
+from db.shared import bumpGeneration, onGenerationChange
+
+# Seconds an unknown <device_id>/<topic_name> is remembered. Its messages are
+# dropped without a query and without a log line meanwhile.
+ROUTE_NEGATIVE_TTL = 60.0
+# Unknown pairs remembered at most, e.g. against a device that makes up topic names.
+ROUTE_NEGATIVE_MAX = 10000
+
+class TopicRouter:
+    """
+    In-memory copy of the topics (with their keys) by (device_id, topic_name),
+    so routing a state message is one dictionary hit instead of a query.
+    Loaded on first use; refreshDevice() keeps it in line with the topic
+    changes of this process, other processes trigger a reload through
+    MQTT_TOPICS_GENERATION. Pairs without a topic are cached for negative_ttl seconds.
+    """
+    def __init__(self, negative_ttl, negative_max):
+        self.negative_ttl = negative_ttl
+        self.negative_max = negative_max
+        self._routes = None
+        self._unknown = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.loads = 0
+
+    def load(self):
+        routes = {(route["device_id"], route["name"]): route for route in getTopicRoutes()}
+        with self._lock:
+            self._routes = routes
+            self._unknown = {}
+            self.loads += 1
+
+    def reload(self):
+        """Reloads a table that is in use, processes that never routed a message skip it."""
+        if self._routes is not None:
+            self.load()
+
+    def _entries(self):
+        routes = self._routes
+        if routes is None:
+            self.load()
+            routes = self._routes
+        return routes
+
+    def refreshDevice(self, device_id):
+        if self._routes is None:
+            return
+        routes = getTopicRoutes(device_id)
+        with self._lock:
+            for pair in [pair for pair in self._routes if pair[0] == device_id]:
+                self._routes.pop(pair, None)
+            for pair in [pair for pair in self._unknown if pair[0] == device_id]:
+                self._unknown.pop(pair, None)
+            self._routes.update({(device_id, route["name"]): route for route in routes})
+
+    def route(self, device_id, topic_name):
+        """The topic dict of getTopicRoutes(), None for an unknown topic."""
+        pair = (device_id, topic_name)
+        route = self._entries().get(pair)
+        if route is not None:
+            self.hits += 1
+            return route
+        now = time.monotonic()
+        expires = self._unknown.get(pair)
+        if expires is not None and expires > now:
+            self.negative_hits += 1
+            return None
+        # may have been added by another process since the last load
+        self.misses += 1
+        found = getTopicRoutes(device_id, topic_name)
+        with self._lock:
+            if found:
+                self._routes[pair] = found[0]
+                self._unknown.pop(pair, None)
+                return found[0]
+            if len(self._unknown) >= self.negative_max:
+                self._unknown = {other: until for other, until in self._unknown.items() if until > now}
+                if len(self._unknown) >= self.negative_max:
+                    self._unknown = {}
+            self._unknown[pair] = now + self.negative_ttl
+        print(f"Received MQTT message for unknown topic: {device_id}/{topic_name}, ignored for {self.negative_ttl:.0f}s")
+        return None
+
+    def stats(self):
+        routes = self._routes
+        return {
+            "topics": len(routes) if routes is not None else 0,
+            "unknown": len(self._unknown),
+            "hits": self.hits,
+            "misses": self.misses,
+            "negative_hits": self.negative_hits,
+            "loads": self.loads,
+        }
+
+_ROUTER = TopicRouter(ROUTE_NEGATIVE_TTL, ROUTE_NEGATIVE_MAX)
+# topics changed by another server process
+onGenerationChange(MQTT_TOPICS_GENERATION, _ROUTER.reload)
+
+def loadTopicRoutes():
+    _ROUTER.load()
+
+def routeTopic(device_id, topic_name):
+    return _ROUTER.route(device_id, topic_name)
+
+def refreshTopicRoutes(device_id):
+    """Call after the topics of device_id changed, tells the other server processes as well."""
+    _ROUTER.refreshDevice(device_id)
+    bumpGeneration(MQTT_TOPICS_GENERATION)
+
+def getRoutingStats():
+    return _ROUTER.stats()
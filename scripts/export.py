@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Exports measurements or MQTT payloads as CSV, NDJSON or Parquet (needs pyarrow).
+Reads from a read-only connection, so it can run next to the server.
+
+    scripts/export.py measurements --device <id> --key temp --from 2025-01-01 -f parquet -o temp.parquet
+    scripts/export.py payloads --device <id> --topic light > payloads.csv
+"""
+import argparse
+import sys
+from datetime import datetime
+from pathlib import Path
+
+# Add project root to PYTHONPATH
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from db.export import (
+    iterMeasurementBatches,
+    iterPayloadBatches,
+    MEASUREMENT_COLUMNS,
+    MEASUREMENT_TYPED_COLUMNS,
+    PAYLOAD_COLUMNS,
+)
+from utilities.export import exportRows, EXPORT_FORMATS
+
+
+def parseTime(value):
+    """Seconds since epoch or an ISO date/time (local time unless it has an offset)."""
+    try:
+        return int(float(value))
+    except ValueError:
+        return int(datetime.fromisoformat(value).timestamp())
+
+def main():
+    parser = argparse.ArgumentParser(description="Export measurements or MQTT payloads.")
+    parser.add_argument("what", choices=("measurements", "payloads"))
+    parser.add_argument("--device", action="append", help="device id, repeatable (default: all)")
+    parser.add_argument("--key", action="append", help="measurement key, repeatable (default: all)")
+    parser.add_argument("--topic", action="append", help="topic name, repeatable (default: all)")
+    parser.add_argument("--from", dest="ts_from", type=parseTime, help="seconds or ISO date, inclusive")
+    parser.add_argument("--to", dest="ts_to", type=parseTime, help="seconds or ISO date, inclusive")
+    parser.add_argument("-f", "--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("-o", "--output", help="file to write (default: stdout)")
+    args = parser.parse_args()
+
+    if args.what == "measurements":
+        typed = args.format == "parquet"
+        columns = MEASUREMENT_TYPED_COLUMNS if typed else MEASUREMENT_COLUMNS
+        batches = iterMeasurementBatches(args.device, args.key, args.ts_from, args.ts_to, typed=typed)
+    else:
+        columns = PAYLOAD_COLUMNS
+        batches = iterPayloadBatches(args.device, args.topic, args.ts_from, args.ts_to)
+
+    try:
+        pieces = exportRows(columns, batches, args.format)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.output:
+        out = open(args.output, "wb")
+    elif args.format == "parquet" and sys.stdout.isatty():
+        print("Error: parquet is binary, use --output or redirect stdout", file=sys.stderr)
+        sys.exit(1)
+    else:
+        out = sys.stdout.buffer
+    try:
+        with out:
+            for piece in pieces:
+                out.write(piece.encode() if isinstance(piece, str) else piece)
+    except BrokenPipeError:  # e.g. piped into head
+        sys.stderr.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Bulk imports historical measurements from CSV (with a header line) or NDJSON,
+e.g. files written by scripts/export.py. The server may keep running.
+An interrupted import continues where it stopped when started again with the same file.
+
+    scripts/import.py old_sensor.csv --device <id>
+    scripts/import.py history.ndjson --restart
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+
+# Add project root to PYTHONPATH
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from db.device_data import importMeasurements, IMPORT_BATCH_ROWS
+from utilities.importer import readRows, IMPORT_FORMATS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import measurements.")
+    parser.add_argument("file")
+    parser.add_argument("-f", "--format", choices=IMPORT_FORMATS, help="default: from the file extension")
+    parser.add_argument("--device", help="device id of records without one")
+    parser.add_argument("--key", help="key of records without one")
+    parser.add_argument("--batch-rows", type=int, default=IMPORT_BATCH_ROWS, help="rows per transaction")
+    parser.add_argument("--restart", action="store_true", help="ignore the progress of an earlier run")
+    args = parser.parse_args()
+
+    path = Path(args.file).resolve()
+    import_format = args.format or ("ndjson" if path.suffix in (".ndjson", ".jsonl") else "csv")
+    # a changed file is a new import
+    stat = os.stat(path)
+    source = f"{path}:{stat.st_size}:{int(stat.st_mtime)}"
+
+    def progress(stats):
+        print(f"\r{stats['skipped'] + stats['rows']} rows, {stats['rows_per_second']:.0f} rows/s", end="", flush=True)
+
+    with open(path, newline="", encoding="utf-8") as file:
+        try:
+            stats = importMeasurements(
+                readRows(file, import_format, args.device, args.key),
+                source=source,
+                batch_rows=args.batch_rows,
+                restart=args.restart,
+                progress=progress,
+            )
+        except KeyboardInterrupt:
+            print("\nInterrupted, run the same command again to continue.")
+            sys.exit(1)
+        except ValueError as e:
+            print(f"\nError: {e}", file=sys.stderr)
+            sys.exit(1)
+    print()
+    if not stats["rows"] and stats["skipped"]:
+        print(f"Already imported ({stats['skipped']} rows), use --restart to import again.")
+    else:
+        print(f"Imported {stats['rows']} rows in {stats['seconds']:.1f} s ({stats['rows_per_second']:.0f} rows/s), "
+              f"{stats['skipped']} were imported before.")
+
+
+if __name__ == "__main__":
+    main()
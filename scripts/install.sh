@@ -28,7 +28,9 @@ apt install -y \
     python3 \
     python3-pip \
     python3-flask \
-    python3-flask-cors
+    python3-flask-cors \
+    python3-numpy \
+    gunicorn
 
 echo "Cloning HASP repository..."
 cd "$HOME_DIR"
@@ -75,7 +77,8 @@ Type=simple
 User=root
 WorkingDirectory=$HOME_DIR/HASP
 ExecStartPre=/bin/sleep 2
-ExecStart=/usr/bin/python3 -u $HOME_DIR/HASP/server.py
+# one worker per core, server.py alone runs the single process development server
+ExecStart=/usr/bin/gunicorn -c $HOME_DIR/HASP/gunicorn.conf.py server:app
 
 Restart=always
 RestartSec=5
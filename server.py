@@ -7,13 +7,16 @@ import pkgutil
 import hashlib
 import logging
 
-from config.config import SSL_CERT_FILE, FLASK_SECRET, VERSION, GIT_URL
+from config.config import HOST, PORT, SSL_CERT_FILE, FLASK_SECRET, VERSION, GIT_URL
+from db.shared import initDB as init_shared_db, checkGenerations, startSharedStateWatcher
 from db.devices import initDB as init_devices_db
 from db.user import initDB as init_user_db
 from db.device_data import initDB as init_device_data_db
 from db.state import initDB as init_state_db
 from db.mqtt import initDB as init_mqtt_db
+from db.retention import startRetentionPurger
 from mqtt.client import startMqtt
+from utilities.leader import startLeaderElection
 
 
 log = logging.getLogger("werkzeug")
@@ -30,6 +33,7 @@ def auto_register(app, package_name):
             module.register(app)
 
 def initialize_databases():
+    init_shared_db() # first, the caches loaded below must see later changes of other processes
     init_devices_db()
     init_user_db()
     init_device_data_db()
@@ -37,8 +41,24 @@ def initialize_databases():
     init_mqtt_db()
 
 
+def start_single_instance_services():
+    """Run by exactly one server process, see utilities/leader.py."""
+    startSharedStateWatcher() # the MQTT client has to see topic changes without http requests
+    startRetentionPurger()
+    startMqtt()
+
+def start_services():
+    """Once per server process: with gunicorn in every worker after the fork (see gunicorn.conf.py)."""
+    startLeaderElection(start_single_instance_services)
+
+
 app = Flask(__name__)
 
+@app.before_request
+def check_shared_state():
+    # reload caches another worker invalidated, costs one PRAGMA when nothing changed
+    checkGenerations()
+
 # Context processor to inject user and version info into all templates
 from flask import session
 @app.context_processor
@@ -68,12 +88,17 @@ auto_register(app, "api")
 auto_register(app, "gui")
 
 if __name__ == "__main__":
+    # Single process development server. For all cores run
+    #   gunicorn -c gunicorn.conf.py server:app
+    # app.run() blocks, so the databases (and the device registry) are loaded first
+    with app.app_context():
+        initialize_databases()
+    start_services()
     app.run(
-        host="0.0.0.0",
-        port=5000,
+        host=HOST,
+        port=PORT,
         ssl_context=(SSL_CERT_FILE, SSL_CERT_FILE),
         debug=False,
+        threaded=True,
         use_reloader=False # Avoid double initialization (linux systemd restarts the process)
     )
-    initialize_databases()
-    startMqtt()
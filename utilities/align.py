@@ -0,0 +1,44 @@
+from typing import Any, Iterable, Iterator, Tuple
+
+ALIGN_MODES = ("exact", "nearest", "asof")
+
+def alignSeries(
+    x_rows: Iterable[Tuple[int, Any]],
+    y_rows: Iterable[Tuple[int, Any]],
+    mode: str = "exact",
+    tolerance: int = 0,
+) -> Iterator[Tuple[int, Any, Any]]:
+    """
+    Pairs two series for an XY plot in one pass over both. x_rows and y_rows are
+    (t, value) sorted by t, t an integer such as nanoseconds. Yields (t, x, y)
+    for every x point that finds a partner, t is the time of the x point.
+        exact:   the y point with the same t
+        nearest: the y point closest to t, at most tolerance away (earlier wins a tie)
+        asof:    the last y point at or before t (last known value),
+                 at most tolerance old, 0 accepts any age
+    """
+    if mode not in ALIGN_MODES:
+        raise ValueError(f"unknown align mode {mode}, use one of {', '.join(ALIGN_MODES)}")
+    if tolerance < 0:
+        raise ValueError("tolerance must be >= 0")
+    y_iter = iter(y_rows)
+    before = None             # last y point with y.t <= t
+    after = next(y_iter, None)  # first y point with y.t > t
+    for t, x in x_rows:
+        while after is not None and after[0] <= t:
+            before = after
+            after = next(y_iter, None)
+        if mode == "exact":
+            if before is not None and before[0] == t:
+                yield t, x, before[1]
+        elif mode == "asof":
+            if before is not None and (not tolerance or t - before[0] <= tolerance):
+                yield t, x, before[1]
+        else:
+            best = None
+            if before is not None and t - before[0] <= tolerance:
+                best = before
+            if after is not None and after[0] - t <= tolerance and (best is None or after[0] - t < t - best[0]):
+                best = after
+            if best is not None:
+                yield t, x, best[1]
@@ -1,16 +1,18 @@
 import subprocess
 
-# Simple global cache
-RESET_DEVICE_CACHE = {}
+from db.shared import setSharedValue, getSharedValue, removeSharedValue
+
+# Kept in the shared database, the reset is requested and picked up by different server processes.
+RESET_DEVICE_KEY = "reset_device_id"
 
 def setResetDevice(device_id):
-    RESET_DEVICE_CACHE['reset_device_id'] = device_id
+    setSharedValue(RESET_DEVICE_KEY, device_id)
 
 def getResetDevice():
-    return RESET_DEVICE_CACHE.get('reset_device_id')
+    return getSharedValue(RESET_DEVICE_KEY)
 
 def clearResetDevice():
-    RESET_DEVICE_CACHE.pop('reset_device_id', None)
+    removeSharedValue(RESET_DEVICE_KEY)
 
 def hasMqttBrokerRunning() -> bool:
     try:
@@ -0,0 +1,97 @@
+import json
+import struct
+import sys
+from array import array
+from itertools import islice
+from typing import Iterable, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # optional, array.array('d') is used instead
+    np = None
+
+# Values per column encoded with one json call in columnar JSON responses.
+JSON_SLICE = 10000
+# Rows converted to arrays at once by batched()/toColumns().
+BATCH_ROWS = 10000
+
+def batched(rows: Iterable[tuple], size: int = BATCH_ROWS):
+    """Groups rows into lists of size rows for toColumns()."""
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+def toColumns(batches: Iterable[Sequence[tuple]], width: int):
+    """
+    Turns batches of rows with width numeric values into width float64 columns,
+    numpy arrays if numpy is installed, array('d') otherwise. No per row Python
+    objects are kept, a column costs 8 bytes per value.
+    """
+    if np is not None:
+        parts = [np.array(batch, dtype=np.float64).reshape(-1, width) for batch in batches]
+        if not parts:
+            return [np.empty(0, dtype=np.float64) for _ in range(width)]
+        table = np.concatenate(parts)
+        return [np.ascontiguousarray(table[:, i]) for i in range(width)]
+    columns = [array("d") for _ in range(width)]
+    for batch in batches:
+        for column, values in zip(columns, zip(*batch)):
+            column.extend(values)
+    return columns
+
+def shift(column, offset: float):
+    if np is not None:
+        return column + offset
+    return array("d", (value + offset for value in column))
+
+def take(column, indices: Sequence[int]):
+    if np is not None:
+        return column[np.asarray(indices, dtype=np.int64)]
+    return array("d", (column[i] for i in indices))
+
+def toBytes(column) -> bytes:
+    """Packed little-endian float64, what a JavaScript Float64Array reads."""
+    if np is not None:
+        return np.asarray(column, dtype="<f8").tobytes()
+    if sys.byteorder == "little":
+        return column.tobytes()
+    swapped = array("d", column)
+    swapped.byteswap()
+    return swapped.tobytes()
+
+def encodeColumnJson(column):
+    """Yields the JSON array of a column in slices, so a long column is not one huge string."""
+    values = column.tolist()
+    yield "["
+    for start in range(0, len(values), JSON_SLICE):
+        if start:
+            yield ","
+        yield json.dumps(values[start:start + JSON_SLICE], separators=(",", ":"))[1:-1]
+    yield "]"
+
+def encodeBinary(series: list[dict]):
+    """
+    Yields the binary layout of a list of series, each a dict with a "columns"
+    dict {name: column} next to its JSON metadata:
+        uint32 LE   length of the header
+        header      UTF-8 JSON list with the metadata of every series plus
+                    "count" and "columns" (the column names in data order),
+                    padded with spaces so the data starts at a multiple of 8
+        data        per series, per column: count float64 LE values
+    """
+    header = []
+    for item in series:
+        columns = item["columns"]
+        meta = {name: value for name, value in item.items() if name != "columns"}
+        meta["count"] = len(next(iter(columns.values()))) if columns else 0
+        meta["columns"] = list(columns)
+        header.append(meta)
+    encoded = json.dumps(header, separators=(",", ":")).encode()
+    encoded += b" " * (-(4 + len(encoded)) % 8)
+    yield struct.pack("<I", len(encoded)) + encoded
+    for item in series:
+        for column in item["columns"].values():
+            yield toBytes(column)
@@ -1,19 +1,23 @@
 from db.device_data import updateDeviceId, removeDeviceData
 from db.state import deleteDeviceState
-from db.mqtt import addTopic, addTopicSchema, getTopicsForDevice, deleteTopic, deleteTopicSchema, deleteTopicSchemaForTopic, deletePayloads, updateDeviceIdForTopics
+from db.mqtt import addTopic, addTopicSchema, getTopicsForDevice, deleteTopic, deleteTopicSchema, deleteTopicSchemaForTopic, deletePayloads, updateDeviceIdForTopics, removePayloadRetentionForDevice
 import db.devices as devices_mod
+from mqtt.routing import refreshTopicRoutes
+
+def _stateTopicNames(topics):
+    return [topic_name for topic_id, topic_name, has_set, has_state in topics if has_state]
 
 def removeMqttForDevice(device_id):
     topics = getTopicsForDevice(device_id)
+    # avoid circular import
+    from mqtt.client import unsubscribeStates
+    unsubscribeStates(device_id, _stateTopicNames(topics))
     for topic_id, topic_name, has_set, has_state in topics:
-        if has_state:
-            # avoid circular import
-            from mqtt.client import unsubscribeState
-            unsubscribeState(device_id, topic_name)
         deleteTopicSchemaForTopic(topic_id)
         deleteTopicSchema(topic_id)
         deleteTopic(topic_id)
         deletePayloads(topic_id)
+    refreshTopicRoutes(device_id)
 
 
 def deleteDevice(device_id):
@@ -21,6 +25,7 @@ def deleteDevice(device_id):
     devices_mod.removeDevice(device_id)
     deleteDeviceState(device_id)
     removeDeviceData(device_id)
+    removePayloadRetentionForDevice(device_id)
 
 
 def storeMqttInfo(device_id, mqtt_offers):
@@ -47,7 +52,16 @@ def storeMqttInfo(device_id, mqtt_offers):
     4. subscribe to state offers
     """
     removeMqttForDevice(device_id)
-
+    try:
+        return _addMqttOffers(device_id, mqtt_offers)
+    finally:
+        refreshTopicRoutes(device_id)
+        # avoid circular import
+        from mqtt.client import subscribeStates
+        # the topics added before an invalid offer stay, all of them in one request
+        subscribeStates(device_id, _stateTopicNames(getTopicsForDevice(device_id)))
+
+def _addMqttOffers(device_id, mqtt_offers):
     for offer in mqtt_offers:
         topic_name = offer.get("topic")
         endpoints = offer.get("endpoints")
@@ -83,10 +97,6 @@ def storeMqttInfo(device_id, mqtt_offers):
                 max_value=max_value,
                 enum_values=str(enum_values) if enum_values else None
             )
-        if has_state:
-            # avoid circular import
-            from mqtt.client import unsubscribeState
-            unsubscribeState(device_id, topic_name)
 
     return None
 
@@ -120,22 +130,17 @@ def addDevice(device_id, name, info, device, offers):
 
 def mergeDeviceId(merge_id, device_id):
     topics = getTopicsForDevice(merge_id)
-    for topic_id, topic_name, has_set, has_state in topics:
-        if has_state:
-            # avoid circular import
-            from mqtt.client import unsubscribeState
-            unsubscribeState(device_id, topic_name)
+    # avoid circular import
+    from mqtt.client import subscribeStates, unsubscribeStates
+    unsubscribeStates(merge_id, _stateTopicNames(topics))
 
     updateDeviceIdForTopics(old_device_id = merge_id, new_device_id = device_id)
 
     updateDeviceId(old_id = merge_id, new_id = device_id)
     deleteDevice(merge_id)
 
-    for topic_id, topic_name, has_set, has_state in topics:
-        if has_state:
-            # avoid circular import
-            from mqtt.client import subscribeState
-            subscribeState(device_id, topic_name)
+    subscribeStates(device_id, _stateTopicNames(topics))
+    refreshTopicRoutes(device_id)
 
 def updateDevice(device_id, info, offer):
     current_device_data = devices_mod.getDevice(device_id)
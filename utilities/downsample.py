@@ -0,0 +1,102 @@
+from typing import Sequence
+
+try:
+    import numpy as np
+except ImportError:  # optional, the pure Python versions below are used instead
+    np = None
+
+DOWNSAMPLE_METHODS = ("lttb", "minmax")
+
+def downsample(t: Sequence[float], v: Sequence[float], max_points: int, method: str = "lttb") -> list[int]:
+    """
+    Returns the indices (ascending) of at most max_points points of the line
+    (t, v) to draw instead of all of them. t must be sorted.
+    lttb:   Largest-Triangle-Three-Buckets, keeps the visual shape of the line.
+    minmax: the smallest and largest value of every bucket, keeps spikes.
+    """
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"unknown downsample method {method}, use one of {', '.join(DOWNSAMPLE_METHODS)}")
+    size = len(t)
+    if size <= max_points:
+        return list(range(size))
+    if max_points < 3:
+        return [0, size - 1][:max_points]
+    if method == "minmax":
+        return _minMaxNumpy(v, max_points) if np is not None else _minMax(v, max_points)
+    return _lttbNumpy(t, v, max_points) if np is not None else _lttb(t, v, max_points)
+
+def _lttbEdges(size, max_points):
+    # first and last point are always kept, the points in between are split
+    # into max_points - 2 buckets: bucket i is [edges[i], edges[i + 1])
+    return [1 + i * (size - 2) // (max_points - 2) for i in range(max_points - 1)]
+
+def _lttb(t, v, max_points):
+    size = len(t)
+    edges = _lttbEdges(size, max_points)
+    selected = [0]
+    a = 0
+    for i in range(max_points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_lo, next_hi = hi, edges[i + 2]
+            next_t = sum(t[next_lo:next_hi]) / (next_hi - next_lo)
+            next_v = sum(v[next_lo:next_hi]) / (next_hi - next_lo)
+        else:
+            next_t, next_v = t[size - 1], v[size - 1]
+        best = lo
+        best_area = -1.0
+        for j in range(lo, hi):
+            area = abs((t[a] - next_t) * (v[j] - v[a]) - (t[a] - t[j]) * (next_v - v[a]))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+    selected.append(size - 1)
+    return selected
+
+def _lttbNumpy(t, v, max_points):
+    t = np.asarray(t, dtype=np.float64)
+    v = np.asarray(v, dtype=np.float64)
+    size = len(t)
+    edges = np.asarray(_lttbEdges(size, max_points), dtype=np.int64)
+    counts = np.diff(edges)
+    # average point of every bucket, the last bucket looks ahead to the last point
+    next_t = np.append((np.add.reduceat(t[:-1], edges[:-1]) / counts)[1:], t[-1])
+    next_v = np.append((np.add.reduceat(v[:-1], edges[:-1]) / counts)[1:], v[-1])
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = size - 1
+    a = 0
+    # each bucket depends on the point chosen in the previous one, so only the
+    # work inside a bucket is vectorized
+    for i in range(max_points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((t[a] - next_t[i]) * (v[lo:hi] - v[a]) - (t[a] - t[lo:hi]) * (next_v[i] - v[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected.tolist()
+
+def _minMaxEdges(size, max_points):
+    # max_points // 2 buckets of (nearly) equal size, bucket i is [edges[i], edges[i + 1])
+    buckets = max_points // 2
+    return [-(-i * size // buckets) for i in range(buckets + 1)]
+
+def _minMax(v, max_points):
+    edges = _minMaxEdges(len(v), max_points)
+    selected = []
+    for lo, hi in zip(edges, edges[1:]):
+        low = min(range(lo, hi), key=v.__getitem__)
+        high = max(range(lo, hi), key=v.__getitem__)
+        selected.extend(sorted({low, high}))
+    return selected
+
+def _minMaxNumpy(v, max_points):
+    v = np.asarray(v, dtype=np.float64)
+    edges = _minMaxEdges(len(v), max_points)
+    selected = []
+    for lo, hi in zip(edges, edges[1:]):
+        bucket = v[lo:hi]
+        low = lo + int(np.argmin(bucket))
+        high = lo + int(np.argmax(bucket))
+        selected.extend(sorted({low, high}))
+    return selected
@@ -0,0 +1,104 @@
+import csv
+import io
+from typing import Iterable, Sequence, Tuple
+
+from utilities.stream import encodeNdjson
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional, only needed for parquet exports
+    pa = pq = None
+
+EXPORT_FORMATS = ("csv", "ndjson", "parquet")
+EXPORT_MIMETYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+# Rows per parquet row group, a row group is the unit parquet readers load at once.
+PARQUET_ROW_GROUP_ROWS = 65536
+
+def exportRows(columns: Sequence[Tuple[str, str]], batches: Iterable[list], export_format: str):
+    """
+    Yields the encoding of batches of rows in export_format, one str piece per
+    batch for csv and ndjson, bytes per row group for parquet. columns is
+    ((name, type), ...) with the types "str", "int", "float" or "any"
+    (parquet stores "any" as text).
+    Raises ValueError for an unknown format or parquet without pyarrow.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"unknown format {export_format}, use one of {', '.join(EXPORT_FORMATS)}")
+    if export_format == "parquet" and pa is None:
+        raise ValueError("parquet export needs pyarrow, install it or use csv/ndjson")
+    names = [name for name, _ in columns]
+    if export_format == "csv":
+        return _encodeCsv(names, batches)
+    if export_format == "ndjson":
+        return ("".join(encodeNdjson(dict(zip(names, row)) for row in batch)) for batch in batches)
+    return _encodeParquet(columns, batches)
+
+def _encodeCsv(names, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(names)
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+class _Drain:
+    """Write-only file for ParquetWriter, the written bytes are taken out after every row group."""
+    closed = False
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+def _encodeParquet(columns, batches):
+    types = {"str": pa.string(), "int": pa.int64(), "float": pa.float64(), "any": pa.string()}
+    schema = pa.schema([(name, types[kind]) for name, kind in columns])
+    as_text = [kind == "any" for _, kind in columns]
+    sink = _Drain()
+    writer = pq.ParquetWriter(sink, schema)
+    pending = []
+
+    def writeGroup():
+        values = list(zip(*pending))
+        arrays = [
+            pa.array([None if value is None else str(value) for value in column] if text else column, type=field.type)
+            for column, text, field in zip(values, as_text, schema)
+        ]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema), row_group_size=len(pending))
+        pending.clear()
+
+    for batch in batches:
+        pending.extend(batch)
+        if len(pending) >= PARQUET_ROW_GROUP_ROWS:
+            writeGroup()
+            yield sink.take()
+    if pending:
+        writeGroup()
+    writer.close()
+    yield sink.take()
@@ -0,0 +1,129 @@
+import csv
+import json
+from datetime import datetime
+from itertools import islice
+from typing import Optional, TextIO
+
+IMPORT_FORMATS = ("csv", "ndjson")
+# Lines parsed and type classified at once.
+PARSE_CHUNK_ROWS = 10000
+
+_BOOLS = {"true": True, "false": False}
+
+def classifyValues(values: list[str]) -> list:
+    """
+    Turns the text values of one series into int, float, bool or str. The whole
+    list is converted at once while it is all ints, floats or booleans (the usual
+    case for sensor data), only mixed lists are classified value by value.
+    """
+    try:
+        return [int(value) for value in values]
+    except ValueError:
+        pass
+    try:
+        return [float(value) for value in values]
+    except ValueError:
+        pass
+    try:
+        return [_BOOLS[value.strip().lower()] for value in values]
+    except KeyError:
+        pass
+    return [_classifyValue(value) for value in values]
+
+def _classifyValue(value):
+    for convert in (int, float):
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    return _BOOLS.get(value.strip().lower(), value)
+
+def parseTimestamps(ts_sec: list, ts_nsec: Optional[list] = None, ts: Optional[list] = None):
+    """
+    Returns the ts_sec and ts_nsec columns of a chunk, from ts_sec (and ts_nsec) like
+    the exports, or from ts as seconds ("1700000000.25") or ISO time ("2024-01-31T12:00:00+00:00").
+    Whole columns are converted at once, only ISO times are parsed value by value.
+    """
+    if ts_sec is not None:
+        return [int(value) for value in ts_sec], [int(value or 0) for value in ts_nsec] if ts_nsec else [0] * len(ts_sec)
+    if ts is None:
+        raise ValueError("records need ts_sec or ts")
+    try:
+        return [int(value) for value in ts], [0] * len(ts)
+    except (TypeError, ValueError):
+        pass
+    seconds = []
+    nanoseconds = []
+    for value in ts:
+        sec, nsec = _parseTimestamp(value)
+        seconds.append(sec)
+        nanoseconds.append(nsec)
+    return seconds, nanoseconds
+
+def _parseTimestamp(value):
+    if isinstance(value, (int, float)):
+        value = repr(value)
+    whole, _, fraction = value.partition(".")
+    try:
+        return int(whole), int((fraction + "000000000")[:9]) if fraction else 0
+    except ValueError:
+        moment = datetime.fromisoformat(value)
+        return int(moment.timestamp()), moment.microsecond * 1000
+
+def readRows(
+    file: TextIO,
+    import_format: str,
+    device_id: Optional[str] = None,
+    key: Optional[str] = None,
+):
+    """
+    Yields (device_id, ts_sec, ts_nsec, key, value, report_id) rows for
+    importMeasurements() from CSV with a header line or from NDJSON, both with the
+    columns of the exports (device_id, key, ts_sec, ts_nsec, value, report_id) or ts
+    instead of ts_sec/ts_nsec. device_id and key are the defaults for records without them.
+    Every chunk of PARSE_CHUNK_ROWS records is converted column by column,
+    CSV values are type classified per series (see classifyValues()).
+    """
+    if import_format not in IMPORT_FORMATS:
+        raise ValueError(f"unknown format {import_format}, use one of {', '.join(IMPORT_FORMATS)}")
+    if import_format == "csv":
+        reader = csv.reader(file)
+        header = next(reader, None)
+        if header is None:
+            return
+        chunks = iter(lambda: list(islice(reader, PARSE_CHUNK_ROWS)), [])
+    else:
+        header = None
+        records = (json.loads(line) for line in file if line.strip())
+        chunks = iter(lambda: list(islice(records, PARSE_CHUNK_ROWS)), [])
+
+    for chunk in chunks:
+        if header is not None:
+            for index, row in enumerate(chunk):
+                if len(row) != len(header):
+                    line = reader.line_num - len(chunk) + index + 1
+                    raise ValueError(f"line {line}: {len(row)} fields, the header has {len(header)}")
+            columns = dict(zip(header, map(list, zip(*chunk))))
+        else:
+            names = {name for record in chunk for name in record}
+            columns = {name: [record.get(name) for record in chunk] for name in names}
+        size = len(chunk)
+        if "value" not in columns:
+            raise ValueError("records need a value")
+        ts_sec, ts_nsec = parseTimestamps(columns.get("ts_sec"), columns.get("ts_nsec"), columns.get("ts"))
+        device_ids = [value or device_id for value in columns.get("device_id", [None] * size)]
+        keys = [value or key for value in columns.get("key", [None] * size)]
+        if None in device_ids or None in keys:
+            raise ValueError("record without device_id or key and no default given")
+        values = columns["value"]
+        if header is not None:
+            series = {}
+            for index, pair in enumerate(zip(device_ids, keys)):
+                series.setdefault(pair, []).append(index)
+            for indices in series.values():
+                for index, value in zip(indices, classifyValues([values[index] for index in indices])):
+                    values[index] = value
+        else:
+            values = [json.dumps(value) if isinstance(value, (dict, list)) else value for value in values]
+        report_ids = [value or None for value in columns.get("report_id", [None] * size)]
+        yield from zip(device_ids, ts_sec, ts_nsec, keys, values, report_ids)
@@ -0,0 +1,76 @@
+import fcntl
+import os
+import threading
+import time
+from pathlib import Path
+
+# Held with an exclusive flock by the server process that runs the MQTT client and the retention purger.
+LEADER_LOCK_FILE = Path(__file__).resolve().parents[1] / "db" / "leader.lock"
+# Seconds until the leader calls on_elected again after it failed (e.g. the MQTT broker is not up yet).
+LEADER_RETRY_INTERVAL = 10.0
+
+class LeaderElection:
+    """
+    Picks one of the server processes (e.g. the gunicorn workers) to run the
+    services that must exist exactly once. Every process waits for an exclusive
+    flock on the lock file in a background thread; the holder runs on_elected.
+    When it exits or dies the kernel releases the lock and a waiting process takes over.
+    """
+    def __init__(self, lock_file):
+        self.lock_file = lock_file
+        self._fd = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self.leader = False
+        self.elected_at = None
+
+    def start(self, on_elected):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, args=(on_elected,), name="leader-election", daemon=True)
+                self._thread.start()
+
+    def _run(self, on_elected):
+        fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)  # blocks until the current leader is gone
+        self._fd = fd
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}\n".encode())
+        self.leader = True
+        self.elected_at = int(time.time())
+        print(f"Process {os.getpid()} runs the single-instance services")
+        while True:
+            try:
+                on_elected()
+                return
+            except Exception as e:
+                print(f"Failed to start the single-instance services, retrying in {LEADER_RETRY_INTERVAL}s: {e}")
+            time.sleep(LEADER_RETRY_INTERVAL)
+
+    def stats(self):
+        return {"pid": os.getpid(), "leader": self.leader, "elected_at": self.elected_at}
+
+    def _resetAfterFork(self):
+        # a child must not share the parent's lock
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self.leader = False
+        self.elected_at = None
+
+_ELECTION = LeaderElection(LEADER_LOCK_FILE)
+
+def startLeaderElection(on_elected):
+    """Calls on_elected in a background thread once this process holds the leader lock."""
+    _ELECTION.start(on_elected)
+
+def isLeader() -> bool:
+    return _ELECTION.leader
+
+def getLeaderStats():
+    return _ELECTION.stats()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_ELECTION._resetAfterFork)
@@ -0,0 +1,77 @@
+import json
+from flask import Response, stream_with_context
+
+# Encoded output is sent to the client in pieces of about this many bytes.
+STREAM_CHUNK_BYTES = 64 * 1024
+
+# compact like jsonify, created once because json.dumps(..., separators=...) builds a new encoder per call
+_ENCODE = json.JSONEncoder(separators=(",", ":")).encode
+
+class RawJson:
+    """Wraps pieces of already encoded JSON, encodeJson() passes them through unchanged."""
+    def __init__(self, pieces):
+        self.pieces = pieces
+
+def encodeJson(value):
+    """
+    Yields the JSON encoding of value piece by piece. Generators and other
+    iterators inside value are encoded as arrays while they are consumed,
+    so a response with millions of points never exists in memory at once.
+    """
+    if isinstance(value, RawJson):
+        yield from value.pieces
+    elif isinstance(value, dict):
+        if all(map(_isScalar, value.values())):
+            yield _ENCODE(value)  # e.g. one point, encoded in one call
+            return
+        yield "{"
+        first = True
+        for key, item in value.items():
+            if not first:
+                yield ","
+            first = False
+            yield _ENCODE(str(key)) + ":"
+            yield from encodeJson(item)
+        yield "}"
+    elif not isinstance(value, (str, bytes)) and hasattr(value, "__iter__"):
+        yield "["
+        first = True
+        for item in value:
+            if not first:
+                yield ","
+            first = False
+            yield from encodeJson(item)
+        yield "]"
+    else:
+        yield _ENCODE(value)
+
+def _isScalar(value):
+    if isinstance(value, (dict, RawJson)):
+        return False
+    return isinstance(value, (str, bytes)) or not hasattr(value, "__iter__")
+
+def encodeNdjson(values):
+    """Yields one JSON document per line for every element of values."""
+    for value in values:
+        yield _ENCODE(value) + "\n"
+
+def _chunked(pieces):
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= STREAM_CHUNK_BYTES:
+            yield "".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer)
+
+def streamJson(value):
+    """Streamed response with the same body jsonify(value) would return (keys unsorted)."""
+    return Response(stream_with_context(_chunked(encodeJson(value))), mimetype="application/json")
+
+def streamNdjson(values):
+    """Streamed newline delimited JSON response, one line per element of values."""
+    return Response(stream_with_context(_chunked(encodeNdjson(values))), mimetype="application/x-ndjson")